@@ -0,0 +1,210 @@
+import random
+import uuid
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+
+import pytest
+from ckan import model
+from ckan.tests.helpers import reset_db
+
+from ckanext.feedback.command import migration
+from ckanext.feedback.command.feedback import (
+    create_download_tables,
+    create_resource_tables,
+    create_utilization_tables,
+)
+from ckanext.feedback.models.resource_comment import ResourceCommentCategory
+from ckanext.feedback.models.session import session
+from ckanext.feedback.models.utilization import UtilizationCommentCategory
+from ckanext.feedback.services.management import importer
+
+Seed = namedtuple('Seed', ['package_ids', 'resource_ids', 'utilization_ids'])
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup('feedback benchmarks')
+    group.addoption(
+        '--bench-packages',
+        type=int,
+        default=200,
+        help='the number of datasets to seed',
+    )
+    group.addoption(
+        '--bench-resources',
+        type=int,
+        default=5,
+        help='the number of resources to seed per dataset',
+    )
+    group.addoption(
+        '--bench-comments',
+        type=int,
+        default=20,
+        help='the number of comments to seed per resource',
+    )
+    group.addoption(
+        '--bench-utilizations',
+        type=int,
+        default=2,
+        help='the number of utilizations to seed per resource',
+    )
+    group.addoption(
+        '--bench-download-days',
+        type=int,
+        default=30,
+        help='the number of days of daily downloads to seed per resource',
+    )
+    group.addoption(
+        '--bench-threads',
+        type=int,
+        default=8,
+        help='the number of threads counting downloads at the same time',
+    )
+
+
+def seed_packages(rng, packages, resources):
+    package_rows = []
+    resource_rows = []
+    for i in range(packages):
+        package_id = str(uuid.uuid4())
+        package_rows.append(
+            {
+                'id': package_id,
+                'name': f'bench-dataset-{i:06d}',
+                'title': f'Benchmark dataset {i}',
+                'type': 'dataset',
+                'state': 'active',
+                'private': False,
+            }
+        )
+        for position in range(resources):
+            resource_rows.append(
+                {
+                    'id': str(uuid.uuid4()),
+                    'package_id': package_id,
+                    'name': f'bench resource {i} keyword{rng.randrange(10)}',
+                    'url': f'http://example.com/{i}/{position}.csv',
+                    'position': position,
+                    'state': 'active',
+                }
+            )
+    model.Session.execute(model.package_table.insert(), package_rows)
+    model.Session.execute(model.resource_table.insert(), resource_rows)
+    model.Session.commit()
+    return (
+        [row['id'] for row in package_rows],
+        [row['id'] for row in resource_rows],
+    )
+
+
+def get_created(rng):
+    return datetime.now() - timedelta(seconds=rng.randrange(365 * 24 * 60 * 60))
+
+
+def import_records(name, records):
+    importer.import_records(name, enumerate(records, start=1))
+    session.commit()
+
+
+def seed_feedback(rng, resource_ids, comments, utilizations, download_days):
+    import_records(
+        'resource_comment',
+        (
+            {
+                'resource_id': resource_id,
+                'category': rng.choice(list(ResourceCommentCategory)).name,
+                'content': f'comment {i}',
+                'rating': rng.randint(1, 5),
+                'created': get_created(rng),
+                'approval': rng.random() < 0.8,
+            }
+            for resource_id in resource_ids
+            for i in range(comments)
+        ),
+    )
+
+    utilization_records = [
+        {
+            'id': str(uuid.uuid4()),
+            'resource_id': resource_id,
+            'title': f'utilization {i} keyword{rng.randrange(10)}',
+            'description': f'description {i}',
+            'created': get_created(rng),
+            'approval': rng.random() < 0.8,
+        }
+        for resource_id in resource_ids
+        for i in range(utilizations)
+    ]
+    import_records('utilization', utilization_records)
+    utilization_ids = [record['id'] for record in utilization_records]
+    import_records(
+        'utilization_comment',
+        (
+            {
+                'utilization_id': utilization_id,
+                'category': rng.choice(list(UtilizationCommentCategory)).name,
+                'content': f'comment {i}',
+                'created': get_created(rng),
+                'approval': rng.random() < 0.8,
+            }
+            for utilization_id in utilization_ids
+            for i in range(comments // 4)
+        ),
+    )
+    import_records(
+        'issue_resolution',
+        (
+            {'utilization_id': utilization_id, 'description': 'resolved'}
+            for utilization_id in utilization_ids[::2]
+        ),
+    )
+
+    today = date.today()
+    import_records(
+        'download',
+        (
+            {
+                'resource_id': resource_id,
+                'date': today - timedelta(days=days),
+                'download': rng.randint(0, 50),
+            }
+            for resource_id in resource_ids
+            for days in range(download_days)
+        ),
+    )
+    return utilization_ids
+
+
+# Seed the database once for all benchmarks
+# The data is generated from a fixed seed, so every run times the same data
+@pytest.fixture(scope='session')
+def seed(request):
+    option = request.config.getoption
+    reset_db()
+    engine = model.repo.session.get_bind()
+    create_utilization_tables(engine)
+    create_resource_tables(engine)
+    create_download_tables(engine)
+    initialized = ['utilization', 'resource', 'download', 'package']
+    if migration.create_search_indexes(engine):
+        initialized.append('search')
+    migration.stamp_initialized(engine, initialized)
+
+    rng = random.Random(0)
+    package_ids, resource_ids = seed_packages(
+        rng, option('--bench-packages'), option('--bench-resources')
+    )
+    utilization_ids = seed_feedback(
+        rng,
+        resource_ids,
+        option('--bench-comments'),
+        option('--bench-utilizations'),
+        option('--bench-download-days'),
+    )
+    with engine.connect() as connection:
+        connection.execute('ANALYZE')
+    return Seed(package_ids, resource_ids, utilization_ids)
+
+
+@pytest.fixture(scope='session')
+def threads(request):
+    return request.config.getoption('--bench-threads')
@@ -0,0 +1,41 @@
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from ckanext.feedback.models.session import session
+from ckanext.feedback.services.download import summary as download_summary_service
+
+# The number of downloads counted in a round
+DOWNLOADS = 200
+
+
+def download(resource_id):
+    try:
+        download_summary_service.increment_resource_downloads(resource_id)
+    finally:
+        session.remove()
+
+
+def download_concurrently(executor, resource_ids):
+    list(executor.map(download, resource_ids))
+
+
+# spread: downloads of random resources
+# hotspot: downloads of a few popular resources, contending for their rows
+@pytest.mark.parametrize('distribution', ['spread', 'hotspot'])
+def test_increment_resource_downloads(benchmark, seed, threads, distribution):
+    rng = random.Random(0)
+    if distribution == 'spread':
+        targets = seed.resource_ids
+    else:
+        targets = seed.resource_ids[:5]
+    resource_ids = [rng.choice(targets) for _ in range(DOWNLOADS)]
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        benchmark.pedantic(
+            download_concurrently,
+            args=(executor, resource_ids),
+            rounds=10,
+            warmup_rounds=1,
+        )
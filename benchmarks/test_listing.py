@@ -0,0 +1,20 @@
+from ckanext.feedback.services.common import stats as stats_service
+
+# The dataset search page lists 20 datasets per page
+PAGE_SIZE = 20
+
+
+def test_get_packages_feedback_stats(benchmark, seed):
+    package_ids = seed.package_ids[:PAGE_SIZE]
+
+    stats = benchmark(stats_service.get_packages_feedback_stats, package_ids)
+
+    assert list(stats) == package_ids
+
+
+def test_get_resources_feedback_stats(benchmark, seed):
+    resource_ids = seed.resource_ids[:PAGE_SIZE]
+
+    stats = benchmark(stats_service.get_resources_feedback_stats, resource_ids)
+
+    assert list(stats) == resource_ids
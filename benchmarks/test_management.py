@@ -0,0 +1,102 @@
+from sqlalchemy import func
+
+from ckanext.feedback.models.resource_comment import ResourceComment
+from ckanext.feedback.models.session import session
+from ckanext.feedback.services.management import comments as comments_service
+
+# The number of comments on a page of the management screen
+PAGE_SIZE = 50
+
+# The number of comments approved at once with the checkboxes
+BULK_SIZE = 100
+
+
+# Get what the management screen shows, as ManagementController.comments does
+def get_comments_page():
+    return (
+        comments_service.get_utilization_comments_page(PAGE_SIZE),
+        comments_service.get_resource_comments_page(PAGE_SIZE),
+        comments_service.count_utilization_comments(),
+        comments_service.count_resource_comments(),
+    )
+
+
+def test_comments_page(benchmark, seed):
+    utilization_page, resource_page, _, _ = benchmark(get_comments_page)
+
+    assert len(utilization_page.comments) == PAGE_SIZE
+    assert len(resource_page.comments) == PAGE_SIZE
+
+
+def test_comments_page_filtered(benchmark, seed):
+    resource_page = benchmark(
+        comments_service.get_resource_comments_page,
+        PAGE_SIZE,
+        approval=False,
+        package_id=seed.package_ids[0],
+    )
+
+    assert resource_page.comments
+
+
+# Put the comments back to waiting for approval before each round
+def reset_approval(comment_ids):
+    (
+        session.query(ResourceComment)
+        .filter(ResourceComment.id.in_(comment_ids))
+        .update({'approval': False}, synchronize_session=False)
+    )
+    session.commit()
+
+
+def get_comment_ids(count):
+    return [
+        row.id
+        for row in session.query(ResourceComment.id)
+        .order_by(func.md5(ResourceComment.id))
+        .limit(count)
+    ]
+
+
+# Approve the checked comments, as ManagementController.approve_bulk_resource_comments
+# does
+def approve_bulk_resource_comments(comment_ids):
+    comments_service.approve_resource_comments(comment_ids, None)
+    session.commit()
+
+
+def test_approve_bulk_resource_comments(benchmark, seed):
+    comment_ids = get_comment_ids(BULK_SIZE)
+
+    benchmark.pedantic(
+        approve_bulk_resource_comments,
+        args=(comment_ids,),
+        setup=lambda: reset_approval(comment_ids),
+        rounds=10,
+    )
+
+
+# Approve all comments of a dataset matching the filter in batches, as
+# ManagementController.approve_matching_resource_comments does
+def approve_matching_resource_comments(package_id):
+    for _ in comments_service.approve_matching_resource_comments(
+        None, 1000, package_id=package_id
+    ):
+        session.commit()
+
+
+def test_approve_matching_resource_comments(benchmark, seed):
+    package_id = seed.package_ids[0]
+    comment_ids = [
+        comment.id
+        for comment in comments_service.get_resource_comments_query(
+            package_id=package_id
+        )
+    ]
+
+    benchmark.pedantic(
+        approve_matching_resource_comments,
+        args=(package_id,),
+        setup=lambda: reset_approval(comment_ids),
+        rounds=10,
+    )
@@ -0,0 +1,32 @@
+import pytest
+
+from ckanext.feedback.services.utilization import search as search_service
+
+# The utilization search page lists 20 utilizations per page
+PAGE_SIZE = 20
+
+
+@pytest.mark.parametrize('keyword', [None, 'keyword3', 'bench-dataset-0001'])
+def test_get_utilizations(benchmark, seed, keyword):
+    utilizations = benchmark(
+        search_service.get_utilizations,
+        keyword=keyword,
+        approval=True,
+        limit=PAGE_SIZE,
+        offset=PAGE_SIZE,
+    )
+
+    assert len(utilizations) <= PAGE_SIZE
+
+
+@pytest.mark.parametrize('keyword', [None, 'keyword3'])
+def test_get_utilizations_count(benchmark, seed, keyword):
+    # Time the counting itself, not the cached count
+    count = benchmark.pedantic(
+        search_service.get_utilizations_count,
+        kwargs={'keyword': keyword, 'approval': True},
+        setup=search_service.clear_utilizations_count_cache,
+        rounds=20,
+    )
+
+    assert count > 0
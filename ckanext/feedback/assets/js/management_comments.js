@@ -12,7 +12,7 @@ function changeAllChekbox(e) {
   } else if (e.target.id === 'resource-comments-checkbox-all') {
     rows = document.querySelectorAll('#resource-comments-table tbody tr');
   }
-  Array.from(rows).filter(isVisible).forEach(row => {
+  Array.from(rows).forEach(row => {
     row.querySelector('input[type="checkbox"]').checked = e.target.checked;
   });
 }
@@ -25,36 +25,22 @@ function runBulkAction(action) {
 }
 
 
-function refreshTable() {
-  const tabs = document.querySelectorAll('input[name="tab-menu"]');
-  const activeTabName = Array.from(tabs).find(tab => tab.checked).value;
-  const rows = document.querySelectorAll(`#${activeTabName}-table tbody tr`);
-  let count = 0;
-
-  rows.forEach(row => {
-    if (isVisible(row)) {
-      row.style.display = 'table-row';
-      ++count;
-    } else {
-      row.style.display = 'none';
-      row.querySelector('input[type="checkbox"]').checked = false;
-    }
-  });
-  document.getElementById(`${activeTabName}-results-count`).innerText = count;
-
-  const visibleRows = Array.from(document.querySelectorAll(`#${activeTabName}-table tbody tr`)).filter(isVisible);
-  const bulkCheckbox = document.getElementById(`${activeTabName}-checkbox-all`);
-  bulkCheckbox.checked = visibleRows.every(row => row.querySelector('input[type="checkbox"]').checked) && visibleRows.length;
+// Apply the action to every comment matching the filter applied to the list,
+// not only the checked ones
+function runMatchingAction(action, confirmId) {
+  const message = document.getElementById(confirmId).value;
+  if (!window.confirm(message)) {
+    return;
+  }
+  const form = document.getElementById('matching-form');
+  form.setAttribute("action", action);
+  form.submit();
 }
 
 
-function isVisible(row){
-  const statusCell = row.getElementsByTagName('td')[7];
-  const isWaiting = document.getElementById('waiting').checked && statusCell.dataset.waiting;
-  const isApproval = document.getElementById('approval').checked && statusCell.dataset.approval;
-  const categoryCell = row.getElementsByTagName('td')[5];
-  const categories = Array.from(document.querySelectorAll('.category-checkbox'));
-  const isMatchedCategory = categories.filter(element => element.checked)
-                                      .some(element => element.getAttribute('name') === categoryCell.dataset.category);
-  return (isWaiting || isApproval) && (isMatchedCategory || !categoryCell.dataset.category);
+// The comments are filtered on the server, so keep the active tab when filtering
+function changeTab() {
+  const tabs = document.querySelectorAll('input[name="tab-menu"]');
+  const activeTabName = Array.from(tabs).find(tab => tab.checked).value;
+  document.getElementById('filter-tab').value = activeTabName;
 }
@@ -1,21 +1,36 @@
+import datetime
+import signal
 import sys
+import time
 
 import click
 from ckan.plugins import toolkit
 from sqlalchemy import create_engine
 
-from ckanext.feedback.models.download import DownloadSummary
+from ckanext.feedback.command import migration
+from ckanext.feedback.models.download import (
+    DownloadDaily,
+    DownloadMonthly,
+    DownloadSummary,
+)
 from ckanext.feedback.models.issue import IssueResolution, IssueResolutionSummary
+from ckanext.feedback.models.package import PackageFeedbackSummary
 from ckanext.feedback.models.resource_comment import (
     ResourceComment,
     ResourceCommentReply,
     ResourceCommentSummary,
 )
+from ckanext.feedback.models.session import session
 from ckanext.feedback.models.utilization import (
     Utilization,
     UtilizationComment,
     UtilizationSummary,
 )
+from ckanext.feedback.services.download import queue as download_queue_service
+from ckanext.feedback.services.download import summary as download_summary_service
+from ckanext.feedback.services.management import export as export_service
+from ckanext.feedback.services.management import importer as import_service
+from ckanext.feedback.services.management import summaries as summaries_service
 
 
 @click.group()
@@ -33,79 +48,130 @@ def get_engine(host, port, dbname, user, password):
         return engine
 
 
+# Add the option to select the modules to the command
+def modules_option(func):
+    return click.option(
+        '-m',
+        '--modules',
+        multiple=True,
+        type=click.Choice(['utilization', 'resource', 'download']),
+        help='specify the module you want to use from utilization, resource, download',
+    )(func)
+
+
+# Add the options to connect postgresql to the command
+def database_options(func):
+    options = [
+        click.option(
+            '-h',
+            '--host',
+            envvar='POSTGRES_HOST',
+            default='db',
+            help='specify the host name of postgresql',
+        ),
+        click.option(
+            '-p',
+            '--port',
+            envvar='POSTGRES_PORT',
+            default=5432,
+            help='specify the port number of postgresql',
+        ),
+        click.option(
+            '-d',
+            '--dbname',
+            envvar='POSTGRES_DB',
+            default='ckan',
+            help='specify the name of postgresql',
+        ),
+        click.option(
+            '-u',
+            '--user',
+            envvar='POSTGRES_USER',
+            default='ckan',
+            help='specify the user name of postgresql',
+        ),
+        click.option(
+            '-P',
+            '--password',
+            envvar='POSTGRES_PASSWORD',
+            default='ckan',
+            help='specify the password to connect postgresql',
+        ),
+    ]
+    for option in reversed(options):
+        func = option(func)
+    return func
+
+
 @feedback.command(
     name='init', short_help='create tables in ckan db to activate modules.'
 )
-@click.option(
-    '-m',
-    '--modules',
-    multiple=True,
-    type=click.Choice(['utilization', 'resource', 'download']),
-    help='specify the module you want to use from utilization, resource, download',
-)
-@click.option(
-    '-h',
-    '--host',
-    envvar='POSTGRES_HOST',
-    default='db',
-    help='specify the host name of postgresql',
-)
-@click.option(
-    '-p',
-    '--port',
-    envvar='POSTGRES_PORT',
-    default=5432,
-    help='specify the port number of postgresql',
-)
-@click.option(
-    '-d',
-    '--dbname',
-    envvar='POSTGRES_DB',
-    default='ckan',
-    help='specify the name of postgresql',
-)
-@click.option(
-    '-u',
-    '--user',
-    envvar='POSTGRES_USER',
-    default='ckan',
-    help='specify the user name of postgresql',
-)
-@click.option(
-    '-P',
-    '--password',
-    envvar='POSTGRES_PASSWORD',
-    default='ckan',
-    help='specify the password to connect postgresql',
-)
+@modules_option
+@database_options
 def init(modules, host, port, dbname, user, password):
     engine = get_engine(host, port, dbname, user, password)
     try:
+        # The modules and search indexes created with the latest schema
+        initialized = []
         if 'utilization' in modules:
             drop_utilization_tables(engine)
             create_utilization_tables(engine)
+            initialized.append('utilization')
+            if migration.create_search_indexes(engine):
+                initialized.append('search')
             click.secho('Initialize utilization: SUCCESS', fg='green', bold=True)
         elif 'resource' in modules:
             drop_resource_tables(engine)
             create_resource_tables(engine)
+            initialized.append('resource')
             click.secho('Initialize resource: SUCCESS', fg='green', bold=True)
         elif 'download' in modules:
             drop_download_tables(engine)
             create_download_tables(engine)
+            initialized.append('download')
             click.secho('Initialize download: SUCCESS', fg='green', bold=True)
         else:
             drop_utilization_tables(engine)
             create_utilization_tables(engine)
+            initialized += ['utilization', 'resource', 'download']
+            if migration.create_search_indexes(engine):
+                initialized.append('search')
             drop_resource_tables(engine)
             create_resource_tables(engine)
             drop_download_tables(engine)
             create_download_tables(engine)
             click.secho('Initialize all modules: SUCCESS', fg='green', bold=True)
+        # The tables of every module include package_feedback_summary
+        initialized.append('package')
+        # Reset the package summary columns of the initialized modules
+        migration.backfill_package_summaries(engine)
+        migration.stamp_initialized(engine, initialized)
     except Exception as e:
         toolkit.error_shout(e)
         sys.exit(1)
 
 
+@feedback.command(
+    name='upgrade',
+    short_help='apply pending schema migrations to the feedback tables.',
+)
+@database_options
+def upgrade(host, port, dbname, user, password):
+    engine = get_engine(host, port, dbname, user, password)
+    try:
+        applied = migration.upgrade(engine)
+    except Exception as e:
+        toolkit.error_shout(e)
+        sys.exit(1)
+    for m in applied:
+        click.echo(f'Applied migration {m.version}: {m.description}')
+    click.secho(
+        f'Upgrade to version {migration.get_head_version()}: SUCCESS',
+        fg='green',
+        bold=True,
+    )
+
+
 def drop_utilization_tables(engine):
     IssueResolutionSummary.__table__.drop(engine, checkfirst=True)
     IssueResolution.__table__.drop(engine, checkfirst=True)
@@ -120,6 +186,7 @@ def create_utilization_tables(engine):
     UtilizationSummary.__table__.create(engine, checkfirst=True)
     IssueResolution.__table__.create(engine, checkfirst=True)
     IssueResolutionSummary.__table__.create(engine, checkfirst=True)
+    PackageFeedbackSummary.__table__.create(engine, checkfirst=True)
 
 
 def drop_resource_tables(engine):
@@ -132,11 +199,318 @@ def create_resource_tables(engine):
     ResourceComment.__table__.create(engine, checkfirst=True)
     ResourceCommentReply.__table__.create(engine, checkfirst=True)
     ResourceCommentSummary.__table__.create(engine, checkfirst=True)
+    PackageFeedbackSummary.__table__.create(engine, checkfirst=True)
 
 
 def drop_download_tables(engine):
+    DownloadMonthly.__table__.drop(engine, checkfirst=True)
+    DownloadDaily.__table__.drop(engine, checkfirst=True)
     DownloadSummary.__table__.drop(engine, checkfirst=True)
 
 
 def create_download_tables(engine):
     DownloadSummary.__table__.create(engine, checkfirst=True)
+    DownloadDaily.__table__.create(engine, checkfirst=True)
+    DownloadMonthly.__table__.create(engine, checkfirst=True)
+    PackageFeedbackSummary.__table__.create(engine, checkfirst=True)
+
+
+@feedback.command(
+    name='rollup-downloads',
+    short_help='compact old daily download counts into monthly counts.',
+)
+@click.option(
+    '-k',
+    '--keep-days',
+    default=90,
+    type=click.IntRange(min=1),
+    help='specify the number of days to keep daily download counts for',
+)
+def rollup_downloads(keep_days):
+    before = datetime.date.today() - datetime.timedelta(days=keep_days)
+    try:
+        count = download_summary_service.rollup_daily_downloads(before)
+    except Exception as e:
+        toolkit.error_shout(e)
+        sys.exit(1)
+    click.secho(
+        f'Rollup downloads: SUCCESS ({count} daily rows compacted)',
+        fg='green',
+        bold=True,
+    )
+
+
+@feedback.command(
+    name='worker',
+    short_help='apply the queued download events to the download counts.',
+)
+@click.option(
+    '-b',
+    '--batch-size',
+    default=1000,
+    type=click.IntRange(min=1),
+    help='specify the number of events to aggregate into one upsert',
+)
+@click.option(
+    '-i',
+    '--interval',
+    default=1.0,
+    type=click.FloatRange(min=0),
+    help='specify the seconds to wait when the queue is empty',
+)
+@click.option(
+    '--once',
+    is_flag=True,
+    help='exit when the queue is empty instead of waiting for more events',
+)
+@click.option(
+    '-w',
+    '--worker-id',
+    default=None,
+    help='specify the id of the worker, unique among the workers sharing the queue',
+)
+def worker(batch_size, interval, once, worker_id):
+    try:
+        download_queue = download_queue_service.get_shared_download_queue(worker_id)
+        # Put back the events this worker popped but did not apply before it
+        # stopped
+        recovered = download_queue.recover()
+    except Exception as e:
+        toolkit.error_shout(e)
+        sys.exit(1)
+    if recovered:
+        click.echo(f'Recovered {recovered} downloads of a stopped worker')
+
+    # Finish the current batch before stopping, so that no popped event is lost
+    stopping = []
+    handlers = {
+        signum: signal.signal(signum, lambda signum, frame: stopping.append(signum))
+        for signum in [signal.SIGINT, signal.SIGTERM]
+    }
+
+    total = 0
+    try:
+        while not stopping:
+            try:
+                count = download_queue_service.drain_batch(download_queue, batch_size)
+            except Exception as e:
+                toolkit.error_shout(e)
+                if once:
+                    sys.exit(1)
+                count = 0
+            total += count
+            if not count:
+                if once:
+                    break
+                time.sleep(interval)
+    finally:
+        for signum, handler in handlers.items():
+            signal.signal(signum, handler)
+    click.secho(
+        f'Worker: SUCCESS ({total} downloads applied)',
+        fg='green',
+        bold=True,
+    )
+
+
+@feedback.command(
+    name='export',
+    short_help='export the rows of a feedback table as CSV or NDJSON.',
+)
+@click.argument('table', type=click.Choice(list(export_service.export_models)))
+@click.option(
+    '-f',
+    '--format',
+    'export_format',
+    default='csv',
+    type=click.Choice(export_service.export_formats),
+    help='specify the output format',
+)
+@click.option(
+    '-o',
+    '--output',
+    default='-',
+    type=click.Path(dir_okay=False, writable=True, allow_dash=True),
+    help='specify the output file, or - for the standard output',
+)
+@click.option(
+    '--created-from',
+    type=click.DateTime(formats=['%Y-%m-%d']),
+    help='export the rows created on or after the date',
+)
+@click.option(
+    '--created-to',
+    type=click.DateTime(formats=['%Y-%m-%d']),
+    help='export the rows created on or before the date',
+)
+@click.option(
+    '--status',
+    type=click.Choice(['approved', 'waiting']),
+    help='export only the approved or waiting rows',
+)
+def export(table, export_format, output, created_from, created_to, status):
+    chunks = export_service.export_rows(
+        table,
+        export_format,
+        created_from=created_from.date() if created_from else None,
+        created_to=created_to.date() if created_to else None,
+        approval=None if status is None else status == 'approved',
+    )
+    try:
+        with click.open_file(output, 'w', encoding='utf-8') as f:
+            for chunk in chunks:
+                f.write(chunk)
+    except Exception as e:
+        toolkit.error_shout(e)
+        sys.exit(1)
+    click.secho(f'Export {table}: SUCCESS', fg='green', bold=True, err=True)
+
+
+@feedback.command(
+    name='import',
+    short_help='load CSV or NDJSON rows into a feedback table in bulk.',
+)
+@click.argument('table', type=click.Choice(list(import_service.import_tables)))
+@click.option(
+    '-f',
+    '--format',
+    'import_format',
+    default='csv',
+    type=click.Choice(import_service.import_formats),
+    help='specify the input format',
+)
+@click.option(
+    '-i',
+    '--input',
+    'input_path',
+    default='-',
+    type=click.Path(dir_okay=False, allow_dash=True),
+    help='specify the input file, or - for the standard input',
+)
+@click.option(
+    '-b',
+    '--batch-size',
+    default=10000,
+    type=click.IntRange(min=1),
+    help='specify the number of rows to validate and copy at once',
+)
+@click.option(
+    '--skip-invalid',
+    is_flag=True,
+    help='skip the rows of unknown resources or utilizations instead of failing',
+)
+def import_(table, import_format, input_path, batch_size, skip_invalid):
+    try:
+        with click.open_file(input_path, 'r', encoding='utf-8') as f:
+            result = import_service.import_records(
+                table,
+                import_service.read_records(f, import_format),
+                batch_size=batch_size,
+                skip_invalid=skip_invalid,
+            )
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        toolkit.error_shout(e)
+        sys.exit(1)
+    click.secho(
+        f'Import {table}: SUCCESS ({result.imported} rows imported,'
+        f' {result.read - result.skipped - result.imported} already existed,'
+        f' {result.skipped} skipped)',
+        fg='green',
+        bold=True,
+    )
+
+
+@feedback.group(
+    name='summaries', short_help='verify or rebuild the feedback summary tables.'
+)
+def summaries():
+    '''Recalculate the summaries in partitions of resources.'''
+
+
+# Add the options to select and partition the summaries to the command
+def summaries_options(func):
+    options = [
+        click.option(
+            '-m',
+            '--modules',
+            multiple=True,
+            type=click.Choice(summaries_service.summary_modules),
+            help='specify the module whose summaries to check from resource, '
+            'utilization',
+        ),
+        click.option(
+            '-w',
+            '--workers',
+            default=1,
+            type=click.IntRange(min=1),
+            help='specify the number of worker processes',
+        ),
+        click.option(
+            '-s',
+            '--partition-size',
+            default=1000,
+            type=click.IntRange(min=1),
+            help='specify the number of resources to check in a partition',
+        ),
+        click.option(
+            '-c',
+            '--checkpoint',
+            type=click.Path(dir_okay=False),
+            help='specify the file to record the progress in, to resume from it',
+        ),
+    ]
+    for option in reversed(options):
+        func = option(func)
+    return func
+
+
+# Print the drifts and return their number
+def check_summaries(modules, fix, workers, partition_size, checkpoint):
+    count = 0
+    try:
+        for drifts in summaries_service.check_summaries(
+            modules or summaries_service.summary_modules,
+            fix,
+            workers=workers,
+            partition_size=partition_size,
+            checkpoint_path=checkpoint,
+        ):
+            for drift in drifts:
+                click.echo(
+                    f'{drift.table} {drift.key} {drift.column}:'
+                    f' {drift.actual} != {drift.expected}'
+                )
+            count += len(drifts)
+    except Exception as e:
+        toolkit.error_shout(e)
+        sys.exit(1)
+    return count
+
+
+@summaries.command(
+    name='rebuild',
+    short_help='recalculate the summaries that drifted from the feedback.',
+)
+@summaries_options
+def rebuild_summaries(modules, workers, partition_size, checkpoint):
+    count = check_summaries(modules, True, workers, partition_size, checkpoint)
+    click.secho(
+        f'Rebuild summaries: SUCCESS ({count} drifted values corrected)',
+        fg='green',
+        bold=True,
+    )
+
+
+@summaries.command(
+    name='verify',
+    short_help='report the summaries that drifted from the feedback.',
+)
+@summaries_options
+def verify_summaries(modules, workers, partition_size, checkpoint):
+    count = check_summaries(modules, False, workers, partition_size, checkpoint)
+    if count:
+        toolkit.error_shout(f'Verify summaries: {count} drifted values found')
+        sys.exit(1)
+    click.secho('Verify summaries: SUCCESS (no drifted values)', fg='green', bold=True)
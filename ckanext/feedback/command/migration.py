@@ -0,0 +1,352 @@
+import logging
+import re
+from collections import namedtuple
+
+from sqlalchemy import inspect, select, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.schema import CreateColumn, CreateIndex
+
+from ckanext.feedback.models.download import (
+    DownloadDaily,
+    DownloadMonthly,
+    DownloadSummary,
+)
+from ckanext.feedback.models.issue import IssueResolution, IssueResolutionSummary
+from ckanext.feedback.models.migration import SchemaVersion
+from ckanext.feedback.models.package import PackageFeedbackSummary
+from ckanext.feedback.models.resource_comment import (
+    ResourceComment,
+    ResourceCommentReply,
+    ResourceCommentSummary,
+)
+from ckanext.feedback.models.utilization import (
+    Utilization,
+    UtilizationComment,
+    UtilizationSummary,
+)
+from ckanext.feedback.services.common import package_summary as package_summary_service
+from ckanext.feedback.services.download import summary as download_summary_service
+from ckanext.feedback.services.resource import summary as resource_summary_service
+from ckanext.feedback.services.utilization import summary as utilization_summary_service
+
+log = logging.getLogger(__name__)
+
+# modules: the modules whose tables the migration changes, used to tell which
+# migrations init has done. 'search' stands for the trigram indexes, which are
+# skipped without pg_trgm, and 'package' for package_feedback_summary
+Migration = namedtuple(
+    'Migration', ['version', 'description', 'upgrade', 'modules'], defaults=[()]
+)
+
+migrations = []
+
+# The tables of each module as of version 1.1.0, the first of them telling
+# whether init has been run for the module
+module_tables = {
+    'utilization': [
+        Utilization.__table__,
+        UtilizationComment.__table__,
+        UtilizationSummary.__table__,
+        IssueResolution.__table__,
+        IssueResolutionSummary.__table__,
+    ],
+    'resource': [
+        ResourceComment.__table__,
+        ResourceCommentReply.__table__,
+        ResourceCommentSummary.__table__,
+    ],
+    'download': [DownloadSummary.__table__],
+}
+
+
+# Register the function as the migration to the given schema version
+def migration(version, description, modules):
+    def decorator(func):
+        migrations.append(Migration(version, description, func, tuple(modules)))
+        migrations.sort(key=lambda m: m.version)
+        return func
+
+    return decorator
+
+
+def get_head_version():
+    return migrations[-1].version
+
+
+# Get the versions of the migrations already applied to the database
+def get_applied_versions(engine):
+    SchemaVersion.__table__.create(engine, checkfirst=True)
+    with engine.connect() as connection:
+        rows = connection.execute(select([SchemaVersion.version]))
+        return {row.version for row in rows}
+
+
+def record_version(engine, version, description):
+    with engine.begin() as connection:
+        connection.execute(
+            SchemaVersion.__table__.insert().values(
+                version=version, description=description
+            )
+        )
+
+
+# Apply the pending migrations in order and return the applied ones
+# A migration returning False has skipped its work, so it is left pending to be
+# retried by the next upgrade
+def upgrade(engine):
+    applied_versions = get_applied_versions(engine)
+    applied = []
+    for m in migrations:
+        if m.version in applied_versions:
+            continue
+        log.info('Applying feedback migration %d: %s', m.version, m.description)
+        if m.upgrade(engine) is False:
+            log.warning('Feedback migration %d was skipped.', m.version)
+            continue
+        record_version(engine, m.version, m.description)
+        applied.append(m)
+    return applied
+
+
+# Mark the migrations as applied whose work init has done
+# modules: the modules whose tables init created with the latest schema, and
+# 'search' if it created the trigram indexes
+# The migrations of the other modules are left for upgrade
+def stamp_initialized(engine, modules):
+    applied_versions = get_applied_versions(engine)
+    for m in migrations:
+        if m.version not in applied_versions and set(m.modules) <= set(modules):
+            record_version(engine, m.version, m.description)
+
+
+# Get the modules init has been run for
+def get_initialized_modules(engine):
+    return [
+        module
+        for module, tables in module_tables.items()
+        if engine.has_table(tables[0].name)
+    ]
+
+
+def create_table(engine, table):
+    table.create(engine, checkfirst=True)
+
+
+# Add the column to the existing table if it does not have it yet
+def add_column(engine, table, column):
+    if not engine.has_table(table.name):
+        return False
+    if column.name in {c['name'] for c in inspect(engine).get_columns(table.name)}:
+        return False
+
+    column_ddl = CreateColumn(column).compile(dialect=engine.dialect)
+    with engine.begin() as connection:
+        connection.execute(f'ALTER TABLE {table.name} ADD COLUMN {column_ddl}')
+    return True
+
+
+# Create the index without blocking writes to the table
+def create_index_concurrently(engine, index):
+    if not engine.has_table(index.table.name):
+        return
+
+    index_ddl = str(CreateIndex(index).compile(dialect=engine.dialect))
+    execute_create_index_concurrently(engine, index.name, index_ddl)
+
+
+def execute_create_index_concurrently(engine, index_name, index_ddl):
+    with engine.connect() as connection:
+        connection = connection.execution_options(isolation_level='AUTOCOMMIT')
+        is_valid = connection.execute(
+            text(
+                'SELECT i.indisvalid FROM pg_index i'
+                ' JOIN pg_class c ON c.oid = i.indexrelid'
+                ' WHERE c.relname = :name'
+            ),
+            name=index_name,
+        ).scalar()
+        if is_valid:
+            return
+        if is_valid is not None:
+            # An interrupted concurrent build leaves an invalid index behind
+            connection.execute(f'DROP INDEX CONCURRENTLY {index_name}')
+
+        index_ddl = re.sub(
+            r'^CREATE (UNIQUE )?INDEX', r'CREATE \1INDEX CONCURRENTLY', index_ddl
+        )
+        connection.execute(index_ddl)
+
+
+def create_indexes_concurrently(engine, table):
+    for index in table.indexes:
+        create_index_concurrently(engine, index)
+
+
+# Trigram indexes for the keyword search of utilizations
+# They are not declared on the models because they require pg_trgm
+search_indexes = [
+    (
+        'idx_utilization_title_trgm',
+        'CREATE INDEX idx_utilization_title_trgm'
+        ' ON utilization USING gin (title gin_trgm_ops)',
+    ),
+    (
+        'idx_utilization_description_trgm',
+        'CREATE INDEX idx_utilization_description_trgm'
+        ' ON utilization USING gin (description gin_trgm_ops)',
+    ),
+    (
+        'idx_feedback_resource_name_trgm',
+        'CREATE INDEX idx_feedback_resource_name_trgm'
+        ' ON resource USING gin (name gin_trgm_ops)',
+    ),
+    (
+        'idx_feedback_package_name_trgm',
+        'CREATE INDEX idx_feedback_package_name_trgm'
+        ' ON package USING gin (name gin_trgm_ops)',
+    ),
+]
+
+
+# Create the trigram indexes, or skip them if pg_trgm cannot be installed
+def create_search_indexes(engine):
+    if not engine.has_table(Utilization.__tablename__):
+        return False
+    try:
+        with engine.begin() as connection:
+            connection.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    except DBAPIError as e:
+        log.warning(
+            'Skipped the search indexes because pg_trgm is not available: %s', e
+        )
+        return False
+
+    for index_name, index_ddl in search_indexes:
+        execute_create_index_concurrently(engine, index_name, index_ddl)
+    return True
+
+
+# Recalculate package_feedback_summary from the summaries of the existing modules
+def backfill_package_summaries(engine):
+    if not engine.has_table(PackageFeedbackSummary.__tablename__):
+        return
+
+    aggregates = []
+    if engine.has_table(DownloadSummary.__tablename__):
+        aggregates.append(download_summary_service.get_package_downloads_aggregate())
+    if engine.has_table(ResourceCommentSummary.__tablename__):
+        aggregates.append(resource_summary_service.get_package_comments_aggregate())
+    if engine.has_table(UtilizationSummary.__tablename__):
+        aggregates.append(
+            utilization_summary_service.get_package_utilizations_aggregate()
+        )
+    if engine.has_table(IssueResolutionSummary.__tablename__):
+        aggregates.append(
+            utilization_summary_service.get_package_issue_resolutions_aggregate()
+        )
+    with engine.begin() as connection:
+        for aggregate in aggregates:
+            package_summary_service.upsert_package_summaries(connection, aggregate)
+
+
+# The tables of the modules init has not been run for are not created, so that
+# upgrade never enables a module
+@migration(
+    1,
+    'Create the feedback tables of version 1.1.0',
+    ['utilization', 'resource', 'download'],
+)
+def create_initial_tables(engine):
+    for module in get_initialized_modules(engine):
+        for table in module_tables[module]:
+            create_table(engine, table)
+
+
+@migration(2, 'Add the unique index on download_summary.resource_id', ['download'])
+def add_download_summary_unique_index(engine):
+    if not engine.has_table(DownloadSummary.__tablename__):
+        return
+
+    # Merge the duplicated rows created by concurrent first downloads
+    with engine.begin() as connection:
+        connection.execute(
+            'UPDATE download_summary SET download = duplicates.download'
+            ' FROM ('
+            '  SELECT min(id) AS id, sum(download) AS download'
+            '  FROM download_summary GROUP BY resource_id HAVING count(*) > 1'
+            ' ) AS duplicates'
+            ' WHERE download_summary.id = duplicates.id'
+        )
+        connection.execute(
+            'DELETE FROM download_summary WHERE id NOT IN ('
+            '  SELECT min(id) FROM download_summary GROUP BY resource_id'
+            ')'
+        )
+    create_indexes_concurrently(engine, DownloadSummary.__table__)
+
+
+@migration(3, 'Create the daily and monthly download tables', ['download'])
+def create_download_time_series_tables(engine):
+    if 'download' not in get_initialized_modules(engine):
+        return
+    create_table(engine, DownloadDaily.__table__)
+    create_table(engine, DownloadMonthly.__table__)
+
+
+@migration(4, 'Add indexes to the feedback tables', ['utilization', 'resource'])
+def add_feedback_indexes(engine):
+    for table in [
+        Utilization.__table__,
+        UtilizationComment.__table__,
+        UtilizationSummary.__table__,
+        IssueResolution.__table__,
+        IssueResolutionSummary.__table__,
+        ResourceComment.__table__,
+        ResourceCommentReply.__table__,
+        ResourceCommentSummary.__table__,
+    ]:
+        create_indexes_concurrently(engine, table)
+
+
+@migration(
+    5, 'Add trigram indexes for the utilization search', ['utilization', 'search']
+)
+def add_search_indexes(engine):
+    return create_search_indexes(engine)
+
+
+@migration(6, 'Add the rating sum and count to resource_comment_summary', ['resource'])
+def add_resource_comment_summary_rating_totals(engine):
+    table = ResourceCommentSummary.__table__
+    added = [
+        add_column(engine, table, table.c.rating_sum),
+        add_column(engine, table, table.c.rating_count),
+    ]
+    if not any(added):
+        return
+
+    # Backfill the totals from the approved comments
+    with engine.begin() as connection:
+        connection.execute(
+            'UPDATE resource_comment_summary SET'
+            ' rating_sum = totals.rating_sum, rating_count = totals.rating_count'
+            ' FROM ('
+            '  SELECT summary.id,'
+            '   coalesce(sum(rc.rating), 0) AS rating_sum,'
+            '   count(rc.rating) AS rating_count'
+            '  FROM resource_comment_summary AS summary'
+            '  LEFT JOIN resource_comment AS rc'
+            '   ON rc.resource_id = summary.resource_id AND rc.approval'
+            '  GROUP BY summary.id'
+            ' ) AS totals'
+            ' WHERE resource_comment_summary.id = totals.id'
+        )
+
+
+# Left pending until init has been run for a module
+@migration(7, 'Create package_feedback_summary', ['package'])
+def create_package_feedback_summary(engine):
+    if not get_initialized_modules(engine):
+        return False
+    create_table(engine, PackageFeedbackSummary.__table__)
+    backfill_package_summaries(engine)
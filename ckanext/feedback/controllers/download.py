@@ -1,6 +1,9 @@
 from ckan.views.resource import download
 from flask import request
 
+from ckanext.feedback.services.download.buffer import get_download_buffer
+from ckanext.feedback.services.download.dedup import is_first_download
+from ckanext.feedback.services.download.queue import publish_download
 from ckanext.feedback.services.download.summary import increment_resource_downloads
 
 
@@ -8,6 +11,16 @@ class DownloadController:
     # extend default download function to count when a resource is downloaded
     @staticmethod
     def extended_download(package_type, id, resource_id, filename=None):
-        if request.headers.get('Sec-Fetch-Dest') == 'document':
-            increment_resource_downloads(resource_id)
+        # The repeated downloads of a client are counted once, and a queued
+        # download is counted by the worker, off the response path
+        if (
+            request.headers.get('Sec-Fetch-Dest') == 'document'
+            and is_first_download(resource_id)
+            and not publish_download(resource_id)
+        ):
+            download_buffer = get_download_buffer()
+            if download_buffer is not None:
+                download_buffer.add(resource_id)
+            else:
+                increment_resource_downloads(resource_id)
         return download(package_type, id, resource_id, filename=filename)
@@ -1,12 +1,17 @@
-from ckan.common import _, c, request
+from datetime import datetime
+
+from ckan.common import _, c, config, request
 from ckan.lib import helpers
 from ckan.plugins import toolkit
-from flask import redirect, url_for
+from flask import Response, redirect, stream_with_context, url_for
 
+import ckanext.feedback.services.common.instrumentation as instrumentation_service
 import ckanext.feedback.services.management.comments as comments_service
-import ckanext.feedback.services.resource.comment as resource_comment_service
+import ckanext.feedback.services.management.export as export_service
 import ckanext.feedback.services.utilization.details as utilization_detail_service
+from ckanext.feedback.models.resource_comment import ResourceCommentCategory
 from ckanext.feedback.models.session import session
+from ckanext.feedback.models.utilization import UtilizationCommentCategory
 from ckanext.feedback.services.common.check import check_administrator
 
 
@@ -17,18 +22,118 @@ class ManagementController:
     def comments():
         tab = request.args.get('tab', 'utilization-comments')
         categories = utilization_detail_service.get_utilization_comment_categories()
-        utilization_comments = utilization_detail_service.get_utilization_comments()
-        resource_comments = resource_comment_service.get_resource_comments()
+        page_size = toolkit.asint(
+            config.get('ckan.feedback.management.comments.page_size', 50)
+        )
+
+        filter_args = ManagementController._get_filter_args(request.args)
+        utilization_filters = ManagementController._get_utilization_filters(filter_args)
+        resource_filters = ManagementController._get_resource_filters(filter_args)
+
+        # The cursor moves only the page of the active tab
+        after = comments_service.decode_cursor(request.args.get('after'))
+        before = comments_service.decode_cursor(request.args.get('before'))
+        utilization_cursor = {}
+        resource_cursor = {}
+        if tab == 'utilization-comments':
+            utilization_cursor = {'after': after, 'before': before}
+        else:
+            resource_cursor = {'after': after, 'before': before}
+
+        utilization_comments_page = comments_service.get_utilization_comments_page(
+            page_size, **utilization_cursor, **utilization_filters
+        )
+        resource_comments_page = comments_service.get_resource_comments_page(
+            page_size, **resource_cursor, **resource_filters
+        )
+
         return toolkit.render(
             'management/comments.html',
             {
                 'categories': categories,
-                'utilization_comments': utilization_comments,
-                'resource_comments': resource_comments,
+                'utilization_comments': utilization_comments_page.comments,
+                'utilization_comments_page': utilization_comments_page,
+                'utilization_comments_count': (
+                    comments_service.count_utilization_comments(**utilization_filters)
+                ),
+                'resource_comments': resource_comments_page.comments,
+                'resource_comments_page': resource_comments_page,
+                'resource_comments_count': (
+                    comments_service.count_resource_comments(**resource_filters)
+                ),
+                'filter_args': filter_args,
                 'tab': tab,
             },
         )
 
+    # Get the filter values of the comments page from the request parameters
+    @staticmethod
+    def _get_filter_args(params):
+        return {
+            'status': params.getlist('status'),
+            'category': params.getlist('category'),
+            'package_id': params.get('package_id', ''),
+            'resource_id': params.get('resource_id', ''),
+            'created_from': params.get('created_from', ''),
+            'created_to': params.get('created_to', ''),
+        }
+
+    # Convert the query parameters of the comments page into service filters
+    @staticmethod
+    def _get_comment_filters(filter_args):
+        statuses = set(filter_args['status'])
+        approval = None
+        if statuses == {'approved'}:
+            approval = True
+        elif statuses == {'waiting'}:
+            approval = False
+
+        return {
+            'approval': approval,
+            'package_id': filter_args['package_id'] or None,
+            'resource_id': filter_args['resource_id'] or None,
+            'created_from': ManagementController._parse_date(
+                filter_args['created_from']
+            ),
+            'created_to': ManagementController._parse_date(filter_args['created_to']),
+        }
+
+    @staticmethod
+    def _get_utilization_filters(filter_args):
+        return dict(
+            ManagementController._get_comment_filters(filter_args),
+            categories=ManagementController._get_categories(
+                UtilizationCommentCategory, filter_args['category'] or None
+            ),
+        )
+
+    @staticmethod
+    def _get_resource_filters(filter_args):
+        return dict(
+            ManagementController._get_comment_filters(filter_args),
+            categories=ManagementController._get_categories(
+                ResourceCommentCategory, filter_args['category'] or None
+            ),
+        )
+
+    # Get the members of the category enum, or None to select all categories
+    @staticmethod
+    def _get_categories(category_enum, category_names):
+        if category_names is None:
+            return None
+        return [
+            category_enum[name]
+            for name in category_names
+            if name in category_enum.__members__
+        ]
+
+    @staticmethod
+    def _parse_date(value):
+        try:
+            return datetime.strptime(value, '%Y-%m-%d').date()
+        except ValueError:
+            return None
+
     # management/approve_bulk_utilization_comments
     @staticmethod
     @check_administrator
@@ -51,11 +156,7 @@ class ManagementController:
     def approve_bulk_resource_comments():
         comments = request.form.getlist('resource-comments-checkbox')
         if comments:
-            resource_comment_summaries = (
-                comments_service.get_resource_comment_summaries(comments)
-            )
             comments_service.approve_resource_comments(comments, c.userobj.id)
-            comments_service.refresh_resources_comments(resource_comment_summaries)
             session.commit()
             helpers.flash_success(
                 f'{len(comments)} ' + _('bulk approval completed.'),
@@ -86,11 +187,7 @@ class ManagementController:
     def delete_bulk_resource_comments():
         comments = request.form.getlist('resource-comments-checkbox')
         if comments:
-            resource_comment_summaries = (
-                comments_service.get_resource_comment_summaries(comments)
-            )
             comments_service.delete_resource_comments(comments)
-            comments_service.refresh_resources_comments(resource_comment_summaries)
             session.commit()
 
             helpers.flash_success(
@@ -98,3 +195,139 @@ class ManagementController:
                 allow_html=True,
             )
         return redirect(url_for('management.comments', tab='resource-comments'))
+
+    # management/approve_matching_utilization_comments
+    @staticmethod
+    @check_administrator
+    def approve_matching_utilization_comments():
+        filters = ManagementController._get_utilization_filters(
+            ManagementController._get_filter_args(request.form)
+        )
+        results = comments_service.approve_matching_utilization_comments(
+            c.userobj.id, ManagementController._get_batch_size(), **filters
+        )
+        ManagementController._run_matching_action(
+            results, _('comments approved.'), _('utilizations refreshed.')
+        )
+        return redirect(url_for('management.comments', tab='utilization-comments'))
+
+    # management/approve_matching_resource_comments
+    @staticmethod
+    @check_administrator
+    def approve_matching_resource_comments():
+        filters = ManagementController._get_resource_filters(
+            ManagementController._get_filter_args(request.form)
+        )
+        results = comments_service.approve_matching_resource_comments(
+            c.userobj.id, ManagementController._get_batch_size(), **filters
+        )
+        ManagementController._run_matching_action(
+            results, _('comments approved.'), _('resource summaries refreshed.')
+        )
+        return redirect(url_for('management.comments', tab='resource-comments'))
+
+    # management/delete_matching_utilization_comments
+    @staticmethod
+    @check_administrator
+    def delete_matching_utilization_comments():
+        filters = ManagementController._get_utilization_filters(
+            ManagementController._get_filter_args(request.form)
+        )
+        try:
+            results = comments_service.delete_matching_utilization_comments(
+                ManagementController._get_batch_size(), **filters
+            )
+        except ValueError:
+            # Never delete every comment because of an empty filter
+            helpers.flash_error(
+                _('Set a filter to select the comments to delete.'), allow_html=True
+            )
+            return redirect(url_for('management.comments', tab='utilization-comments'))
+        ManagementController._run_matching_action(
+            results, _('comments deleted.'), _('utilizations refreshed.')
+        )
+        return redirect(url_for('management.comments', tab='utilization-comments'))
+
+    # management/delete_matching_resource_comments
+    @staticmethod
+    @check_administrator
+    def delete_matching_resource_comments():
+        filters = ManagementController._get_resource_filters(
+            ManagementController._get_filter_args(request.form)
+        )
+        try:
+            results = comments_service.delete_matching_resource_comments(
+                ManagementController._get_batch_size(), **filters
+            )
+        except ValueError:
+            # Never delete every comment because of an empty filter
+            helpers.flash_error(
+                _('Set a filter to select the comments to delete.'), allow_html=True
+            )
+            return redirect(url_for('management.comments', tab='resource-comments'))
+        ManagementController._run_matching_action(
+            results, _('comments deleted.'), _('resource summaries refreshed.')
+        )
+        return redirect(url_for('management.comments', tab='resource-comments'))
+
+    @staticmethod
+    def _get_batch_size():
+        return toolkit.asint(
+            config.get('ckan.feedback.management.comments.batch_size', 1000)
+        )
+
+    # Commit each batch of the bulk action and report the total counts
+    @staticmethod
+    def _run_matching_action(results, comments_message, summaries_message):
+        comments = 0
+        summary_ids = set()
+        for result in results:
+            session.commit()
+            comments += result.comments
+            summary_ids.update(result.summary_ids)
+        helpers.flash_success(
+            f'{comments} {comments_message} {len(summary_ids)} {summaries_message}',
+            allow_html=True,
+        )
+
+    # management/export/<table>
+    @staticmethod
+    @check_administrator
+    def export(table):
+        export_format = request.args.get('format', 'csv')
+        if (
+            table not in export_service.export_models
+            or export_format not in export_service.export_formats
+        ):
+            toolkit.abort(404)
+
+        filter_args = ManagementController._get_filter_args(request.args)
+        filters = ManagementController._get_comment_filters(filter_args)
+        chunks = export_service.export_rows(
+            table,
+            export_format,
+            created_from=filters['created_from'],
+            created_to=filters['created_to'],
+            approval=filters['approval'],
+        )
+        mimetype = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+        return Response(
+            stream_with_context(chunks),
+            mimetype=mimetype,
+            headers={
+                'Content-Disposition': (
+                    f'attachment; filename="{table}.{export_format}"'
+                )
+            },
+        )
+
+    # management/metrics
+    @staticmethod
+    @check_administrator
+    def metrics():
+        if not instrumentation_service.is_enabled():
+            toolkit.abort(404)
+        return Response(
+            instrumentation_service.get_metrics_text(),
+            content_type='text/plain; version=0.0.4; charset=utf-8',
+        )
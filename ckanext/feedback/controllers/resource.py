@@ -78,8 +78,11 @@ class ResourceController:
         if not resource_comment_id:
             toolkit.abort(400)
 
-        comment_service.approve_resource_comment(resource_comment_id, c.userobj.id)
-        summary_service.refresh_resource_summary(resource_id)
+        comment = comment_service.approve_resource_comment(
+            resource_comment_id, c.userobj.id
+        )
+        if comment:
+            summary_service.add_comment_to_resource_summary(comment)
         session.commit()
 
         return redirect(url_for('resource_comment.comment', resource_id=resource_id))
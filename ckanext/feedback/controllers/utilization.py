@@ -1,5 +1,7 @@
+from functools import partial
+
 import ckan.model as model
-from ckan.common import _, c, request
+from ckan.common import _, c, config, request
 from ckan.lib import helpers
 from ckan.logic import get_action
 from ckan.plugins import toolkit
@@ -21,21 +23,59 @@ class UtilizationController:
     def search():
         id = request.args.get('id', '')
         keyword = request.args.get('keyword', '')
+        statuses = request.args.getlist('status')
         approval = None
         if c.userobj is None or c.userobj.sysadmin is None:
             approval = True
+        elif set(statuses) == {'approved'}:
+            approval = True
+        elif set(statuses) == {'waiting'}:
+            approval = False
         disable_keyword = request.args.get('disable_keyword', '')
-        utilizations = search_service.get_utilizations(id, keyword, approval)
+
+        page_number = helpers.get_page_number(request.args)
+        page_size = toolkit.asint(
+            config.get('ckan.feedback.utilizations.search.page_size', 20)
+        )
+        utilizations = search_service.get_utilizations(
+            id,
+            keyword,
+            approval,
+            limit=page_size,
+            offset=(page_number - 1) * page_size,
+        )
+        params = {
+            'id': id,
+            'keyword': keyword,
+            'disable_keyword': disable_keyword,
+            'status': statuses,
+        }
+        page = helpers.Page(
+            collection=utilizations,
+            page=page_number,
+            url=partial(UtilizationController._pager_url, params),
+            item_count=search_service.get_utilizations_count(id, keyword, approval),
+            items_per_page=page_size,
+            presliced_list=True,
+        )
 
         return toolkit.render(
             'utilization/search.html',
             {
+                'id': id,
                 'keyword': keyword,
                 'disable_keyword': disable_keyword,
+                'statuses': statuses,
                 'utilizations': utilizations,
+                'page': page,
             },
         )
 
+    @staticmethod
+    def _pager_url(params, page=None, **kwargs):
+        params = {key: value for key, value in params.items() if value}
+        return url_for('utilization.search', page=page, **params)
+
     # utilization/new
     @staticmethod
     def new():
@@ -68,6 +108,7 @@ class UtilizationController:
         registration_service.create_utilization(resource_id, title, description)
         summary_service.create_utilization_summary(resource_id)
         session.commit()
+        search_service.clear_utilizations_count_cache()
 
         helpers.flash_success(
             _(
@@ -114,6 +155,7 @@ class UtilizationController:
         detail_service.approve_utilization(utilization_id, c.userobj.id)
         summary_service.refresh_utilization_summary(resource_id)
         session.commit()
+        search_service.clear_utilizations_count_cache()
 
         return redirect(url_for('utilization.details', utilization_id=utilization_id))
 
@@ -176,6 +218,7 @@ class UtilizationController:
 
         edit_service.update_utilization(utilization_id, title, description)
         session.commit()
+        search_service.clear_utilizations_count_cache()
 
         helpers.flash_success(
             _('The utilization has been successfully updated.'),
@@ -192,6 +235,7 @@ class UtilizationController:
         edit_service.delete_utilization(utilization_id)
         summary_service.refresh_utilization_summary(resource_id)
         session.commit()
+        search_service.clear_utilizations_count_cache()
 
         helpers.flash_success(
             _('The utilization has been successfully deleted.'),
@@ -0,0 +1,124 @@
+from ckan import model
+from ckan.common import _, config
+from ckan.plugins import toolkit
+
+from ckanext.feedback.services.common import stats as stats_service
+
+
+def get_max_ids():
+    return toolkit.asint(config.get('ckan.feedback.api.stats.max_ids', 100))
+
+
+# Get the ids from a list or a comma separated string
+def get_ids(data_dict, key):
+    ids = data_dict.get(key) or []
+    if isinstance(ids, str):
+        ids = [id.strip() for id in ids.split(',') if id.strip()]
+    if not isinstance(ids, list) or not all(isinstance(id, str) for id in ids):
+        raise toolkit.ValidationError({key: [_('Must be a list of ids')]})
+    return ids
+
+
+# Get the id of the dataset from its id or name, keeping unknown ids as they are
+def get_package_id(id_or_name):
+    package = model.Package.get(id_or_name)
+    return package.id if package else id_or_name
+
+
+# Get the ids of the resources that are not deleted
+def get_active_resource_ids(resource_ids):
+    if not resource_ids:
+        return set()
+    rows = (
+        model.Session.query(model.Resource.id)
+        .filter(model.Resource.id.in_(resource_ids), model.Resource.state == 'active')
+        .all()
+    )
+    return {row.id for row in rows}
+
+
+# Make the statistics serializable as JSON
+def to_dict(stats):
+    return dict(stats, rating=float(stats['rating']))
+
+
+@toolkit.side_effect_free
+def feedback_stats_show(context, data_dict):
+    '''Return the feedback statistics of a dataset or a resource.
+
+    :param package_id: the id or name of the dataset
+    :type package_id: string
+    :param resource_id: the id of the resource, instead of package_id
+    :type resource_id: string
+
+    :returns: the downloads, utilizations, comments, rating and issue
+        resolutions
+    :rtype: dictionary
+    '''
+    toolkit.check_access('feedback_stats_show', context, data_dict)
+    package_id = data_dict.get('package_id')
+    resource_id = data_dict.get('resource_id')
+    if bool(package_id) == bool(resource_id):
+        raise toolkit.ValidationError(
+            {'package_id': [_('Specify either package_id or resource_id')]}
+        )
+
+    if package_id:
+        package = model.Package.get(package_id)
+        if package is None:
+            raise toolkit.ObjectNotFound(_('Dataset not found'))
+        stats = stats_service.get_packages_feedback_stats([package.id])[package.id]
+        return dict(to_dict(stats), package_id=package.id)
+
+    resource = model.Resource.get(resource_id)
+    if resource is None or resource.state != 'active':
+        raise toolkit.ObjectNotFound(_('Resource not found'))
+    stats = stats_service.get_resources_feedback_stats([resource.id])[resource.id]
+    return dict(to_dict(stats), resource_id=resource.id)
+
+
+@toolkit.side_effect_free
+def feedback_stats_list(context, data_dict):
+    '''Return the feedback statistics of multiple datasets and resources.
+
+    The names of the datasets are converted to their ids. Unknown ids and
+    deleted resources are returned with zero statistics.
+
+    :param package_ids: the ids or names of the datasets, as a list or a
+        comma separated string
+    :type package_ids: list of strings
+    :param resource_ids: the ids of the resources
+    :type resource_ids: list of strings
+
+    :returns: the statistics of each dataset and resource keyed by the ids
+    :rtype: dictionary with ``packages`` and ``resources``
+    '''
+    package_ids = get_ids(data_dict, 'package_ids')
+    resource_ids = get_ids(data_dict, 'resource_ids')
+    max_ids = get_max_ids()
+    if len(package_ids) + len(resource_ids) > max_ids:
+        raise toolkit.ValidationError(
+            {'package_ids': [_('Specify at most {0} ids').format(max_ids)]}
+        )
+    package_ids = [get_package_id(id) for id in package_ids]
+    # Check the access to each dataset and resource after parsing the ids
+    toolkit.check_access(
+        'feedback_stats_list',
+        context,
+        {'package_ids': package_ids, 'resource_ids': resource_ids},
+    )
+
+    packages = stats_service.get_packages_feedback_stats(package_ids)
+    active_resource_ids = get_active_resource_ids(resource_ids)
+    resources = stats_service.get_resources_feedback_stats(
+        [id for id in resource_ids if id in active_resource_ids]
+    )
+    resources.update(
+        stats_service.get_empty_stats(
+            [id for id in resource_ids if id not in active_resource_ids]
+        )
+    )
+    return {
+        'packages': {id: to_dict(stats) for id, stats in packages.items()},
+        'resources': {id: to_dict(stats) for id, stats in resources.items()},
+    }
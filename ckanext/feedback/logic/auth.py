@@ -0,0 +1,42 @@
+from ckan.common import _
+from ckan.plugins import toolkit
+
+
+# Allow the statistics only of the datasets and resources the user can see
+# Unknown ids are allowed, since their statistics are all zero
+def check_stats_access(context, package_ids, resource_ids):
+    ids = [('package_show', id) for id in package_ids]
+    ids += [('resource_show', id) for id in resource_ids]
+    for action, id in ids:
+        try:
+            # Copy the context, since the auth functions store the object in it
+            toolkit.check_access(action, dict(context), {'id': id})
+        except toolkit.ObjectNotFound:
+            continue
+        except toolkit.NotAuthorized:
+            return {
+                'success': False,
+                'msg': _('Not authorized to see the feedback statistics of {0}').format(
+                    id
+                ),
+            }
+    return {'success': True}
+
+
+# The feedback statistics are shown to anonymous users on the dataset pages
+@toolkit.auth_allow_anonymous_access
+def feedback_stats_show(context, data_dict):
+    package_id = data_dict.get('package_id')
+    resource_id = data_dict.get('resource_id')
+    return check_stats_access(
+        context,
+        [package_id] if package_id else [],
+        [resource_id] if resource_id else [],
+    )
+
+
+@toolkit.auth_allow_anonymous_access
+def feedback_stats_list(context, data_dict):
+    return check_stats_access(
+        context, data_dict.get('package_ids', []), data_dict.get('resource_ids', [])
+    )
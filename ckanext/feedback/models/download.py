@@ -1,5 +1,5 @@
 from ckan.model.resource import Resource
-from sqlalchemy import TIMESTAMP, Column, ForeignKey, Integer, Text
+from sqlalchemy import TIMESTAMP, Column, Date, ForeignKey, Index, Integer, Text
 from sqlalchemy.orm import relationship
 
 from ckanext.feedback.models.session import Base
@@ -18,3 +18,37 @@ class DownloadSummary(Base):
     updated = Column(TIMESTAMP)
 
     resource = relationship(Resource)
+
+    __table_args__ = (
+        Index('idx_download_summary_resource_id', resource_id, unique=True),
+    )
+
+
+class DownloadDaily(Base):
+    __tablename__ = 'download_daily'
+    resource_id = Column(
+        Text,
+        ForeignKey('resource.id', onupdate='CASCADE', ondelete='CASCADE'),
+        primary_key=True,
+        nullable=False,
+    )
+    date = Column(Date, primary_key=True, nullable=False)
+    download = Column(Integer, default=0, nullable=False)
+
+    resource = relationship(Resource)
+
+
+# Daily downloads compacted by the rollup-downloads command, keyed by the first
+# day of the month
+class DownloadMonthly(Base):
+    __tablename__ = 'download_monthly'
+    resource_id = Column(
+        Text,
+        ForeignKey('resource.id', onupdate='CASCADE', ondelete='CASCADE'),
+        primary_key=True,
+        nullable=False,
+    )
+    month = Column(Date, primary_key=True, nullable=False)
+    download = Column(Integer, default=0, nullable=False)
+
+    resource = relationship(Resource)
@@ -2,7 +2,7 @@ import uuid
 from datetime import datetime
 
 from ckan.model.user import User
-from sqlalchemy import TIMESTAMP, Column, ForeignKey, Integer, Text
+from sqlalchemy import TIMESTAMP, Column, ForeignKey, Index, Integer, Text
 from sqlalchemy.orm import relationship
 
 from ckanext.feedback.models.session import Base
@@ -25,6 +25,10 @@ class IssueResolution(Base):
     utilization = relationship('Utilization', back_populates='issue_resolutions')
     creator_user = relationship(User)
 
+    __table_args__ = (
+        Index('idx_issue_resolution_utilization_id_created', utilization_id, created),
+    )
+
 
 class IssueResolutionSummary(Base):
     __tablename__ = 'issue_resolution_summary'
@@ -39,3 +43,7 @@ class IssueResolutionSummary(Base):
     updated = Column(TIMESTAMP)
 
     utilization = relationship('Utilization', back_populates='issue_resolution_summary')
+
+    __table_args__ = (
+        Index('idx_issue_resolution_summary_utilization_id', utilization_id),
+    )
@@ -0,0 +1,12 @@
+from datetime import datetime
+
+from sqlalchemy import TIMESTAMP, Column, Integer, Text
+
+from ckanext.feedback.models.session import Base
+
+
+class SchemaVersion(Base):
+    __tablename__ = 'feedback_schema_version'
+    version = Column(Integer, primary_key=True, autoincrement=False)
+    description = Column(Text)
+    applied = Column(TIMESTAMP, default=datetime.now)
@@ -0,0 +1,30 @@
+from datetime import datetime
+
+from ckan.model.package import Package
+from sqlalchemy import TIMESTAMP, Column, ForeignKey, Integer, Numeric, Text
+from sqlalchemy.orm import relationship
+
+from ckanext.feedback.models.session import Base
+
+
+# The resource-level summaries aggregated per package
+# Each module keeps its own columns up to date when its summaries change
+class PackageFeedbackSummary(Base):
+    __tablename__ = 'package_feedback_summary'
+    package_id = Column(
+        Text,
+        ForeignKey('package.id', onupdate='CASCADE', ondelete='CASCADE'),
+        primary_key=True,
+        nullable=False,
+    )
+    download = Column(Integer, default=0)
+    utilization = Column(Integer, default=0)
+    issue_resolution = Column(Integer, default=0)
+    comment = Column(Integer, default=0)
+    rating = Column(Numeric, default=0)
+    rating_sum = Column(Integer, default=0)
+    rating_count = Column(Integer, default=0)
+    created = Column(TIMESTAMP, default=datetime.now)
+    updated = Column(TIMESTAMP)
+
+    package = relationship(Package)
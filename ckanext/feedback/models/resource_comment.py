@@ -11,6 +11,7 @@ from sqlalchemy import (
     Column,
     Enum,
     ForeignKey,
+    Index,
     Integer,
     Numeric,
     Text,
@@ -49,6 +50,16 @@ class ResourceComment(Base):
     approval_user = relationship(User)
     reply = relationship('ResourceCommentReply', uselist=False)
 
+    __table_args__ = (
+        Index('idx_resource_comment_resource_id_created', resource_id, created),
+        Index(
+            'idx_resource_comment_approved_resource_id',
+            resource_id,
+            postgresql_where=approval,
+        ),
+        Index('idx_resource_comment_created', created),
+    )
+
 
 class ResourceCommentReply(Base):
     __tablename__ = 'resource_comment_reply'
@@ -67,6 +78,10 @@ class ResourceCommentReply(Base):
     resource_comment = relationship('ResourceComment', back_populates='reply')
     creator_user = relationship(User)
 
+    __table_args__ = (
+        Index('idx_resource_comment_reply_resource_comment_id', resource_comment_id),
+    )
+
 
 class ResourceCommentSummary(Base):
     __tablename__ = 'resource_comment_summary'
@@ -78,7 +93,11 @@ class ResourceCommentSummary(Base):
     )
     comment = Column(Integer, default=0)
     rating = Column(Numeric, default=0)
+    rating_sum = Column(Integer, default=0)
+    rating_count = Column(Integer, default=0)
     created = Column(TIMESTAMP, default=datetime.now)
     updated = Column(TIMESTAMP)
 
     resource = relationship(Resource)
+
+    __table_args__ = (Index('idx_resource_comment_summary_resource_id', resource_id),)
@@ -1,7 +1,8 @@
 from ckan import model
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import scoped_session, sessionmaker
 
 Base = declarative_base(metadata=model.meta.metadata)
 
-session = Session()
+# Each thread gets its own session, which is removed at the end of the request
+session = scoped_session(sessionmaker())
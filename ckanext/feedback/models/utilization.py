@@ -5,7 +5,16 @@ from datetime import datetime
 from ckan.common import _
 from ckan.model.resource import Resource
 from ckan.model.user import User
-from sqlalchemy import BOOLEAN, TIMESTAMP, Column, Enum, ForeignKey, Integer, Text
+from sqlalchemy import (
+    BOOLEAN,
+    TIMESTAMP,
+    Column,
+    Enum,
+    ForeignKey,
+    Index,
+    Integer,
+    Text,
+)
 from sqlalchemy.orm import relationship
 
 from ckanext.feedback.models.session import Base
@@ -46,6 +55,16 @@ class Utilization(Base):
         'IssueResolutionSummary', back_populates='utilization'
     )
 
+    __table_args__ = (
+        Index('idx_utilization_resource_id', resource_id),
+        Index(
+            'idx_utilization_approved_resource_id',
+            resource_id,
+            postgresql_where=approval,
+        ),
+        Index('idx_utilization_created', created),
+    )
+
 
 class UtilizationComment(Base):
     __tablename__ = 'utilization_comment'
@@ -67,6 +86,18 @@ class UtilizationComment(Base):
     utilization = relationship('Utilization', back_populates='comments')
     approval_user = relationship(User)
 
+    __table_args__ = (
+        Index(
+            'idx_utilization_comment_utilization_id_created', utilization_id, created
+        ),
+        Index(
+            'idx_utilization_comment_approved_utilization_id',
+            utilization_id,
+            postgresql_where=approval,
+        ),
+        Index('idx_utilization_comment_created', created),
+    )
+
 
 class UtilizationSummary(Base):
     __tablename__ = 'utilization_summary'
@@ -81,3 +112,5 @@ class UtilizationSummary(Base):
     updated = Column(TIMESTAMP)
 
     resource = relationship(Resource)
+
+    __table_args__ = (Index('idx_utilization_summary_resource_id', resource_id),)
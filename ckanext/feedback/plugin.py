@@ -2,22 +2,36 @@ from ckan import plugins
 from ckan.common import config
 from ckan.lib.plugins import DefaultTranslation
 from ckan.plugins import toolkit
+from flask import Flask, request
 
 from ckanext.feedback.command import feedback
+from ckanext.feedback.logic import action, auth
+from ckanext.feedback.models.session import session
+from ckanext.feedback.services.common import cache, instrumentation, memo
+from ckanext.feedback.services.common import stats as stats_service
+from ckanext.feedback.services.download import dedup as download_dedup_service
+from ckanext.feedback.services.download import queue as download_queue_service
 from ckanext.feedback.services.download import summary as download_summary_service
 from ckanext.feedback.services.resource import comment as comment_service
 from ckanext.feedback.services.resource import summary as resource_summary_service
 from ckanext.feedback.services.utilization import summary as utilization_summary_service
 from ckanext.feedback.views import download, management, resource, utilization
 
+# The actions whose responses are conditional on their ETag
+stats_actions = ['feedback_stats_show', 'feedback_stats_list']
+
 
 class FeedbackPlugin(plugins.SingletonPlugin, DefaultTranslation):
     # Declare class implements
     plugins.implements(plugins.IConfigurer)
+    plugins.implements(plugins.IConfigurable)
     plugins.implements(plugins.IClick)
     plugins.implements(plugins.IBlueprint)
     plugins.implements(plugins.ITemplateHelpers)
     plugins.implements(plugins.ITranslation)
+    plugins.implements(plugins.IMiddleware, inherit=True)
+    plugins.implements(plugins.IActions)
+    plugins.implements(plugins.IAuthFunctions)
 
     # IConfigurer
 
@@ -29,6 +43,57 @@ class FeedbackPlugin(plugins.SingletonPlugin, DefaultTranslation):
         toolkit.add_public_directory(config, 'public')
         toolkit.add_resource('assets', 'feedback')
 
+    # IConfigurable
+
+    def configure(self, config):
+        # Fail the startup on invalid settings instead of the requests using them
+        cache.validate_config()
+        download_queue_service.validate_config()
+        download_dedup_service.validate_config()
+
+    # IMiddleware
+
+    def make_middleware(self, app, config):
+        if isinstance(app, Flask):
+            app.teardown_appcontext(self.remove_session)
+            app.after_request(self.make_stats_conditional)
+            if instrumentation.is_enabled():
+                instrumentation.enable(app)
+        return app
+
+    # Discard the session of the request so that the next request
+    # on this thread does not reuse its identity map and transaction
+    def remove_session(self, exception=None):
+        session.remove()
+
+    # Let the clients polling the feedback statistics skip unchanged responses
+    # with If-None-Match
+    def make_stats_conditional(self, response):
+        if (
+            request.endpoint == 'api.action'
+            and (request.view_args or {}).get('logic_function') in stats_actions
+            and response.status_code == 200
+        ):
+            response.add_etag()
+            response.make_conditional(request)
+        return response
+
+    # IActions
+
+    def get_actions(self):
+        return {
+            'feedback_stats_show': action.feedback_stats_show,
+            'feedback_stats_list': action.feedback_stats_list,
+        }
+
+    # IAuthFunctions
+
+    def get_auth_functions(self):
+        return {
+            'feedback_stats_show': auth.feedback_stats_show,
+            'feedback_stats_list': auth.feedback_stats_list,
+        }
+
     # IClick
 
     def get_commands(self):
@@ -72,7 +137,7 @@ class FeedbackPlugin(plugins.SingletonPlugin, DefaultTranslation):
     # ITemplateHelpers
 
     def get_helpers(self):
-        return {
+        helpers = {
             'is_enabled_downloads': self.is_enabled_downloads,
             'is_enabled_resources': self.is_enabled_resources,
             'is_enabled_utilizations': self.is_enabled_utilizations,
@@ -81,6 +146,12 @@ class FeedbackPlugin(plugins.SingletonPlugin, DefaultTranslation):
             ),
             'get_resource_downloads': download_summary_service.get_resource_downloads,
             'get_package_downloads': download_summary_service.get_package_downloads,
+            'get_resource_recent_downloads': (
+                download_summary_service.get_resource_recent_downloads
+            ),
+            'get_package_recent_downloads': (
+                download_summary_service.get_package_recent_downloads
+            ),
             'get_resource_utilizations': (
                 utilization_summary_service.get_resource_utilizations
             ),
@@ -98,4 +169,12 @@ class FeedbackPlugin(plugins.SingletonPlugin, DefaultTranslation):
             'get_package_comments': resource_summary_service.get_package_comments,
             'get_resource_rating': resource_summary_service.get_resource_rating,
             'get_package_rating': resource_summary_service.get_package_rating,
+            'get_packages_feedback_stats': stats_service.get_packages_feedback_stats,
+        }
+        # Memoize the helpers so that repeated calls while rendering a page
+        # do not query the database again
+        helpers = {
+            name: memo.request_memoize(helper) for name, helper in helpers.items()
         }
+        helpers['get_feedback_memo_stats'] = memo.get_memo_stats
+        return helpers
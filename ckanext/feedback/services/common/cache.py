@@ -0,0 +1,209 @@
+import functools
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from decimal import Decimal
+
+from ckan.common import config
+from ckan.lib.redis import connect_to_redis
+from ckan.plugins import toolkit
+from redis.exceptions import RedisError
+from sqlalchemy import event
+
+from ckanext.feedback.models.session import session
+
+log = logging.getLogger(__name__)
+
+MISSING = object()
+
+_cache = None
+_cache_lock = threading.Lock()
+
+cache_backends = ['none', 'memory', 'redis']
+
+# The names of the cached getters of each kind of entity, used to invalidate
+# all cached values of a package or resource at once
+_cached_getters = {'package': set(), 'resource': set()}
+
+
+# Keep the values in this process, evicting the least recently used ones
+class LRUCache:
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return MISSING
+            value, expires = entry
+            if expires <= time.monotonic():
+                del self._entries[key]
+                return MISSING
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+
+# Encode the cached value as JSON, keeping the Decimal ratings as Decimal
+# The values are never pickled, since anyone who can write to Redis could then
+# run code in the CKAN processes
+def dumps(value):
+    def encode_decimal(o):
+        if isinstance(o, Decimal):
+            return {'__decimal__': str(o)}
+        raise TypeError(f'{type(o).__name__} cannot be cached')
+
+    return json.dumps(value, default=encode_decimal)
+
+
+def loads(data):
+    def decode_decimal(o):
+        if set(o) == {'__decimal__'}:
+            return Decimal(o['__decimal__'])
+        return o
+
+    return json.loads(data, object_hook=decode_decimal)
+
+
+# Share the values between the processes and hosts through Redis
+# Errors are logged and treated as misses so that pages still render
+class RedisCache:
+    def __init__(self, client, ttl, prefix='ckanext-feedback:'):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        try:
+            value = self.client.get(self.prefix + key)
+        except RedisError as e:
+            log.warning('Failed to get %s from the feedback cache: %s', key, e)
+            return MISSING
+        if value is None:
+            return MISSING
+        return loads(value)
+
+    def set(self, key, value):
+        try:
+            self.client.set(self.prefix + key, dumps(value), ex=self.ttl)
+        except RedisError as e:
+            log.warning('Failed to set %s to the feedback cache: %s', key, e)
+
+    def delete(self, keys):
+        if not keys:
+            return
+        try:
+            self.client.delete(*[self.prefix + key for key in keys])
+        except RedisError as e:
+            log.warning('Failed to delete keys from the feedback cache: %s', e)
+
+
+# Check the cache settings when the plugin is loaded, so that a wrong backend
+# fails the startup instead of every request
+def validate_config():
+    backend = config.get('ckan.feedback.cache.backend', 'none')
+    if backend not in cache_backends:
+        raise ValueError(f'Unknown feedback cache backend: {backend}')
+
+
+# Get the cache of this process, or None if caching is disabled
+def get_cache():
+    global _cache
+    backend = config.get('ckan.feedback.cache.backend', 'none')
+    if backend == 'none':
+        return None
+
+    with _cache_lock:
+        if _cache is None:
+            ttl = toolkit.asint(config.get('ckan.feedback.cache.ttl', 60))
+            if backend == 'memory':
+                # Invalidations reach only this process, so the memory backend
+                # is for deployments with a single worker process
+                _cache = LRUCache(
+                    max_entries=toolkit.asint(
+                        config.get('ckan.feedback.cache.max_entries', 10000)
+                    ),
+                    ttl=ttl,
+                )
+            elif backend == 'redis':
+                _cache = RedisCache(connect_to_redis(), ttl=ttl)
+            else:
+                raise ValueError(f'Unknown feedback cache backend: {backend}')
+    return _cache
+
+
+def make_key(kind, entity_id, name):
+    return f'{kind}:{entity_id}:{name}'
+
+
+# Cache the results of the getter of a package or resource by its id
+# kind: 'package' or 'resource', the kind of entity the first argument is an id of
+def cached(kind):
+    def decorator(func):
+        _cached_getters[kind].add(func.__name__)
+
+        @functools.wraps(func)
+        def wrapper(entity_id, *args, **kwargs):
+            cache = get_cache()
+            if cache is None or args or kwargs:
+                return func(entity_id, *args, **kwargs)
+            key = make_key(kind, entity_id, func.__name__)
+            value = cache.get(key)
+            if value is MISSING:
+                value = func(entity_id)
+                cache.set(key, value)
+            return value
+
+        return wrapper
+
+    return decorator
+
+
+# Invalidate the cached values of the packages or resources
+# The values are deleted after the transaction is committed, so that no other
+# request caches the values before the commit again
+def invalidate(kind, entity_ids):
+    if get_cache() is None:
+        return
+    invalidations = session.info.setdefault('feedback_cache_invalidations', set())
+    invalidations.update((kind, entity_id) for entity_id in entity_ids)
+
+
+def delete_entries(invalidations):
+    cache = get_cache()
+    if cache is None or not invalidations:
+        return
+    cache.delete(
+        [
+            make_key(kind, entity_id, name)
+            for kind, entity_id in invalidations
+            for name in _cached_getters[kind]
+        ]
+    )
+
+
+@event.listens_for(session, 'after_commit')
+def _after_commit(committed_session):
+    delete_entries(committed_session.info.pop('feedback_cache_invalidations', None))
+
+
+@event.listens_for(session, 'after_rollback')
+def _after_rollback(rolled_back_session):
+    rolled_back_session.info.pop('feedback_cache_invalidations', None)
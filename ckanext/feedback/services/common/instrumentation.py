@@ -0,0 +1,136 @@
+import sys
+import threading
+import time
+from collections import defaultdict
+
+from ckan.common import config
+from ckan.plugins import toolkit
+from flask import g, has_app_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+SERVICES_PACKAGE = 'ckanext.feedback.services.'
+
+_enabled = False
+_lock = threading.Lock()
+
+# The numbers of queries and their seconds per service function in this process
+_totals = defaultdict(lambda: [0, 0.0])
+
+
+# Enable/disable the query instrumentation
+def is_enabled():
+    return toolkit.asbool(config.get('ckan.feedback.instrumentation.enable', False))
+
+
+# Get the name of the innermost feedback service function in the call stack,
+# such as 'resource.summary.get_resource_comments', or None
+def get_service_function():
+    frame = sys._getframe(1)
+    while frame is not None:
+        module = frame.f_globals.get('__name__', '')
+        if (
+            module.startswith(SERVICES_PACKAGE)
+            and module != __name__
+            and not frame.f_code.co_name.startswith('<')
+        ):
+            return f'{module[len(SERVICES_PACKAGE):]}.{frame.f_code.co_name}'
+        frame = frame.f_back
+    return None
+
+
+# The start is kept on the execution context of the query, so that it is
+# discarded with the context when the query fails
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._feedback_query_start = (get_service_function(), time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, '_feedback_query_start', None)
+    if start is None:
+        # The query started before the instrumentation was enabled
+        return
+    function, start = start
+    if function is not None:
+        record_query(function, time.perf_counter() - start)
+
+
+def record_query(function, seconds):
+    with _lock:
+        totals = _totals[function]
+        totals[0] += 1
+        totals[1] += seconds
+    if has_app_context():
+        stats = g.setdefault('feedback_query_stats', {})
+        request_totals = stats.setdefault(function, [0, 0.0])
+        request_totals[0] += 1
+        request_totals[1] += seconds
+
+
+# Start timing the queries of all engines and add the totals of each request to
+# its response
+def enable(app):
+    global _enabled
+    if not _enabled:
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        _enabled = True
+    app.after_request(add_server_timing)
+
+
+def disable():
+    global _enabled
+    if _enabled:
+        event.remove(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.remove(Engine, 'after_cursor_execute', _after_cursor_execute)
+        _enabled = False
+
+
+# Get the numbers of queries and their seconds per service function in the
+# current request
+def get_request_stats():
+    if not has_app_context():
+        return {}
+    return {
+        function: {'queries': queries, 'seconds': seconds}
+        for function, (queries, seconds) in g.get('feedback_query_stats', {}).items()
+    }
+
+
+# Show the number and time of the feedback queries in the browser's developer
+# tools with the Server-Timing header
+def add_server_timing(response):
+    stats = get_request_stats().values()
+    queries = sum(s['queries'] for s in stats)
+    milliseconds = sum(s['seconds'] for s in stats) * 1000
+    response.headers.add(
+        'Server-Timing',
+        f'feedback-db;desc="{queries} feedback queries";dur={milliseconds:.3f}',
+    )
+    return response
+
+
+# Get the totals of this process in the Prometheus text format
+def get_metrics_text():
+    with _lock:
+        totals = sorted((function, list(t)) for function, t in _totals.items())
+    lines = [
+        '# HELP ckanext_feedback_queries_total'
+        ' The number of SQL queries issued by the feedback service function.',
+        '# TYPE ckanext_feedback_queries_total counter',
+    ]
+    lines += [
+        f'ckanext_feedback_queries_total{{function="{function}"}} {queries}'
+        for function, (queries, _) in totals
+    ]
+    lines += [
+        '# HELP ckanext_feedback_query_seconds_total'
+        ' The time spent on the SQL queries of the feedback service function.',
+        '# TYPE ckanext_feedback_query_seconds_total counter',
+    ]
+    lines += [
+        f'ckanext_feedback_query_seconds_total{{function="{function}"}} {seconds}'
+        for function, (_, seconds) in totals
+    ]
+    return '\n'.join(lines) + '\n'
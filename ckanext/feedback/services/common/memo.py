@@ -0,0 +1,43 @@
+import functools
+
+from flask import g, has_app_context
+
+
+def _make_key(func, args, kwargs):
+    args = tuple(tuple(arg) if isinstance(arg, list) else arg for arg in args)
+    return (func, args, tuple(sorted(kwargs.items())))
+
+
+def _get_stats():
+    return g.setdefault('feedback_memo_stats', {'hits': 0, 'misses': 0})
+
+
+# Memoize the results of the function in flask.g for the current request
+def request_memoize(func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not has_app_context():
+            return func(*args, **kwargs)
+        key = _make_key(func, args, kwargs)
+        try:
+            hash(key)
+        except TypeError:
+            return func(*args, **kwargs)
+
+        memo = g.setdefault('feedback_memo', {})
+        stats = _get_stats()
+        if key in memo:
+            stats['hits'] += 1
+            return memo[key]
+        stats['misses'] += 1
+        result = memo[key] = func(*args, **kwargs)
+        return result
+
+    return wrapper
+
+
+# Get the number of memo hits and misses in the current request
+def get_memo_stats():
+    if not has_app_context():
+        return {'hits': 0, 'misses': 0}
+    return dict(_get_stats())
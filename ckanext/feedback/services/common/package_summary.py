@@ -0,0 +1,63 @@
+from datetime import datetime
+
+from ckan.model import Resource
+from sqlalchemy.dialects.postgresql import insert
+
+from ckanext.feedback.models.package import PackageFeedbackSummary
+from ckanext.feedback.models.session import session
+from ckanext.feedback.services.common import cache
+
+
+# Get the package summaries of the target packages
+def get_package_summaries(package_ids):
+    if not package_ids:
+        return {}
+    rows = (
+        session.query(PackageFeedbackSummary)
+        .filter(PackageFeedbackSummary.package_id.in_(list(package_ids)))
+        .all()
+    )
+    return {row.package_id: row for row in rows}
+
+
+# Get the ids of the packages of the target resources
+def get_package_ids(resource_ids):
+    if not resource_ids:
+        return []
+    rows = (
+        session.query(Resource.package_id)
+        .filter(Resource.id.in_(list(resource_ids)))
+        .distinct()
+    )
+    return [row.package_id for row in rows]
+
+
+# Write the per-package aggregate into package_feedback_summary with one upsert
+# The aggregate selects package_id and the columns maintained by one module,
+# so that the other columns of existing rows are left as they are
+def upsert_package_summaries(connection, aggregate):
+    columns = [column.key for column in aggregate.c]
+    insert_stmt = insert(PackageFeedbackSummary).from_select(columns, aggregate)
+    set_ = {
+        name: getattr(insert_stmt.excluded, name)
+        for name in columns
+        if name != 'package_id'
+    }
+    set_['updated'] = datetime.now()
+    upsert_stmt = insert_stmt.on_conflict_do_update(
+        index_elements=[PackageFeedbackSummary.package_id], set_=set_
+    )
+    connection.execute(upsert_stmt)
+
+
+# Recalculate the package summaries of the packages of the target resources
+# The resource summaries have changed, so their cached values are invalidated too
+def refresh_package_summaries(aggregate, resource_ids):
+    cache.invalidate('resource', resource_ids)
+    package_ids = get_package_ids(resource_ids)
+    cache.invalidate('package', package_ids)
+    if not package_ids:
+        return
+    upsert_package_summaries(
+        session, aggregate.where(Resource.package_id.in_(package_ids))
+    )
@@ -0,0 +1,83 @@
+from ckan.common import config
+from ckan.plugins import toolkit
+
+from ckanext.feedback.services.common import package_summary as package_summary_service
+from ckanext.feedback.services.download import summary as download_summary_service
+from ckanext.feedback.services.resource import summary as resource_summary_service
+from ckanext.feedback.services.utilization import summary as utilization_summary_service
+
+
+def get_empty_stats(ids):
+    return {
+        id: {
+            'downloads': 0,
+            'utilizations': 0,
+            'comments': 0,
+            'rating': 0,
+            'issue_resolutions': 0,
+        }
+        for id in ids
+    }
+
+
+def is_enabled(module):
+    return toolkit.asbool(config.get(f'ckan.feedback.{module}.enable', True))
+
+
+# Get all feedback metrics of the target packages with a single query
+def get_packages_feedback_stats(package_ids):
+    package_ids = list(dict.fromkeys(package_ids))
+    stats = get_empty_stats(package_ids)
+    if not package_ids:
+        return stats
+
+    # All metrics of a package are read from its single package summary row
+    summaries = package_summary_service.get_package_summaries(package_ids)
+    downloads_enabled = is_enabled('downloads')
+    resources_enabled = is_enabled('resources')
+    utilizations_enabled = is_enabled('utilizations')
+    for package_id, summary in summaries.items():
+        if downloads_enabled:
+            stats[package_id]['downloads'] = summary.download or 0
+        if resources_enabled:
+            stats[package_id]['comments'] = summary.comment or 0
+            stats[package_id]['rating'] = summary.rating or 0
+        if utilizations_enabled:
+            stats[package_id]['utilizations'] = summary.utilization or 0
+            stats[package_id]['issue_resolutions'] = summary.issue_resolution or 0
+
+    return stats
+
+
+# Get all feedback metrics of the target resources with grouped queries
+def get_resources_feedback_stats(resource_ids):
+    resource_ids = list(dict.fromkeys(resource_ids))
+    stats = get_empty_stats(resource_ids)
+    if not resource_ids:
+        return stats
+
+    if is_enabled('downloads'):
+        downloads = download_summary_service.get_resources_downloads(resource_ids)
+        for resource_id, count in downloads.items():
+            stats[resource_id]['downloads'] = count
+
+    if is_enabled('resources'):
+        comments = resource_summary_service.get_resources_comments_and_rating(
+            resource_ids
+        )
+        for resource_id, row in comments.items():
+            stats[resource_id].update(row)
+
+    if is_enabled('utilizations'):
+        utilizations = utilization_summary_service.get_resources_utilizations(
+            resource_ids
+        )
+        for resource_id, count in utilizations.items():
+            stats[resource_id]['utilizations'] = count
+        issue_resolutions = utilization_summary_service.get_resources_issue_resolutions(
+            resource_ids
+        )
+        for resource_id, count in issue_resolutions.items():
+            stats[resource_id]['issue_resolutions'] = count
+
+    return stats
@@ -0,0 +1,43 @@
+import math
+import uuid
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy import and_, exists, select
+
+from ckanext.feedback.models.session import session
+
+# A value of a summary that differs from the value recalculated from the feedback
+# key: the resource or utilization id of the summary
+Drift = namedtuple('Drift', ['table', 'key', 'column', 'actual', 'expected'])
+
+
+# Create the summaries of the resources or utilizations that have none yet
+# key: the name of the column of the summary model holding the id
+# keys: the column selecting the ids that should have a summary
+def create_missing_summaries(model, key, keys, *criteria):
+    query = (
+        select([keys])
+        .where(and_(~exists().where(getattr(model, key) == keys), *criteria))
+        .distinct()
+    )
+    now = datetime.now()
+    missing = [
+        {'id': str(uuid.uuid4()), key: row[0], 'created': now}
+        for row in session.execute(query)
+    ]
+    if missing:
+        session.execute(model.__table__.insert(), missing)
+    return len(missing)
+
+
+# Compare the stored values with the recalculated ones
+# A missing value is treated as 0, since the getters return 0 for missing summaries
+def get_drifts(table, column, actual, expected):
+    drifts = []
+    for key in sorted(set(actual) | set(expected)):
+        actual_value = actual.get(key) or 0
+        expected_value = expected.get(key) or 0
+        if not math.isclose(actual_value, expected_value):
+            drifts.append(Drift(table, key, column, actual_value, expected_value))
+    return drifts
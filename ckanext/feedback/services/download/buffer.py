@@ -0,0 +1,140 @@
+import atexit
+import logging
+import threading
+import time
+from collections import Counter
+
+from ckan.common import config
+from ckan.plugins import toolkit
+
+from ckanext.feedback.models.session import session
+from ckanext.feedback.services.download import summary as summary_service
+
+log = logging.getLogger(__name__)
+
+_download_buffer = None
+_download_buffer_lock = threading.Lock()
+
+
+# The longest wait before retrying a failed flush, in seconds
+MAX_RETRY_INTERVAL = 300
+
+
+# Aggregate download counts in memory and write them to the database in batches
+# At most max_pending counts are kept, also while the database is failing, so
+# that a crash loses at most max_pending downloads
+class DownloadBuffer:
+    def __init__(self, max_pending, flush_interval):
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+        self._counts = Counter()
+        self._pending = 0
+        self._dropped = 0
+        self._last_flush = time.monotonic()
+        # After a failed flush, no flush is tried again until _retry_at
+        self._retry_interval = 0
+        self._retry_at = 0
+        self._lock = threading.Lock()
+
+    def add(self, resource_id):
+        with self._lock:
+            now = time.monotonic()
+            if self._pending >= self.max_pending and now < self._retry_at:
+                # The flushes are failing, so drop the count instead of growing
+                self._dropped += 1
+                return
+            self._counts[resource_id] += 1
+            self._pending += 1
+            should_flush = self._is_due(now)
+        if should_flush:
+            self.flush()
+
+    def _is_due(self, now):
+        return now >= self._retry_at and (
+            self._pending >= self.max_pending
+            or now - self._last_flush >= self.flush_interval
+        )
+
+    # Flush if the buffer is full or flush_interval has passed
+    def flush_if_due(self):
+        with self._lock:
+            should_flush = self._pending and self._is_due(time.monotonic())
+        if should_flush:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+            pending, self._pending = self._pending, 0
+            dropped, self._dropped = self._dropped, 0
+            self._last_flush = time.monotonic()
+        if dropped:
+            log.error('Dropped %d downloads over the buffer limit.', dropped)
+        if not counts:
+            return
+
+        try:
+            self.write(counts)
+        except Exception:
+            session.rollback()
+            log.exception('Failed to flush %d buffered downloads.', pending)
+            with self._lock:
+                self._merge(counts)
+                self._retry_interval = min(
+                    max(self._retry_interval * 2, self.flush_interval, 1),
+                    MAX_RETRY_INTERVAL,
+                )
+                self._retry_at = time.monotonic() + self._retry_interval
+        else:
+            with self._lock:
+                self._retry_interval = 0
+                self._retry_at = 0
+
+    # Keep the counts of a failed flush for the next one, up to max_pending
+    def _merge(self, counts):
+        for resource_id, count in counts.items():
+            kept = min(count, self.max_pending - self._pending)
+            if kept > 0:
+                self._counts[resource_id] += kept
+                self._pending += kept
+            self._dropped += count - max(kept, 0)
+
+    def write(self, counts):
+        summary_service.increment_existing_resources_downloads(counts)
+
+
+# Flush the buffer periodically in a daemon thread of the worker, so that
+# flush_interval is kept when no more downloads arrive
+def run_flush_thread(download_buffer):
+    while True:
+        time.sleep(download_buffer.flush_interval)
+        try:
+            download_buffer.flush_if_due()
+        except Exception:
+            log.exception('Failed to flush the buffered downloads.')
+        finally:
+            session.remove()
+
+
+# Get the download buffer of this process, or None if buffering is disabled
+def get_download_buffer():
+    global _download_buffer
+    if not toolkit.asbool(config.get('ckan.feedback.downloads.buffer.enable', False)):
+        return None
+
+    with _download_buffer_lock:
+        if _download_buffer is None:
+            _download_buffer = DownloadBuffer(
+                max_pending=toolkit.asint(
+                    config.get('ckan.feedback.downloads.buffer.max_pending', 100)
+                ),
+                flush_interval=toolkit.asint(
+                    config.get('ckan.feedback.downloads.buffer.flush_interval', 10)
+                ),
+            )
+            threading.Thread(
+                target=run_flush_thread, args=(_download_buffer,), daemon=True
+            ).start()
+            # Write the remaining counts when the worker shuts down
+            atexit.register(_download_buffer.flush)
+    return _download_buffer
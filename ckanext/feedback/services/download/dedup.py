@@ -0,0 +1,136 @@
+import hashlib
+import math
+import threading
+import time
+
+from ckan.common import config
+from ckan.plugins import toolkit
+from flask import request
+
+_download_deduplicator = None
+_download_deduplicator_lock = threading.Lock()
+
+
+# Remember the keys added to it in a fixed number of bits
+# A key that was never added is reported as seen with a probability of about
+# error_rate. When capacity keys have been added, the bits are kept as the
+# previous generation and a new generation is started, so that the error rate
+# stays bounded and the oldest keys are forgotten instead.
+# A key is checked against both generations, so each of them is sized for half
+# of error_rate.
+class RotatingBloomFilter:
+    def __init__(self, capacity, error_rate):
+        if capacity < 1:
+            raise ValueError('The capacity of the Bloom filter must be positive')
+        if not 0 < error_rate < 1:
+            raise ValueError(
+                'The error rate of the Bloom filter must be between 0 and 1'
+            )
+        self.capacity = capacity
+        generation_error_rate = error_rate / 2
+        self.size = math.ceil(
+            -capacity * math.log(generation_error_rate) / math.log(2) ** 2
+        )
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.clear()
+
+    def clear(self):
+        self._current = bytearray(math.ceil(self.size / 8))
+        self._previous = None
+        self._count = 0
+
+    def _get_positions(self, key):
+        # Derive all the hashes from two with double hashing
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    @staticmethod
+    def _contains(bits, positions):
+        return all(bits[p >> 3] & (1 << (p & 7)) for p in positions)
+
+    # Add the key, and return True if it had not been added before
+    def add(self, key):
+        positions = self._get_positions(key)
+        if self._contains(self._current, positions) or (
+            self._previous is not None and self._contains(self._previous, positions)
+        ):
+            return False
+        if self._count >= self.capacity:
+            self._previous = self._current
+            self._current = bytearray(len(self._previous))
+            self._count = 0
+        for p in positions:
+            self._current[p >> 3] |= 1 << (p & 7)
+        self._count += 1
+        return True
+
+
+# Count the downloads of a resource by a client once per time window
+class DownloadDeduplicator:
+    def __init__(self, window, capacity, error_rate):
+        if window < 1:
+            raise ValueError(
+                'The window of the download deduplication must be positive'
+            )
+        self.window = window
+        self._filter = RotatingBloomFilter(capacity, error_rate)
+        self._window_index = None
+        self._lock = threading.Lock()
+
+    # Return True if the client has not downloaded the resource in this window
+    def is_first(self, fingerprint, resource_id, now=None):
+        window_index = int((time.time() if now is None else now) // self.window)
+        with self._lock:
+            # The keys of the past windows never match again
+            if window_index != self._window_index:
+                self._filter.clear()
+                self._window_index = window_index
+            return self._filter.add(f'{fingerprint}\n{resource_id}\n{window_index}')
+
+
+def is_enabled():
+    return toolkit.asbool(config.get('ckan.feedback.downloads.dedup.enable', False))
+
+
+def create_download_deduplicator():
+    return DownloadDeduplicator(
+        window=toolkit.asint(config.get('ckan.feedback.downloads.dedup.window', 3600)),
+        capacity=toolkit.asint(
+            config.get('ckan.feedback.downloads.dedup.capacity', 100000)
+        ),
+        error_rate=float(config.get('ckan.feedback.downloads.dedup.error_rate', 0.001)),
+    )
+
+
+# Check the deduplication settings when the plugin is loaded, so that invalid
+# values fail the startup instead of every download
+def validate_config():
+    if is_enabled():
+        create_download_deduplicator()
+
+
+# Get the download deduplicator of this process, or None if it is disabled
+def get_download_deduplicator():
+    global _download_deduplicator
+    if not is_enabled():
+        return None
+
+    with _download_deduplicator_lock:
+        if _download_deduplicator is None:
+            _download_deduplicator = create_download_deduplicator()
+    return _download_deduplicator
+
+
+# Identify the client of the request by its address and user agent
+def get_client_fingerprint():
+    return f'{request.remote_addr}\n{request.user_agent.string}'
+
+
+# Return True if the download of the current request should be counted
+def is_first_download(resource_id):
+    deduplicator = get_download_deduplicator()
+    if deduplicator is None:
+        return True
+    return deduplicator.is_first(get_client_fingerprint(), resource_id)
@@ -0,0 +1,323 @@
+import atexit
+import logging
+import queue
+import socket
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+from ckan.common import config
+from ckan.lib.redis import connect_to_redis
+from ckan.plugins import toolkit
+from redis.exceptions import RedisError
+
+from ckanext.feedback.models.session import session
+from ckanext.feedback.services.download import summary as summary_service
+
+log = logging.getLogger(__name__)
+
+_download_queue = None
+_download_queue_lock = threading.Lock()
+
+queue_backends = ['none', 'memory', 'sqlite', 'redis']
+
+
+# Keep the download events in this process
+# Only a worker thread of the same process can drain them
+class MemoryQueue:
+    def __init__(self):
+        self._queue = queue.Queue()
+
+    def put(self, resource_ids):
+        for resource_id in resource_ids:
+            self._queue.put_nowait(resource_id)
+
+    def pop(self, max_items):
+        resource_ids = []
+        while len(resource_ids) < max_items:
+            try:
+                resource_ids.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return resource_ids
+
+    def ack(self, resource_ids):
+        # The popped events are already removed
+        pass
+
+
+# Get the default id of the worker popping the events of a shared queue
+# The id must differ between the workers sharing a queue and stay the same when
+# a worker is restarted, so that it recovers only its own events
+def get_default_worker_id():
+    return socket.gethostname()
+
+
+# Spool the download events to a SQLite file shared by the processes of a host
+# The popped events are claimed by the worker until they are acknowledged, so
+# that the events of a crashed worker can be recovered
+class SQLiteQueue:
+    def __init__(self, path, worker_id=None):
+        self.path = path
+        self.worker_id = worker_id or get_default_worker_id()
+        self._claimed_ids = []
+        connection = self._connect()
+        try:
+            # Let the web workers append while the worker pops
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS download_event'
+                ' (id INTEGER PRIMARY KEY AUTOINCREMENT, resource_id TEXT NOT NULL,'
+                ' worker_id TEXT)'
+            )
+            columns = [
+                row[1]
+                for row in connection.execute('PRAGMA table_info(download_event)')
+            ]
+            # Spools created before the events were claimed have no worker_id
+            if 'worker_id' not in columns:
+                connection.execute(
+                    'ALTER TABLE download_event ADD COLUMN worker_id TEXT'
+                )
+            connection.execute(
+                'CREATE INDEX IF NOT EXISTS idx_download_event_worker_id'
+                ' ON download_event (worker_id, id)'
+            )
+        finally:
+            connection.close()
+
+    def _connect(self):
+        # Autocommit, so that the transactions are started explicitly
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def put(self, resource_ids):
+        connection = self._connect()
+        try:
+            connection.executemany(
+                'INSERT INTO download_event (resource_id) VALUES (?)',
+                [(resource_id,) for resource_id in resource_ids],
+            )
+        finally:
+            connection.close()
+
+    def pop(self, max_items):
+        connection = self._connect()
+        try:
+            # Take the write lock first, so that two workers never claim the
+            # same events
+            connection.execute('BEGIN IMMEDIATE')
+            rows = connection.execute(
+                'SELECT id, resource_id FROM download_event'
+                ' WHERE worker_id IS NULL ORDER BY id LIMIT ?',
+                (max_items,),
+            ).fetchall()
+            connection.executemany(
+                'UPDATE download_event SET worker_id = ? WHERE id = ?',
+                [(self.worker_id, event_id) for event_id, _ in rows],
+            )
+            connection.execute('COMMIT')
+        finally:
+            connection.close()
+        self._claimed_ids.extend(event_id for event_id, _ in rows)
+        return [resource_id for _, resource_id in rows]
+
+    # Delete the events claimed by the previous pops once they are applied
+    def ack(self, resource_ids):
+        if not self._claimed_ids:
+            return
+        connection = self._connect()
+        try:
+            connection.execute('BEGIN IMMEDIATE')
+            connection.executemany(
+                'DELETE FROM download_event WHERE id = ?',
+                [(event_id,) for event_id in self._claimed_ids],
+            )
+            connection.execute('COMMIT')
+        finally:
+            connection.close()
+        self._claimed_ids = []
+
+    # Release the events left claimed by this worker when it crashed
+    # Return the number of events recovered
+    def recover(self):
+        connection = self._connect()
+        try:
+            count = connection.execute(
+                'UPDATE download_event SET worker_id = NULL WHERE worker_id = ?',
+                (self.worker_id,),
+            ).rowcount
+        finally:
+            connection.close()
+        self._claimed_ids = []
+        return count
+
+
+# Push the download events to a Redis list shared by the processes and hosts
+# The popped events are moved to a processing list of the worker until they are
+# acknowledged, so that the events of a crashed worker can be recovered without
+# touching the events of the other workers
+class RedisQueue:
+    def __init__(self, client, key='ckanext-feedback:download-events', worker_id=None):
+        self.client = client
+        self.key = key
+        self.worker_id = worker_id or get_default_worker_id()
+        self.processing_key = f'{key}:processing:{self.worker_id}'
+
+    def put(self, resource_ids):
+        # The oldest events are at the tail, where RPOPLPUSH pops them
+        self.client.lpush(self.key, *resource_ids)
+
+    def pop(self, max_items):
+        # Each move is atomic, so an event is always in one of the two lists
+        pipeline = self.client.pipeline(transaction=False)
+        for _ in range(max_items):
+            pipeline.rpoplpush(self.key, self.processing_key)
+        return [
+            resource_id.decode()
+            for resource_id in pipeline.execute()
+            if resource_id is not None
+        ]
+
+    # Remove the applied events from the processing list of this worker
+    def ack(self, resource_ids):
+        pipeline = self.client.pipeline(transaction=False)
+        for resource_id, count in Counter(resource_ids).items():
+            pipeline.lrem(self.processing_key, count, resource_id)
+        pipeline.execute()
+
+    # Put the events left in the processing list by this worker when it crashed
+    # back
+    # Return the number of events recovered
+    def recover(self):
+        count = 0
+        while self.client.rpoplpush(self.processing_key, self.key) is not None:
+            count += 1
+        return count
+
+
+# Apply up to batch_size events of the queue as one aggregated upsert
+# The events are put back if the upsert fails, so that no download is lost
+# Return the number of events applied
+def drain_batch(download_queue, batch_size):
+    resource_ids = download_queue.pop(batch_size)
+    if not resource_ids:
+        return 0
+    try:
+        summary_service.increment_existing_resources_downloads(Counter(resource_ids))
+    except Exception:
+        session.rollback()
+        download_queue.put(resource_ids)
+        download_queue.ack(resource_ids)
+        raise
+    download_queue.ack(resource_ids)
+    return len(resource_ids)
+
+
+# Apply the events of the queue until it is empty
+# Return the number of events applied
+def drain(download_queue, batch_size):
+    total = 0
+    while True:
+        count = drain_batch(download_queue, batch_size)
+        if not count:
+            return total
+        total += count
+
+
+# Drain the in-process queue periodically in a daemon thread of the worker
+def run_drain_thread(download_queue, batch_size, interval):
+    while True:
+        time.sleep(interval)
+        try:
+            drain(download_queue, batch_size)
+        except Exception:
+            log.exception('Failed to apply the queued downloads.')
+        finally:
+            session.remove()
+
+
+def get_sqlite_path():
+    path = config.get('ckan.feedback.downloads.queue.sqlite_path', '')
+    if not path:
+        raise ValueError(
+            'ckan.feedback.downloads.queue.sqlite_path must be set for the'
+            ' sqlite download queue'
+        )
+    return path
+
+
+# Check the queue settings when the plugin is loaded, so that a wrong backend
+# fails the startup instead of every download
+def validate_config():
+    backend = config.get('ckan.feedback.downloads.queue.backend', 'none')
+    if backend not in queue_backends:
+        raise ValueError(f'Unknown feedback download queue backend: {backend}')
+    if backend == 'sqlite':
+        get_sqlite_path()
+
+
+# Get the download queue of this process, or None if queueing is disabled
+def get_download_queue():
+    global _download_queue
+    backend = config.get('ckan.feedback.downloads.queue.backend', 'none')
+    if backend == 'none':
+        return None
+
+    with _download_queue_lock:
+        if _download_queue is None:
+            if backend == 'memory':
+                download_queue = MemoryQueue()
+                batch_size = toolkit.asint(
+                    config.get('ckan.feedback.downloads.queue.batch_size', 1000)
+                )
+                threading.Thread(
+                    target=run_drain_thread,
+                    args=(
+                        download_queue,
+                        batch_size,
+                        toolkit.asint(
+                            config.get('ckan.feedback.downloads.queue.interval', 1)
+                        ),
+                    ),
+                    daemon=True,
+                ).start()
+                # Apply the remaining events when the worker shuts down
+                atexit.register(drain, download_queue, batch_size)
+                _download_queue = download_queue
+            elif backend == 'sqlite':
+                _download_queue = SQLiteQueue(get_sqlite_path())
+            elif backend == 'redis':
+                _download_queue = RedisQueue(connect_to_redis())
+            else:
+                raise ValueError(f'Unknown feedback download queue backend: {backend}')
+    return _download_queue
+
+
+# Get the queue shared with the feedback worker, popping the events as worker_id
+# The in-process queue is drained by the threads of the web workers instead
+def get_shared_download_queue(worker_id=None):
+    backend = config.get('ckan.feedback.downloads.queue.backend', 'none')
+    if backend == 'sqlite':
+        return SQLiteQueue(get_sqlite_path(), worker_id=worker_id)
+    if backend == 'redis':
+        return RedisQueue(connect_to_redis(), worker_id=worker_id)
+    raise ValueError(
+        'The feedback worker needs the sqlite or redis download queue backend,'
+        f' but ckan.feedback.downloads.queue.backend is {backend}'
+    )
+
+
+# Publish a download event to the queue
+# Return False if queueing is disabled or the event could not be queued, so that
+# the caller counts the download by itself
+def publish_download(resource_id):
+    try:
+        download_queue = get_download_queue()
+        if download_queue is None:
+            return False
+        download_queue.put([resource_id])
+    except (ValueError, RedisError, sqlite3.Error) as e:
+        log.warning('Failed to queue the download of %s: %s', resource_id, e)
+        return False
+    return True
@@ -1,26 +1,79 @@
 import datetime
 import logging
 import uuid
+from collections import Counter
 
 from ckan.model import Resource
-from sqlalchemy import func
+from sqlalchemy import Date, cast, func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import outerjoin
 
-from ckanext.feedback.models.download import DownloadSummary
+from ckanext.feedback.models.download import (
+    DownloadDaily,
+    DownloadMonthly,
+    DownloadSummary,
+)
+from ckanext.feedback.models.package import PackageFeedbackSummary
 from ckanext.feedback.models.session import session
+from ckanext.feedback.services.common import cache
+from ckanext.feedback.services.common import package_summary as package_summary_service
 
 log = logging.getLogger(__name__)
 
 
+@cache.cached('package')
 def get_package_downloads(package_id):
     count = (
-        session.query(func.sum(DownloadSummary.download))
-        .join(Resource)
-        .filter(Resource.package_id == package_id)
+        session.query(PackageFeedbackSummary.download)
+        .filter(PackageFeedbackSummary.package_id == package_id)
         .scalar()
     )
     return count or 0
 
 
+def get_packages_downloads(package_ids):
+    rows = (
+        session.query(
+            PackageFeedbackSummary.package_id, PackageFeedbackSummary.download
+        )
+        .filter(PackageFeedbackSummary.package_id.in_(package_ids))
+        .all()
+    )
+    return {package_id: count or 0 for package_id, count in rows}
+
+
+def get_resources_downloads(resource_ids):
+    rows = (
+        session.query(DownloadSummary.resource_id, DownloadSummary.download)
+        .filter(DownloadSummary.resource_id.in_(resource_ids))
+        .all()
+    )
+    return {resource_id: count or 0 for resource_id, count in rows}
+
+
+# Select the downloads of the resources summed up per package
+def get_package_downloads_aggregate():
+    return (
+        select(
+            [
+                Resource.package_id,
+                func.coalesce(func.sum(DownloadSummary.download), 0).label('download'),
+            ]
+        )
+        .select_from(outerjoin(Resource, DownloadSummary))
+        .group_by(Resource.package_id)
+    )
+
+
+# Recalculate the downloads of the packages of the target resources
+# Use this to repair the package summaries, since downloads add deltas to them
+def refresh_package_downloads(resource_ids):
+    package_summary_service.refresh_package_summaries(
+        get_package_downloads_aggregate(), resource_ids
+    )
+
+
+@cache.cached('resource')
 def get_resource_downloads(resource_id):
     count = (
         session.query(DownloadSummary.download)
@@ -30,22 +83,191 @@ def get_resource_downloads(resource_id):
     return count or 0
 
 
+# Get the first day of the window of the last days
+# The daily downloads of the months before it may have been compacted into
+# monthly rows, so the month containing it is counted as a whole
+def get_recent_since(days):
+    return datetime.date.today() - datetime.timedelta(days=days - 1)
+
+
+# Get downloads of the target package within the last days
+def get_package_recent_downloads(package_id, days=30):
+    since = get_recent_since(days)
+    daily = (
+        session.query(func.sum(DownloadDaily.download))
+        .join(Resource)
+        .filter(Resource.package_id == package_id, DownloadDaily.date >= since)
+        .scalar()
+    )
+    monthly = (
+        session.query(func.sum(DownloadMonthly.download))
+        .join(Resource)
+        .filter(
+            Resource.package_id == package_id,
+            DownloadMonthly.month >= since.replace(day=1),
+        )
+        .scalar()
+    )
+    return (daily or 0) + (monthly or 0)
+
+
+# Get downloads of the target resource within the last days
+def get_resource_recent_downloads(resource_id, days=30):
+    since = get_recent_since(days)
+    daily = (
+        session.query(func.sum(DownloadDaily.download))
+        .filter(DownloadDaily.resource_id == resource_id, DownloadDaily.date >= since)
+        .scalar()
+    )
+    monthly = (
+        session.query(func.sum(DownloadMonthly.download))
+        .filter(
+            DownloadMonthly.resource_id == resource_id,
+            DownloadMonthly.month >= since.replace(day=1),
+        )
+        .scalar()
+    )
+    return (daily or 0) + (monthly or 0)
+
+
 def increment_resource_downloads(resource_id):
-    download_summary = (
-        session.query(DownloadSummary)
-        .filter(DownloadSummary.resource_id == resource_id)
-        .first()
-    )
-    if download_summary is None:
-        download_summary = DownloadSummary(
-            id=str(uuid.uuid4()),
-            resource_id=resource_id,
-            download=1,
-            created=datetime.datetime.now(),
-            updated=datetime.datetime.now(),
+    increment_resources_downloads({resource_id: 1})
+
+
+# Add the download counts of multiple resources with a single upsert
+def increment_resources_downloads(resource_downloads):
+    if not resource_downloads:
+        return
+    # Upsert the rows in the order of their ids, so that concurrent flushes of
+    # other workers lock them in the same order and cannot deadlock
+    resource_downloads = dict(sorted(resource_downloads.items()))
+    now = datetime.datetime.now()
+    insert_stmt = insert(DownloadSummary).values(
+        [
+            {
+                'id': str(uuid.uuid4()),
+                'resource_id': resource_id,
+                'download': count,
+                'created': now,
+                'updated': now,
+            }
+            for resource_id, count in resource_downloads.items()
+        ]
+    )
+    # Count the downloads atomically in a single statement so that concurrent
+    # downloads neither lose increments nor create duplicate rows
+    upsert_stmt = insert_stmt.on_conflict_do_update(
+        index_elements=[DownloadSummary.resource_id],
+        set_={
+            'download': DownloadSummary.download + insert_stmt.excluded.download,
+            'updated': insert_stmt.excluded.updated,
+        },
+    )
+    session.execute(upsert_stmt)
+    cache.invalidate('resource', resource_downloads)
+
+    insert_stmt = insert(DownloadDaily).values(
+        [
+            {
+                'resource_id': resource_id,
+                'date': now.date(),
+                'download': count,
+            }
+            for resource_id, count in resource_downloads.items()
+        ]
+    )
+    upsert_stmt = insert_stmt.on_conflict_do_update(
+        index_elements=[DownloadDaily.resource_id, DownloadDaily.date],
+        set_={'download': DownloadDaily.download + insert_stmt.excluded.download},
+    )
+    session.execute(upsert_stmt)
+    # All downloads of a dataset update its package summary row, so it is
+    # updated last in the same transaction to hold its lock only until the commit
+    increment_packages_downloads(resource_downloads)
+    session.commit()
+
+
+# Add the download counts of the resources that exist
+# Unknown ids are skipped so that one invalid id does not fail the batch
+def increment_existing_resources_downloads(resource_downloads):
+    resource_ids = {
+        row.id
+        for row in session.query(Resource.id).filter(
+            Resource.id.in_(list(resource_downloads))
         )
-        session.add(download_summary)
-    else:
-        download_summary.download = download_summary.download + 1
-        download_summary.updated = datetime.datetime.now()
+    }
+    increment_resources_downloads(
+        {
+            resource_id: count
+            for resource_id, count in resource_downloads.items()
+            if resource_id in resource_ids
+        }
+    )
+
+
+# Add the download counts of the resources to their package summaries
+# Downloads are too frequent to recalculate the packages, so add the deltas
+def increment_packages_downloads(resource_downloads):
+    package_downloads = Counter()
+    rows = session.query(Resource.id, Resource.package_id).filter(
+        Resource.id.in_(list(resource_downloads))
+    )
+    for resource_id, package_id in rows:
+        package_downloads[package_id] += resource_downloads[resource_id]
+    if not package_downloads:
+        return
+    cache.invalidate('package', package_downloads)
+
+    now = datetime.datetime.now()
+    insert_stmt = insert(PackageFeedbackSummary).values(
+        [
+            {
+                'package_id': package_id,
+                'download': count,
+                'created': now,
+                'updated': now,
+            }
+            for package_id, count in sorted(package_downloads.items())
+        ]
+    )
+    upsert_stmt = insert_stmt.on_conflict_do_update(
+        index_elements=[PackageFeedbackSummary.package_id],
+        set_={
+            'download': PackageFeedbackSummary.download + insert_stmt.excluded.download,
+            'updated': insert_stmt.excluded.updated,
+        },
+    )
+    session.execute(upsert_stmt)
+
+
+# Compact the daily downloads of the months before the given date into monthly rows
+def rollup_daily_downloads(before):
+    before = before.replace(day=1)
+    month = cast(func.date_trunc('month', DownloadDaily.date), Date)
+    monthly_downloads = (
+        select(
+            [
+                DownloadDaily.resource_id,
+                month,
+                func.sum(DownloadDaily.download),
+            ]
+        )
+        .where(DownloadDaily.date < before)
+        .group_by(DownloadDaily.resource_id, month)
+    )
+    insert_stmt = insert(DownloadMonthly).from_select(
+        [DownloadMonthly.resource_id, DownloadMonthly.month, DownloadMonthly.download],
+        monthly_downloads,
+    )
+    upsert_stmt = insert_stmt.on_conflict_do_update(
+        index_elements=[DownloadMonthly.resource_id, DownloadMonthly.month],
+        set_={'download': DownloadMonthly.download + insert_stmt.excluded.download},
+    )
+    session.execute(upsert_stmt)
+    count = (
+        session.query(DownloadDaily)
+        .filter(DownloadDaily.date < before)
+        .delete(synchronize_session=False)
+    )
     session.commit()
+    return count
@@ -1,14 +1,146 @@
-from datetime import datetime
+from collections import namedtuple
+from datetime import datetime, timedelta
 
 from ckan.model.resource import Resource
-from sqlalchemy import func
+from sqlalchemy import and_, func, or_, tuple_
+from sqlalchemy.orm import aliased
 
 from ckanext.feedback.models.resource_comment import (
     ResourceComment,
-    ResourceCommentSummary,
+    ResourceCommentCategory,
 )
 from ckanext.feedback.models.session import session
-from ckanext.feedback.models.utilization import Utilization, UtilizationComment
+from ckanext.feedback.models.utilization import (
+    Utilization,
+    UtilizationComment,
+    UtilizationCommentCategory,
+)
+from ckanext.feedback.services.resource import summary as summary_service
+
+CommentsPage = namedtuple('CommentsPage', ['comments', 'next_cursor', 'prev_cursor'])
+
+# The number of comments changed by a batch of a bulk action and the ids of
+# the utilizations or resource summaries refreshed by it
+BulkResult = namedtuple('BulkResult', ['comments', 'summary_ids'])
+
+
+# Encode the position of the comment as a cursor for keyset pagination
+def encode_cursor(comment):
+    return f'{comment.created.isoformat()},{comment.id}'
+
+
+# Decode the cursor into (created, id), or None if the cursor is invalid
+def decode_cursor(cursor):
+    if not cursor:
+        return None
+    try:
+        created, id = cursor.split(',', 1)
+        return datetime.fromisoformat(created), id
+    except ValueError:
+        return None
+
+
+def filter_comments(
+    query,
+    model,
+    approval=None,
+    categories=None,
+    created_from=None,
+    created_to=None,
+):
+    if approval is not None:
+        query = query.filter(model.approval == approval)
+    if categories is not None:
+        # Rating-only resource comments have no category, so keep them whatever
+        # categories are selected
+        query = query.filter(
+            or_(model.category.in_(categories), model.category.is_(None))
+        )
+    if created_from is not None:
+        query = query.filter(model.created >= created_from)
+    if created_to is not None:
+        # created_to is a date, so include the whole day
+        query = query.filter(model.created < created_to + timedelta(days=1))
+    return query
+
+
+# Get a page of comments ordered by (created, id) from newest to oldest
+# after: cursor of the last comment on the previous page
+# before: cursor of the first comment on the next page
+def get_comments_page(query, model, limit, after=None, before=None):
+    position = tuple_(model.created, model.id)
+    if before is not None:
+        query = query.filter(position > tuple_(*before)).order_by(
+            model.created, model.id
+        )
+    else:
+        if after is not None:
+            query = query.filter(position < tuple_(*after))
+        query = query.order_by(model.created.desc(), model.id.desc())
+
+    # Fetch one more comment to know whether there is a following page
+    comments = query.limit(limit + 1).all()
+    has_more = len(comments) > limit
+    comments = comments[:limit]
+    if before is not None:
+        comments.reverse()
+        has_newer, has_older = has_more, True
+    else:
+        has_newer, has_older = after is not None, has_more
+
+    return CommentsPage(
+        comments=comments,
+        next_cursor=encode_cursor(comments[-1]) if comments and has_older else None,
+        prev_cursor=encode_cursor(comments[0]) if comments and has_newer else None,
+    )
+
+
+def get_utilization_comments_query(resource_id=None, package_id=None, **filters):
+    query = session.query(UtilizationComment)
+    if resource_id is not None or package_id is not None:
+        query = query.join(Utilization)
+    if resource_id is not None:
+        query = query.filter(Utilization.resource_id == resource_id)
+    if package_id is not None:
+        query = query.join(Resource, Utilization.resource).filter(
+            Resource.package_id == package_id
+        )
+    return filter_comments(query, UtilizationComment, **filters)
+
+
+def get_resource_comments_query(resource_id=None, package_id=None, **filters):
+    query = session.query(ResourceComment)
+    if resource_id is not None:
+        query = query.filter(ResourceComment.resource_id == resource_id)
+    if package_id is not None:
+        query = query.join(Resource, ResourceComment.resource).filter(
+            Resource.package_id == package_id
+        )
+    return filter_comments(query, ResourceComment, **filters)
+
+
+# Get a page of utilization comments matching the filters
+def get_utilization_comments_page(limit, after=None, before=None, **filters):
+    query = get_utilization_comments_query(**filters)
+    return get_comments_page(query, UtilizationComment, limit, after, before)
+
+
+# Get a page of resource comments matching the filters
+def get_resource_comments_page(limit, after=None, before=None, **filters):
+    query = get_resource_comments_query(**filters)
+    return get_comments_page(query, ResourceComment, limit, after, before)
+
+
+# Count the utilization comments matching the filters
+def count_utilization_comments(**filters):
+    query = get_utilization_comments_query(**filters)
+    return query.with_entities(func.count(UtilizationComment.id)).scalar()
+
+
+# Count the resource comments matching the filters
+def count_resource_comments(**filters):
+    query = get_resource_comments_query(**filters)
+    return query.with_entities(func.count(ResourceComment.id)).scalar()
 
 
 # Get approval utilization comment count using utilization.id
@@ -36,54 +168,34 @@ def get_utilizations(comment_id_list):
 
 # Recalculate total approved bulk utilizations comments
 def refresh_utilizations_comments(utilizations):
-    session.bulk_update_mappings(
-        Utilization,
-        [
-            {
-                'id': utilization.id,
-                'comment': get_utilization_comments(utilization.id),
-                'updated': datetime.now(),
-            }
-            for utilization in utilizations
-        ],
-    )
-
-
-# Get resource comment summaries using comment_id_list
-def get_resource_comment_summaries(comment_id_list):
-    resource_comment_summaries = (
-        session.query(ResourceCommentSummary)
-        .join(Resource)
-        .join(ResourceComment)
-        .filter(ResourceComment.id.in_(comment_id_list))
-    ).all()
-    return resource_comment_summaries
+    utilization_ids = [utilization.id for utilization in utilizations]
+    if not utilization_ids:
+        return
 
-
-# Recalculate total approved bulk resources comments
-def refresh_resources_comments(resource_comment_summaries):
-    mappings = []
-    for resource_comment_summary in resource_comment_summaries:
-        row = (
-            session.query(
-                func.sum(ResourceComment.rating).label('total_rating'),
-                func.count().label('total_comment'),
-            )
-            .filter(
-                ResourceComment.resource_id == resource_comment_summary.resource.id,
-                ResourceComment.approval,
-            )
-            .first()
+    # Count all utilizations in one statement instead of one query each
+    counted = aliased(Utilization)
+    totals = (
+        session.query(
+            counted.id.label('id'),
+            func.count(UtilizationComment.id).label('comment'),
         )
-        mappings.append(
-            {
-                'id': resource_comment_summary.id,
-                'comment': row.total_comment,
-                'rating': row.total_rating / row.total_comment,
-                'updated': datetime.now(),
-            }
+        .outerjoin(
+            UtilizationComment,
+            and_(
+                UtilizationComment.utilization_id == counted.id,
+                UtilizationComment.approval,
+            ),
         )
-    session.bulk_update_mappings(ResourceCommentSummary, mappings)
+        .filter(counted.id.in_(utilization_ids))
+        .group_by(counted.id)
+        .subquery()
+    )
+    table = Utilization.__table__
+    session.execute(
+        table.update()
+        .where(table.c.id == totals.c.id)
+        .values(comment=totals.c.comment, updated=datetime.now())
+    )
 
 
 # Approve selected utilization comments
@@ -111,26 +223,169 @@ def delete_utilization_comments(comment_id_list):
     )
 
 
-# Approve selected resource comments
+# Approve selected resource comments and add them to the summaries
+# Only the comments still waiting for approval are updated, and the summaries
+# are updated from the updated rows, so that concurrent approvals count each
+# comment only once
+# Return the approved comments
 def approve_resource_comments(comment_id_list, approval_user_id):
-    session.bulk_update_mappings(
-        ResourceComment,
-        [
-            {
-                'id': comment_id,
-                'approval': True,
-                'approved': datetime.now(),
-                'approval_user_id': approval_user_id,
-            }
-            for comment_id in comment_id_list
-        ],
+    table = ResourceComment.__table__
+    approved = session.execute(
+        table.update()
+        .where(and_(table.c.id.in_(comment_id_list), ~table.c.approval))
+        .values(
+            approval=True,
+            approved=datetime.now(),
+            approval_user_id=approval_user_id,
+        )
+        .returning(table.c.resource_id, table.c.rating, table.c.content)
+    ).fetchall()
+    summary_service.apply_resource_summary_deltas(
+        summary_service.get_comment_deltas(approved)
     )
+    return approved
 
 
-# Delete selected resource comments
+# Delete selected resource comments and subtract the approved ones from the
+# summaries
+# The summaries are updated from the deleted rows, so that concurrent deletes
+# subtract each comment only once
+# Return the deleted comments
 def delete_resource_comments(comment_id_list):
-    (
-        session.query(ResourceComment)
-        .filter(ResourceComment.id.in_(comment_id_list))
-        .delete(synchronize_session='fetch')
+    table = ResourceComment.__table__
+    deleted = session.execute(
+        table.delete()
+        .where(table.c.id.in_(comment_id_list))
+        .returning(
+            table.c.resource_id, table.c.rating, table.c.content, table.c.approval
+        )
+    ).fetchall()
+    summary_service.apply_resource_summary_deltas(
+        summary_service.get_comment_deltas(
+            [row for row in deleted if row.approval], sign=-1
+        )
     )
+    return deleted
+
+
+# Get the ids of the next batch of comments matching the filters
+def get_comment_id_batch(query, model, batch_size):
+    return [
+        row.id
+        for row in query.with_entities(model.id)
+        .order_by(model.created, model.id)
+        .limit(batch_size)
+    ]
+
+
+# Approve all utilization comments waiting for approval that match the filters
+# Yield a BulkResult per batch so that the caller can commit each batch
+def approve_matching_utilization_comments(approval_user_id, batch_size, **filters):
+    # Only the comments waiting for approval can be approved
+    if filters.get('approval'):
+        return
+    filters['approval'] = False
+    while True:
+        comment_id_list = get_comment_id_batch(
+            get_utilization_comments_query(**filters), UtilizationComment, batch_size
+        )
+        if not comment_id_list:
+            return
+        utilizations = get_utilizations(comment_id_list)
+        (
+            session.query(UtilizationComment)
+            .filter(UtilizationComment.id.in_(comment_id_list))
+            .update(
+                {
+                    'approval': True,
+                    'approved': datetime.now(),
+                    'approval_user_id': approval_user_id,
+                },
+                synchronize_session=False,
+            )
+        )
+        refresh_utilizations_comments(utilizations)
+        yield BulkResult(
+            len(comment_id_list), {utilization.id for utilization in utilizations}
+        )
+
+
+# Whether the filters select only some of the comments
+# Selecting every category does not narrow the comments down
+def is_filtered(category_enum, approval=None, categories=None, **filters):
+    if approval is not None:
+        return True
+    if categories is not None and set(categories) != set(category_enum):
+        return True
+    return any(value is not None for value in filters.values())
+
+
+# Refuse to delete every comment unless the caller asks for it explicitly
+def check_delete_filters(category_enum, delete_all, filters):
+    if not delete_all and not is_filtered(category_enum, **filters):
+        raise ValueError('No filter is set to select the comments to delete')
+
+
+# Delete all utilization comments matching the filters
+# Return an iterator yielding a BulkResult per batch so that the caller can
+# commit each batch
+# delete_all: allow deleting all comments when no filter is set
+def delete_matching_utilization_comments(batch_size, delete_all=False, **filters):
+    check_delete_filters(UtilizationCommentCategory, delete_all, filters)
+    return iter_delete_matching_utilization_comments(batch_size, **filters)
+
+
+def iter_delete_matching_utilization_comments(batch_size, **filters):
+    while True:
+        comment_id_list = get_comment_id_batch(
+            get_utilization_comments_query(**filters), UtilizationComment, batch_size
+        )
+        if not comment_id_list:
+            return
+        utilizations = get_utilizations(comment_id_list)
+        (
+            session.query(UtilizationComment)
+            .filter(UtilizationComment.id.in_(comment_id_list))
+            .delete(synchronize_session=False)
+        )
+        refresh_utilizations_comments(utilizations)
+        yield BulkResult(
+            len(comment_id_list), {utilization.id for utilization in utilizations}
+        )
+
+
+# Approve all resource comments waiting for approval that match the filters
+# Yield a BulkResult per batch so that the caller can commit each batch
+def approve_matching_resource_comments(approval_user_id, batch_size, **filters):
+    # Only the comments waiting for approval can be approved
+    if filters.get('approval'):
+        return
+    filters['approval'] = False
+    while True:
+        comment_id_list = get_comment_id_batch(
+            get_resource_comments_query(**filters), ResourceComment, batch_size
+        )
+        if not comment_id_list:
+            return
+        approved = approve_resource_comments(comment_id_list, approval_user_id)
+        yield BulkResult(len(approved), {row.resource_id for row in approved})
+
+
+# Delete all resource comments matching the filters
+# Return an iterator yielding a BulkResult per batch so that the caller can
+# commit each batch
+# delete_all: allow deleting all comments when no filter is set
+def delete_matching_resource_comments(batch_size, delete_all=False, **filters):
+    check_delete_filters(ResourceCommentCategory, delete_all, filters)
+    return iter_delete_matching_resource_comments(batch_size, **filters)
+
+
+def iter_delete_matching_resource_comments(batch_size, **filters):
+    while True:
+        comment_id_list = get_comment_id_batch(
+            get_resource_comments_query(**filters), ResourceComment, batch_size
+        )
+        if not comment_id_list:
+            return
+        deleted = delete_resource_comments(comment_id_list)
+        yield BulkResult(len(deleted), {row.resource_id for row in deleted})
@@ -0,0 +1,92 @@
+import csv
+import enum
+import io
+import json
+from datetime import date, datetime, timedelta
+
+from ckanext.feedback.models.issue import IssueResolution
+from ckanext.feedback.models.resource_comment import ResourceComment
+from ckanext.feedback.models.session import session
+from ckanext.feedback.models.utilization import Utilization, UtilizationComment
+
+export_models = {
+    'resource_comment': ResourceComment,
+    'utilization': Utilization,
+    'utilization_comment': UtilizationComment,
+    'issue_resolution': IssueResolution,
+}
+
+export_formats = ['csv', 'ndjson']
+
+# The rows are written out in chunks of about this size in characters
+CHUNK_SIZE = 64 * 1024
+
+
+def get_export_columns(table):
+    return [column.name for column in export_models[table].__table__.columns]
+
+
+# Get the rows of the table as tuples, streamed from a server-side cursor
+# created_to: the last day to export, inclusive
+# approval: None to export both approved and waiting rows
+def get_export_rows(
+    table, created_from=None, created_to=None, approval=None, batch_size=1000
+):
+    model = export_models[table]
+    query = session.query(*model.__table__.columns)
+    if created_from is not None:
+        query = query.filter(model.created >= created_from)
+    if created_to is not None:
+        query = query.filter(model.created < created_to + timedelta(days=1))
+    if approval is not None and hasattr(model, 'approval'):
+        query = query.filter(model.approval.is_(approval))
+    return query.order_by(model.created, model.id).yield_per(batch_size)
+
+
+def format_value(value):
+    if isinstance(value, enum.Enum):
+        return value.name
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+# Yield the header and rows as CSV in chunks
+def iter_csv(columns, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for row in rows:
+        writer.writerow([format_value(value) for value in row])
+        if buffer.tell() >= CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+# Yield the rows as one JSON object per line in chunks
+def iter_ndjson(columns, rows):
+    lines = []
+    size = 0
+    for row in rows:
+        line = json.dumps(
+            {column: format_value(value) for column, value in zip(columns, row)},
+            ensure_ascii=False,
+        )
+        lines.append(line + '\n')
+        size += len(line) + 1
+        if size >= CHUNK_SIZE:
+            yield ''.join(lines)
+            lines = []
+            size = 0
+    yield ''.join(lines)
+
+
+# Yield the rows of the table in the format
+def export_rows(table, export_format, **filters):
+    columns = get_export_columns(table)
+    rows = get_export_rows(table, **filters)
+    if export_format == 'ndjson':
+        return iter_ndjson(columns, rows)
+    return iter_csv(columns, rows)
@@ -0,0 +1,362 @@
+import csv
+import io
+import json
+from collections import namedtuple
+from datetime import datetime
+from itertools import islice
+
+from ckan.model import Resource
+from sqlalchemy import and_, func, select, text
+from sqlalchemy.sql import column, table
+
+from ckanext.feedback.models.download import (
+    DownloadDaily,
+    DownloadMonthly,
+    DownloadSummary,
+)
+from ckanext.feedback.models.issue import IssueResolution
+from ckanext.feedback.models.resource_comment import ResourceComment
+from ckanext.feedback.models.session import session
+from ckanext.feedback.models.utilization import Utilization, UtilizationComment
+from ckanext.feedback.services.common import cache
+from ckanext.feedback.services.common import package_summary as package_summary_service
+from ckanext.feedback.services.common import summary as summary_service
+from ckanext.feedback.services.download import summary as download_summary_service
+from ckanext.feedback.services.resource import summary as resource_summary_service
+from ckanext.feedback.services.utilization import summary as utilization_summary_service
+
+# model: the model to insert the rows into, or None for the download counts
+# parent: the column referring to the resource or utilization of the row
+# required: the columns every record must have, so that importing the same
+# records again changes nothing
+ImportTable = namedtuple(
+    'ImportTable', ['model', 'columns', 'parent', 'module', 'required']
+)
+
+# The numbers of rows read from the input, skipped because their resource or
+# utilization does not exist, and inserted (the rest already existed)
+ImportResult = namedtuple('ImportResult', ['read', 'skipped', 'imported'])
+
+
+def get_model_columns(model):
+    return [c.name for c in model.__table__.columns]
+
+
+import_tables = {
+    'resource_comment': ImportTable(
+        ResourceComment,
+        get_model_columns(ResourceComment),
+        'resource_id',
+        'resource',
+        ['id'],
+    ),
+    'utilization': ImportTable(
+        Utilization,
+        get_model_columns(Utilization),
+        'resource_id',
+        'utilization',
+        ['id'],
+    ),
+    'utilization_comment': ImportTable(
+        UtilizationComment,
+        get_model_columns(UtilizationComment),
+        'utilization_id',
+        'utilization',
+        ['id'],
+    ),
+    'issue_resolution': ImportTable(
+        IssueResolution,
+        get_model_columns(IssueResolution),
+        'utilization_id',
+        'utilization',
+        ['id'],
+    ),
+    # The counts replace the daily counts of the same days
+    'download': ImportTable(
+        None,
+        ['resource_id', 'date', 'download'],
+        'resource_id',
+        'download',
+        ['date', 'download'],
+    ),
+}
+
+import_formats = ['csv', 'ndjson']
+
+
+def get_staging_table(name):
+    return table(
+        f'feedback_import_{name}',
+        *[column(c) for c in import_tables[name].columns],
+    )
+
+
+# Create the temporary table the rows are copied into before the insert
+def create_staging_table(name):
+    staging = get_staging_table(name).name
+    model = import_tables[name].model
+    if model is None:
+        ddl = (
+            f'CREATE TEMP TABLE {staging}'
+            ' (resource_id text, date date, download integer)'
+        )
+    else:
+        ddl = f'CREATE TEMP TABLE {staging} (LIKE {model.__tablename__})'
+    session.execute(text(f'{ddl} ON COMMIT DROP'))
+
+
+# Yield (line number, record) of the CSV with a header line
+# Empty fields are read as null
+def read_csv(f):
+    reader = csv.DictReader(f)
+    for record in reader:
+        yield reader.line_num, {k: v if v != '' else None for k, v in record.items()}
+
+
+# Yield (line number, record) of the NDJSON, skipping blank lines
+def read_ndjson(f):
+    for line_num, line in enumerate(f, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield line_num, json.loads(line)
+        except ValueError as e:
+            raise ValueError(f'Line {line_num}: {e}') from e
+
+
+def read_records(f, import_format):
+    if import_format == 'ndjson':
+        return read_ndjson(f)
+    return read_csv(f)
+
+
+def get_default(name, column_name):
+    model = import_tables[name].model
+    if model is None:
+        return None
+    default = model.__table__.c[column_name].default
+    if default is None:
+        return None
+    if default.is_callable:
+        return default.arg(None)
+    return default.arg
+
+
+# Get the values of the record in the order of the columns of the table
+# The missing or null values are filled with the defaults of the model
+def get_row(name, line_num, record):
+    columns = import_tables[name].columns
+    unknown = set(record) - set(columns)
+    if unknown:
+        raise ValueError(
+            f'Line {line_num}: unknown columns {", ".join(sorted(unknown))}'
+        )
+    missing = [c for c in import_tables[name].required if record.get(c) is None]
+    if missing:
+        raise ValueError(f'Line {line_num}: {", ".join(missing)} must be set')
+    row = []
+    for column_name in columns:
+        value = record.get(column_name)
+        if value is None:
+            value = get_default(name, column_name)
+        row.append(value)
+    return row
+
+
+# Get the resource ids of the existing resources or utilizations of the ids
+def get_parent_resource_ids(name, parent_ids):
+    if import_tables[name].parent == 'utilization_id':
+        rows = session.query(Utilization.id, Utilization.resource_id).filter(
+            Utilization.id.in_(parent_ids)
+        )
+        return dict(rows.all())
+    rows = session.query(Resource.id).filter(Resource.id.in_(parent_ids))
+    return {row.id: row.id for row in rows}
+
+
+def format_copy_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+# Copy the rows into the staging table with COPY FROM STDIN
+def copy_rows(name, rows):
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write(','.join(format_copy_value(value) for value in row))
+        buffer.write('\n')
+    buffer.seek(0)
+    columns = ', '.join(import_tables[name].columns)
+    cursor = session.connection().connection.cursor()
+    try:
+        cursor.copy_expert(
+            f'COPY {get_staging_table(name).name} ({columns}) FROM STDIN'
+            ' WITH (FORMAT csv)',
+            buffer,
+        )
+    finally:
+        cursor.close()
+
+
+# Insert the staged rows into the table, skipping the ids that already exist
+def insert_staged_rows(name):
+    staging = get_staging_table(name)
+    if import_tables[name].model is None:
+        return insert_staged_downloads(staging)
+    columns = ', '.join(import_tables[name].columns)
+    result = session.execute(
+        text(
+            f'INSERT INTO {import_tables[name].model.__tablename__} ({columns})'
+            f' SELECT {columns} FROM {staging.name} ON CONFLICT DO NOTHING'
+        )
+    )
+    return result.rowcount
+
+
+# Replace the daily counts with the staged download counts, and add the
+# differences to the totals, so that importing the same counts again changes
+# nothing
+# The counts of the same resource and day in the staged rows are added up
+def insert_staged_downloads(staging):
+    # The daily counts of the months compacted by rollup-downloads are gone, so
+    # the counts of those days cannot be replaced
+    compacted = session.execute(
+        select([DownloadMonthly.resource_id, DownloadMonthly.month])
+        .where(
+            and_(
+                DownloadMonthly.resource_id == staging.c.resource_id,
+                DownloadMonthly.month
+                == func.date_trunc('month', staging.c.date).cast(
+                    DownloadMonthly.month.type
+                ),
+            )
+        )
+        .limit(1)
+    ).first()
+    if compacted:
+        raise ValueError(
+            f'The downloads of {compacted.resource_id} in {compacted.month:%Y-%m}'
+            ' were already compacted by rollup-downloads'
+        )
+
+    days = (
+        select(
+            [
+                staging.c.resource_id,
+                staging.c.date,
+                func.sum(staging.c.download).label('download'),
+            ]
+        )
+        .group_by(staging.c.resource_id, staging.c.date)
+        .alias('days')
+    )
+    daily = DownloadDaily.__table__
+    differences = (
+        select(
+            [
+                days.c.resource_id,
+                func.sum(days.c.download - func.coalesce(daily.c.download, 0)).label(
+                    'download'
+                ),
+            ]
+        )
+        .select_from(
+            days.outerjoin(
+                daily,
+                and_(
+                    daily.c.resource_id == days.c.resource_id,
+                    daily.c.date == days.c.date,
+                ),
+            )
+        )
+        .group_by(days.c.resource_id)
+        .alias('differences')
+    )
+    summary_service.create_missing_summaries(
+        DownloadSummary, 'resource_id', staging.c.resource_id
+    )
+    # Add the differences before the daily counts are replaced
+    summary = DownloadSummary.__table__
+    session.execute(
+        summary.update()
+        .where(summary.c.resource_id == differences.c.resource_id)
+        .values(
+            download=func.coalesce(summary.c.download, 0) + differences.c.download,
+            updated=datetime.now(),
+        )
+    )
+
+    session.execute(
+        text(
+            f'INSERT INTO {daily.name} (resource_id, date, download)'
+            ' SELECT resource_id, date, sum(download)'
+            f' FROM {staging.name}'
+            ' GROUP BY resource_id, date'
+            ' ON CONFLICT (resource_id, date) DO UPDATE'
+            ' SET download = excluded.download'
+        )
+    )
+    return session.execute(select([func.count()]).select_from(staging)).scalar()
+
+
+# Recalculate the summaries of the module the table belongs to
+def rebuild_summaries(name):
+    module = import_tables[name].module
+    if module == 'resource':
+        resource_summary_service.rebuild_resource_summaries()
+    elif module == 'utilization':
+        utilization_summary_service.rebuild_utilization_summaries()
+    else:
+        # The totals of the resources were updated by the differences, since
+        # they may include downloads older than the daily counts
+        package_summary_service.upsert_package_summaries(
+            session, download_summary_service.get_package_downloads_aggregate()
+        )
+
+
+# Load the records into the table through a staging table filled with COPY,
+# then rebuild the summaries of its module in the same transaction
+# The caller commits the session
+# skip_invalid: skip the rows of unknown resources or utilizations instead of
+# raising ValueError
+def import_records(name, records, batch_size=10000, skip_invalid=False):
+    parent = import_tables[name].parent
+    parent_index = import_tables[name].columns.index(parent)
+    create_staging_table(name)
+
+    read = 0
+    skipped = 0
+    resource_ids = set()
+    records = iter(records)
+    while True:
+        batch = [
+            (line_num, get_row(name, line_num, record))
+            for line_num, record in islice(records, batch_size)
+        ]
+        if not batch:
+            break
+        read += len(batch)
+
+        parents = get_parent_resource_ids(name, {row[parent_index] for _, row in batch})
+        rows = []
+        for line_num, row in batch:
+            if row[parent_index] not in parents:
+                if not skip_invalid:
+                    raise ValueError(
+                        f'Line {line_num}: {parent} {row[parent_index]} does not exist'
+                    )
+                skipped += 1
+                continue
+            rows.append(row)
+        resource_ids.update(parents.values())
+        if rows:
+            copy_rows(name, rows)
+
+    imported = insert_staged_rows(name)
+    rebuild_summaries(name)
+    cache.invalidate('resource', resource_ids)
+    cache.invalidate('package', package_summary_service.get_package_ids(resource_ids))
+    return ImportResult(read, skipped, imported)
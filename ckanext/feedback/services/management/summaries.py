@@ -0,0 +1,157 @@
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from ckan import model
+from ckan.model import Resource
+from sqlalchemy import func
+
+from ckanext.feedback.models.session import session
+from ckanext.feedback.services.resource import summary as resource_summary_service
+from ckanext.feedback.services.utilization import summary as utilization_summary_service
+
+summary_modules = ['resource', 'utilization']
+
+
+# Split the resources into ranges of ids of about partition_size resources
+# Each partition is [first_id, next_id), and next_id of the last one is None
+def get_partitions(partition_size):
+    numbered = session.query(
+        Resource.id.label('id'),
+        func.row_number().over(order_by=Resource.id).label('number'),
+    ).subquery()
+    first_ids = [
+        row.id
+        for row in session.query(numbered.c.id)
+        .filter((numbered.c.number - 1) % partition_size == 0)
+        .order_by(numbered.c.id)
+    ]
+    return [
+        [first_id, first_ids[i + 1] if i + 1 < len(first_ids) else None]
+        for i, first_id in enumerate(first_ids)
+    ]
+
+
+def get_partition_resource_ids(first_id, next_id):
+    query = session.query(Resource.id).filter(Resource.id >= first_id)
+    if next_id is not None:
+        query = query.filter(Resource.id < next_id)
+    return [row.id for row in query]
+
+
+def get_drifts(module, resource_ids):
+    if module == 'resource':
+        return resource_summary_service.get_resource_summary_drifts(resource_ids)
+    return utilization_summary_service.get_utilization_summary_drifts(resource_ids)
+
+
+def rebuild_summaries(module, resource_ids):
+    if module == 'resource':
+        resource_summary_service.rebuild_resource_summaries(resource_ids)
+    else:
+        utilization_summary_service.rebuild_utilization_summaries(resource_ids)
+
+
+# Check the summaries of the resources in the partition, and recalculate the
+# summaries of the modules with drifted values if fix is True
+# This runs in the worker processes, so it commits and removes its own session
+def process_partition(partition, modules, fix):
+    try:
+        resource_ids = get_partition_resource_ids(*partition)
+        drifts = []
+        for module in modules:
+            module_drifts = get_drifts(module, resource_ids)
+            if fix and module_drifts:
+                rebuild_summaries(module, resource_ids)
+            drifts += module_drifts
+        session.commit()
+        return drifts
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.remove()
+
+
+# Yield (index, drifts) of the partitions as they are processed
+# partitions: (index, partition) of the partitions to process
+def process_partitions(partitions, modules, fix, workers=1):
+    if workers == 1:
+        for index, partition in partitions:
+            yield index, process_partition(partition, modules, fix)
+        return
+
+    # The forked workers must not share the connections of this process
+    session.remove()
+    model.meta.engine.dispose()
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context('fork')
+    ) as executor:
+        futures = {
+            executor.submit(process_partition, partition, modules, fix): index
+            for index, partition in partitions
+        }
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+
+# Load the checkpoint of an interrupted run, or None if there is none
+# The checkpoint keeps the partitions and the indexes of the processed ones, so
+# that the run resumes with the same partitions
+def load_checkpoint(path, command, modules):
+    if path is None or not os.path.exists(path):
+        return None
+    with open(path) as f:
+        checkpoint = json.load(f)
+    if checkpoint['command'] != command or checkpoint['modules'] != modules:
+        raise ValueError(
+            f'The checkpoint {path} was written by'
+            f' "summaries {checkpoint["command"]}" for'
+            f' {", ".join(checkpoint["modules"])}'
+        )
+    return checkpoint
+
+
+# Write the checkpoint to a temporary file first, so that an interruption never
+# leaves a broken checkpoint behind
+def save_checkpoint(path, checkpoint):
+    if path is None:
+        return
+    temporary_path = f'{path}.tmp'
+    with open(temporary_path, 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(temporary_path, path)
+
+
+def remove_checkpoint(path):
+    if path is not None and os.path.exists(path):
+        os.remove(path)
+
+
+# Check the summaries partition by partition, correcting them if fix is True
+# Yield the drifts of each partition as it is processed
+def check_summaries(modules, fix, workers=1, partition_size=1000, checkpoint_path=None):
+    command = 'rebuild' if fix else 'verify'
+    modules = [module for module in summary_modules if module in modules]
+    checkpoint = load_checkpoint(checkpoint_path, command, modules)
+    if checkpoint is None:
+        checkpoint = {
+            'command': command,
+            'modules': modules,
+            'partitions': get_partitions(partition_size),
+            'done': [],
+        }
+        save_checkpoint(checkpoint_path, checkpoint)
+
+    done = set(checkpoint['done'])
+    pending = [
+        (index, partition)
+        for index, partition in enumerate(checkpoint['partitions'])
+        if index not in done
+    ]
+    for index, drifts in process_partitions(pending, modules, fix, workers):
+        checkpoint['done'].append(index)
+        save_checkpoint(checkpoint_path, checkpoint)
+        yield drifts
+    remove_checkpoint(checkpoint_path)
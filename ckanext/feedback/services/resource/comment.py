@@ -2,6 +2,7 @@ from datetime import datetime
 
 from ckan.model.resource import Resource
 from flask import request
+from sqlalchemy.orm import selectinload
 
 from ckanext.feedback.models.resource_comment import (
     ResourceComment,
@@ -24,7 +25,16 @@ def get_resource(resource_id):
 
 # Get comments related to the dataset or resource
 def get_resource_comments(resource_id=None, approval=None):
-    query = session.query(ResourceComment).order_by(ResourceComment.created.desc())
+    # Load the replies and approval users together with the comments
+    # so that rendering them does not query the database once per comment
+    query = (
+        session.query(ResourceComment)
+        .options(
+            selectinload(ResourceComment.reply),
+            selectinload(ResourceComment.approval_user),
+        )
+        .order_by(ResourceComment.created.desc())
+    )
     if resource_id is not None:
         query = query.filter(ResourceComment.resource_id == resource_id)
     if approval is not None:
@@ -50,11 +60,21 @@ def create_resource_comment(resource_id, category, content, rating):
 
 
 # Approve selected resource comment
+# Return the comment if it was waiting for approval, otherwise None
 def approve_resource_comment(resource_comment_id, approval_user_id):
-    comment = session.query(ResourceComment).get(resource_comment_id)
+    # Lock the comment so that concurrent approvals count it only once
+    comment = (
+        session.query(ResourceComment)
+        .filter(ResourceComment.id == resource_comment_id)
+        .with_for_update()
+        .first()
+    )
+    if comment is None or comment.approval:
+        return None
     comment.approval = True
     comment.approved = datetime.now()
     comment.approval_user_id = approval_user_id
+    return comment
 
 
 # Get reply for target comment
@@ -1,27 +1,33 @@
 from datetime import datetime
 
 from ckan.model.resource import Resource
-from sqlalchemy import func
+from sqlalchemy import Numeric, and_, bindparam, case, cast, func, select
+from sqlalchemy.orm import aliased, outerjoin
 
+from ckanext.feedback.models.package import PackageFeedbackSummary
 from ckanext.feedback.models.resource_comment import (
     ResourceComment,
     ResourceCommentSummary,
 )
 from ckanext.feedback.models.session import session
+from ckanext.feedback.services.common import cache
+from ckanext.feedback.services.common import package_summary as package_summary_service
+from ckanext.feedback.services.common import summary as summary_service
 
 
 # Get comments of the target package
+@cache.cached('package')
 def get_package_comments(package_id):
     count = (
-        session.query(func.sum(ResourceCommentSummary.comment))
-        .join(Resource)
-        .filter(Resource.package_id == package_id)
+        session.query(PackageFeedbackSummary.comment)
+        .filter(PackageFeedbackSummary.package_id == package_id)
         .scalar()
     )
     return count or 0
 
 
 # Get comments of the target resource
+@cache.cached('resource')
 def get_resource_comments(resource_id):
     count = (
         session.query(ResourceCommentSummary.comment)
@@ -32,25 +38,63 @@ def get_resource_comments(resource_id):
 
 
 # Get rating of the target package
+@cache.cached('package')
 def get_package_rating(package_id):
-    row = (
+    rating = (
+        session.query(PackageFeedbackSummary.rating)
+        .filter(PackageFeedbackSummary.package_id == package_id)
+        .scalar()
+    )
+    return rating or 0
+
+
+# Get comments and rating of the target packages
+def get_packages_comments_and_rating(package_ids):
+    rows = (
         session.query(
-            func.sum(
-                ResourceCommentSummary.rating * ResourceCommentSummary.comment
-            ).label('total_rating'),
-            func.sum(ResourceCommentSummary.comment).label('total_comment'),
+            PackageFeedbackSummary.package_id,
+            PackageFeedbackSummary.comment,
+            PackageFeedbackSummary.rating,
         )
-        .join(Resource)
-        .filter(Resource.package_id == package_id)
-        .first()
+        .filter(PackageFeedbackSummary.package_id.in_(package_ids))
+        .all()
+    )
+    return {
+        row.package_id: {'comments': row.comment or 0, 'rating': row.rating or 0}
+        for row in rows
+    }
+
+
+# Select the approved comments and ratings of the resources summed up per package
+def get_package_comments_aggregate():
+    rating_sum = func.coalesce(func.sum(ResourceCommentSummary.rating_sum), 0)
+    rating_count = func.coalesce(func.sum(ResourceCommentSummary.rating_count), 0)
+    return (
+        select(
+            [
+                Resource.package_id,
+                func.coalesce(func.sum(ResourceCommentSummary.comment), 0).label(
+                    'comment'
+                ),
+                rating_sum.label('rating_sum'),
+                rating_count.label('rating_count'),
+                get_average_rating_expression(rating_sum, rating_count).label('rating'),
+            ]
+        )
+        .select_from(outerjoin(Resource, ResourceCommentSummary))
+        .group_by(Resource.package_id)
+    )
+
+
+# Recalculate the comments and rating of the packages of the target resources
+def refresh_package_comments(resource_ids):
+    package_summary_service.refresh_package_summaries(
+        get_package_comments_aggregate(), resource_ids
     )
-    if row and row.total_comment and row.total_comment > 0:
-        return row.total_rating / row.total_comment
-    else:
-        return 0
 
 
 # Get rating of the target resource
+@cache.cached('resource')
 def get_resource_rating(resource_id):
     rating = (
         session.query(ResourceCommentSummary.rating)
@@ -60,6 +104,23 @@ def get_resource_rating(resource_id):
     return rating or 0
 
 
+# Get comments and rating of the target resources
+def get_resources_comments_and_rating(resource_ids):
+    rows = (
+        session.query(
+            ResourceCommentSummary.resource_id,
+            ResourceCommentSummary.comment,
+            ResourceCommentSummary.rating,
+        )
+        .filter(ResourceCommentSummary.resource_id.in_(resource_ids))
+        .all()
+    )
+    return {
+        row.resource_id: {'comments': row.comment or 0, 'rating': row.rating or 0}
+        for row in rows
+    }
+
+
 # Create new resource summary
 def create_resource_summary(resource_id):
     summary = (
@@ -74,45 +135,192 @@ def create_resource_summary(resource_id):
         session.add(summary)
 
 
+# Add the approved comment to the resource summary without recounting comments
+def add_comment_to_resource_summary(comment):
+    apply_resource_summary_deltas(get_comment_deltas([comment]))
+
+
+# Sum up the ratings and comments of the comments per resource
+# comments: rows with the resource_id, rating and content of the comments
+# sign: 1 to add the comments to the summaries, -1 to subtract them
+def get_comment_deltas(comments, sign=1):
+    deltas = {}
+    for comment in comments:
+        delta = deltas.setdefault(
+            comment.resource_id, {'rating_sum': 0, 'rating_count': 0, 'comment': 0}
+        )
+        if comment.rating is not None:
+            delta['rating_sum'] += sign * comment.rating
+            delta['rating_count'] += sign
+        if comment.content is not None:
+            delta['comment'] += sign
+    return deltas
+
+
+# SQL expression of the average rating from the sum and count of ratings
+def get_average_rating_expression(rating_sum, rating_count):
+    return case(
+        [(rating_count > 0, cast(rating_sum, Numeric) / rating_count)],
+        else_=0,
+    )
+
+
+# Add the differences of the columns to the summaries in one executemany update
+# The right-hand sides refer to the values before the update
+def update_summaries_with_deltas(table, key, deltas):
+    rating_sum = table.c.rating_sum + bindparam('delta_rating_sum')
+    rating_count = table.c.rating_count + bindparam('delta_rating_count')
+    session.execute(
+        table.update()
+        .where(table.c[key] == bindparam('delta_key'))
+        .values(
+            rating_sum=rating_sum,
+            rating_count=rating_count,
+            rating=get_average_rating_expression(rating_sum, rating_count),
+            comment=table.c.comment + bindparam('delta_comment'),
+            updated=datetime.now(),
+        ),
+        [
+            {
+                'delta_key': summary_key,
+                'delta_rating_sum': delta['rating_sum'],
+                'delta_rating_count': delta['rating_count'],
+                'delta_comment': delta['comment'],
+            }
+            for summary_key, delta in sorted(deltas.items())
+        ],
+    )
+
+
+# Add the differences of approved ratings and comments to the resource summaries
+# and to the package summaries of their packages
+# deltas: {resource_id: {'rating_sum': ..., 'rating_count': ..., 'comment': ...}}
+def apply_resource_summary_deltas(deltas):
+    deltas = {
+        resource_id: delta
+        for resource_id, delta in deltas.items()
+        if any(delta.values())
+    }
+    if not deltas:
+        return
+    existing = {
+        row.resource_id
+        for row in session.query(ResourceCommentSummary.resource_id).filter(
+            ResourceCommentSummary.resource_id.in_(list(deltas))
+        )
+    }
+    if existing:
+        update_summaries_with_deltas(
+            ResourceCommentSummary.__table__,
+            'resource_id',
+            {resource_id: deltas[resource_id] for resource_id in existing},
+        )
+        apply_package_comments_deltas(
+            {resource_id: deltas[resource_id] for resource_id in existing}
+        )
+    # The missing summaries are created with a full recalculation
+    missing = set(deltas) - existing
+    if missing:
+        rebuild_resource_summaries(sorted(missing))
+
+
+# Add the differences of the resource summaries to the package summaries
+# The package summaries that do not exist yet are recalculated from the resource
+# summaries instead
+def apply_package_comments_deltas(resource_deltas):
+    if not resource_deltas:
+        return
+    cache.invalidate('resource', resource_deltas)
+    package_deltas = {}
+    rows = session.query(Resource.id, Resource.package_id).filter(
+        Resource.id.in_(list(resource_deltas))
+    )
+    for resource_id, package_id in rows:
+        package_delta = package_deltas.setdefault(
+            package_id, {'rating_sum': 0, 'rating_count': 0, 'comment': 0}
+        )
+        for column, value in resource_deltas[resource_id].items():
+            package_delta[column] += value
+    if not package_deltas:
+        return
+    cache.invalidate('package', package_deltas)
+
+    existing = {
+        row.package_id
+        for row in session.query(PackageFeedbackSummary.package_id).filter(
+            PackageFeedbackSummary.package_id.in_(list(package_deltas))
+        )
+    }
+    if existing:
+        update_summaries_with_deltas(
+            PackageFeedbackSummary.__table__,
+            'package_id',
+            {package_id: package_deltas[package_id] for package_id in existing},
+        )
+    missing = set(package_deltas) - existing
+    if missing:
+        package_summary_service.upsert_package_summaries(
+            session,
+            get_package_comments_aggregate().where(
+                Resource.package_id.in_(sorted(missing))
+            ),
+        )
+
+
+# Get the approved ratings and comments counted in the resource summaries
+def get_resource_summary_values(resource_ids):
+    rows = session.query(
+        ResourceCommentSummary.resource_id,
+        ResourceCommentSummary.rating_sum,
+        ResourceCommentSummary.rating_count,
+        ResourceCommentSummary.comment,
+    ).filter(ResourceCommentSummary.resource_id.in_(list(resource_ids)))
+    return {
+        row.resource_id: {
+            'rating_sum': row.rating_sum or 0,
+            'rating_count': row.rating_count or 0,
+            'comment': row.comment or 0,
+        }
+        for row in rows
+    }
+
+
+# Get the differences of the resource summaries from the values before a
+# recalculation, so that the package summaries can be updated with them
+def get_resource_summary_changes(before, resource_ids):
+    after = get_resource_summary_values(resource_ids)
+    zero = {'rating_sum': 0, 'rating_count': 0, 'comment': 0}
+    return {
+        resource_id: {
+            column: after.get(resource_id, zero)[column]
+            - before.get(resource_id, zero)[column]
+            for column in zero
+        }
+        for resource_id in resource_ids
+    }
+
+
 # Recalculate approved ratings and comments related to the resource summary
+# Use this to repair the summary, since approvals update it with deltas
 def refresh_resource_summary(resource_id):
-    total_rating = (
+    before = get_resource_summary_values([resource_id])
+    row = (
         session.query(
-            func.sum(ResourceComment.rating),
+            func.coalesce(func.sum(ResourceComment.rating), 0).label('rating_sum'),
+            func.count(ResourceComment.rating).label('rating_count'),
+            func.count(ResourceComment.content).label('comment'),
         )
         .filter(
             ResourceComment.resource_id == resource_id,
             ResourceComment.approval,
-            ResourceComment.rating.isnot(None),
-        )
-        .scalar()
-    )
-    if total_rating is None:
-        total_rating = 0
-    total_comment = (
-        session.query(ResourceComment)
-        .filter(
-            ResourceComment.resource_id == resource_id,
-            ResourceComment.approval,
-            ResourceComment.rating.isnot(None),
         )
-        .count()
+        .one()
     )
-    if total_comment > 0:
-        rating = total_rating / total_comment
+    if row.rating_count > 0:
+        rating = row.rating_sum / row.rating_count
     else:
         rating = 0
 
-    comment = (
-        session.query(ResourceComment)
-        .filter(
-            ResourceComment.resource_id == resource_id,
-            ResourceComment.approval,
-            ResourceComment.content.isnot(None),
-        )
-        .count()
-    )
-
     summary = (
         session.query(ResourceCommentSummary)
         .filter(ResourceCommentSummary.resource_id == resource_id)
@@ -122,10 +330,120 @@ def refresh_resource_summary(resource_id):
         summary = ResourceCommentSummary(
             resource_id=resource_id,
             rating=rating,
-            comment=comment,
+            rating_sum=row.rating_sum,
+            rating_count=row.rating_count,
+            comment=row.comment,
         )
         session.add(summary)
     else:
         summary.rating = rating
-        summary.comment = comment
+        summary.rating_sum = row.rating_sum
+        summary.rating_count = row.rating_count
+        summary.comment = row.comment
         summary.updated = datetime.now()
+    session.flush()
+    apply_package_comments_deltas(get_resource_summary_changes(before, [resource_id]))
+
+
+# Recalculate the resource summaries in one statement, creating the missing ones
+# resource_ids: the resources to recalculate, or None for all resources
+def rebuild_resource_summaries(resource_ids=None):
+    criteria = []
+    if resource_ids is not None:
+        criteria.append(ResourceComment.resource_id.in_(resource_ids))
+    summary_service.create_missing_summaries(
+        ResourceCommentSummary, 'resource_id', ResourceComment.resource_id, *criteria
+    )
+    if resource_ids is not None:
+        before = get_resource_summary_values(resource_ids)
+
+    counted = aliased(ResourceCommentSummary)
+    totals = (
+        session.query(
+            counted.id.label('id'),
+            func.coalesce(func.sum(ResourceComment.rating), 0).label('rating_sum'),
+            func.count(ResourceComment.rating).label('rating_count'),
+            func.count(ResourceComment.content).label('comment'),
+        )
+        .outerjoin(
+            ResourceComment,
+            and_(
+                ResourceComment.resource_id == counted.resource_id,
+                ResourceComment.approval,
+            ),
+        )
+        .group_by(counted.id)
+    )
+    if resource_ids is not None:
+        totals = totals.filter(counted.resource_id.in_(resource_ids))
+    totals = totals.subquery()
+    table = ResourceCommentSummary.__table__
+    session.execute(
+        table.update()
+        .where(table.c.id == totals.c.id)
+        .values(
+            comment=totals.c.comment,
+            rating=get_average_rating_expression(
+                totals.c.rating_sum, totals.c.rating_count
+            ),
+            rating_sum=totals.c.rating_sum,
+            rating_count=totals.c.rating_count,
+            updated=datetime.now(),
+        )
+    )
+
+    if resource_ids is None:
+        package_summary_service.upsert_package_summaries(
+            session, get_package_comments_aggregate()
+        )
+    else:
+        apply_package_comments_deltas(
+            get_resource_summary_changes(before, resource_ids)
+        )
+
+
+# Get the values of the resource summaries that differ from the approved comments
+def get_resource_summary_drifts(resource_ids):
+    expected = (
+        session.query(
+            ResourceComment.resource_id,
+            func.coalesce(func.sum(ResourceComment.rating), 0).label('rating_sum'),
+            func.count(ResourceComment.rating).label('rating_count'),
+            func.count(ResourceComment.content).label('comment'),
+        )
+        .filter(ResourceComment.resource_id.in_(resource_ids), ResourceComment.approval)
+        .group_by(ResourceComment.resource_id)
+        .all()
+    )
+    actual = (
+        session.query(
+            ResourceCommentSummary.resource_id,
+            ResourceCommentSummary.rating_sum,
+            ResourceCommentSummary.rating_count,
+            ResourceCommentSummary.comment,
+            ResourceCommentSummary.rating,
+        )
+        .filter(ResourceCommentSummary.resource_id.in_(resource_ids))
+        .all()
+    )
+
+    table = ResourceCommentSummary.__tablename__
+    drifts = []
+    for column in ['comment', 'rating_sum', 'rating_count']:
+        drifts += summary_service.get_drifts(
+            table,
+            column,
+            {row.resource_id: getattr(row, column) for row in actual},
+            {row.resource_id: getattr(row, column) for row in expected},
+        )
+    drifts += summary_service.get_drifts(
+        table,
+        'rating',
+        {row.resource_id: float(row.rating or 0) for row in actual},
+        {
+            row.resource_id: row.rating_sum / row.rating_count
+            for row in expected
+            if row.rating_count
+        },
+    )
+    return drifts
@@ -1,14 +1,84 @@
+import logging
+import threading
+import time
+
+from ckan.common import config
 from ckan.model.package import Package
 from ckan.model.resource import Resource
-from sqlalchemy import func, or_
+from ckan.plugins import toolkit
+from sqlalchemy import func, or_, text, union
 
 from ckanext.feedback.models.issue import IssueResolutionSummary
 from ckanext.feedback.models.session import session
 from ckanext.feedback.models.utilization import Utilization
 
+log = logging.getLogger(__name__)
+
+_trgm_available = None
+
+# Total counts of the search results per (id, keyword, approval)
+_count_cache = {}
+_count_cache_lock = threading.Lock()
+COUNT_CACHE_MAX_ENTRIES = 1000
+
+
+# Check whether the pg_trgm extension is installed to rank the search results
+def is_trgm_available():
+    global _trgm_available
+    if _trgm_available is None:
+        _trgm_available = bool(
+            session.execute(
+                text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            ).scalar()
+        )
+        if not _trgm_available:
+            log.info('pg_trgm is not installed. Utilizations are not ranked.')
+    return _trgm_available
+
+
+# Escape the wildcards of LIKE in the keyword
+def escape_like(keyword):
+    return keyword.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+# Get the ids of the utilizations whose text contains the keyword
+# Each select filters a single table so that it can use its trigram index
+def get_keyword_matched_ids(keyword):
+    pattern = f'%{escape_like(keyword)}%'
+    return union(
+        session.query(Utilization.id)
+        .filter(
+            or_(
+                Utilization.title.ilike(pattern, escape='\\'),
+                Utilization.description.ilike(pattern, escape='\\'),
+            )
+        )
+        .statement,
+        session.query(Utilization.id)
+        .join(Resource, Utilization.resource)
+        .filter(Resource.name.ilike(pattern, escape='\\'))
+        .statement,
+        session.query(Utilization.id)
+        .join(Resource, Utilization.resource)
+        .join(Package)
+        .filter(Package.name.ilike(pattern, escape='\\'))
+        .statement,
+    )
+
+
+# Apply the search conditions to the query joined with resource and package
+def filter_utilizations(query, id=None, keyword=None, approval=None):
+    if id:
+        query = query.filter(or_(Resource.id == id, Package.id == id))
+    if keyword:
+        query = query.filter(Utilization.id.in_(get_keyword_matched_ids(keyword)))
+    if approval is not None:
+        query = query.filter(Utilization.approval == approval)
+    return query
+
 
 # Get records from the Utilization table
-def get_utilizations(id=None, keyword=None, approval=None):
+def get_utilizations(id=None, keyword=None, approval=None, limit=None, offset=None):
     query = (
         session.query(
             Utilization.id,
@@ -26,19 +96,59 @@ def get_utilizations(id=None, keyword=None, approval=None):
         .join(Resource, Utilization.resource)
         .join(Package)
         .outerjoin(IssueResolutionSummary)
-        .order_by(Utilization.created.desc())
     )
-    if id:
-        query = query.filter(or_(Resource.id == id, Package.id == id))
-    if keyword:
-        query = query.filter(
-            or_(
-                Utilization.title.like(f'%{keyword}%'),
-                Resource.name.like(f'%{keyword}%'),
-                Package.name.like(f'%{keyword}%'),
-            )
+    query = filter_utilizations(query, id, keyword, approval)
+    if keyword and is_trgm_available():
+        # Show the utilizations most similar to the keyword first
+        query = query.order_by(
+            func.greatest(
+                func.similarity(Utilization.title, keyword),
+                func.similarity(Resource.name, keyword),
+                func.similarity(Package.name, keyword),
+            ).desc()
         )
-    if approval is not None:
-        query = query.filter(Utilization.approval == approval)
+    query = query.order_by(Utilization.created.desc(), Utilization.id)
+    if limit is not None:
+        query = query.limit(limit)
+    if offset:
+        query = query.offset(offset)
 
     return query.all()
+
+
+# Count the records from the Utilization table matching the search conditions
+# The count is cached for a short time so that paging does not recount them
+def get_utilizations_count(id=None, keyword=None, approval=None):
+    key = (id or None, keyword or None, approval)
+    ttl = toolkit.asint(
+        config.get('ckan.feedback.utilizations.search.count_cache_ttl', 60)
+    )
+    now = time.monotonic()
+    with _count_cache_lock:
+        cached = _count_cache.get(key)
+    if cached and cached[0] > now:
+        return cached[1]
+
+    query = (
+        session.query(func.count(Utilization.id))
+        .join(Resource, Utilization.resource)
+        .join(Package)
+    )
+    count = filter_utilizations(query, id, keyword, approval).scalar()
+
+    if ttl > 0:
+        with _count_cache_lock:
+            if len(_count_cache) >= COUNT_CACHE_MAX_ENTRIES:
+                for cached_key, (expires, _) in list(_count_cache.items()):
+                    if expires <= now:
+                        del _count_cache[cached_key]
+                if len(_count_cache) >= COUNT_CACHE_MAX_ENTRIES:
+                    _count_cache.clear()
+            _count_cache[key] = (now + ttl, count)
+    return count
+
+
+# Discard the cached counts after utilizations are created, approved or deleted
+def clear_utilizations_count_cache():
+    with _count_cache_lock:
+        _count_cache.clear()
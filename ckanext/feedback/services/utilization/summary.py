@@ -2,27 +2,49 @@ import logging
 from datetime import datetime
 
 from ckan.model import Resource
-from sqlalchemy import func
+from sqlalchemy import and_, func, select
+from sqlalchemy.orm import aliased, outerjoin
 
-from ckanext.feedback.models.issue import IssueResolutionSummary
+from ckanext.feedback.models.issue import IssueResolution, IssueResolutionSummary
+from ckanext.feedback.models.package import PackageFeedbackSummary
 from ckanext.feedback.models.session import session
-from ckanext.feedback.models.utilization import Utilization, UtilizationSummary
+from ckanext.feedback.models.utilization import (
+    Utilization,
+    UtilizationComment,
+    UtilizationSummary,
+)
+from ckanext.feedback.services.common import cache
+from ckanext.feedback.services.common import package_summary as package_summary_service
+from ckanext.feedback.services.common import summary as summary_service
 
 log = logging.getLogger(__name__)
 
 
 # Get utilization summary count of the target package
+@cache.cached('package')
 def get_package_utilizations(package_id):
     count = (
-        session.query(func.sum(UtilizationSummary.utilization))
-        .join(Resource)
-        .filter(Resource.package_id == package_id)
+        session.query(PackageFeedbackSummary.utilization)
+        .filter(PackageFeedbackSummary.package_id == package_id)
         .scalar()
     )
     return count or 0
 
 
+# Get utilization summary counts of the target packages
+def get_packages_utilizations(package_ids):
+    rows = (
+        session.query(
+            PackageFeedbackSummary.package_id, PackageFeedbackSummary.utilization
+        )
+        .filter(PackageFeedbackSummary.package_id.in_(package_ids))
+        .all()
+    )
+    return {package_id: count or 0 for package_id, count in rows}
+
+
 # Get utilization summary count of the target resource
+@cache.cached('resource')
 def get_resource_utilizations(resource_id):
     count = (
         session.query(UtilizationSummary.utilization)
@@ -32,6 +54,16 @@ def get_resource_utilizations(resource_id):
     return count or 0
 
 
+# Get utilization summary counts of the target resources
+def get_resources_utilizations(resource_ids):
+    rows = (
+        session.query(UtilizationSummary.resource_id, UtilizationSummary.utilization)
+        .filter(UtilizationSummary.resource_id.in_(resource_ids))
+        .all()
+    )
+    return {resource_id: count or 0 for resource_id, count in rows}
+
+
 # Create new utilizaton summary
 def create_utilization_summary(resource_id):
     summary = (
@@ -70,19 +102,31 @@ def refresh_utilization_summary(resource_id):
     else:
         summary.utilization = count
         summary.updated = datetime.now()
+    refresh_package_utilizations([resource_id])
 
 
+@cache.cached('package')
 def get_package_issue_resolutions(package_id):
     count = (
-        session.query(func.sum(IssueResolutionSummary.issue_resolution))
-        .join(Utilization)
-        .join(Resource)
-        .filter(Resource.package_id == package_id)
+        session.query(PackageFeedbackSummary.issue_resolution)
+        .filter(PackageFeedbackSummary.package_id == package_id)
         .scalar()
     )
     return count or 0
 
 
+def get_packages_issue_resolutions(package_ids):
+    rows = (
+        session.query(
+            PackageFeedbackSummary.package_id, PackageFeedbackSummary.issue_resolution
+        )
+        .filter(PackageFeedbackSummary.package_id.in_(package_ids))
+        .all()
+    )
+    return {package_id: count or 0 for package_id, count in rows}
+
+
+@cache.cached('resource')
 def get_resource_issue_resolutions(resource_id):
     count = (
         session.query(func.sum(IssueResolutionSummary.issue_resolution))
@@ -93,6 +137,20 @@ def get_resource_issue_resolutions(resource_id):
     return count or 0
 
 
+def get_resources_issue_resolutions(resource_ids):
+    rows = (
+        session.query(
+            Utilization.resource_id, func.sum(IssueResolutionSummary.issue_resolution)
+        )
+        .select_from(IssueResolutionSummary)
+        .join(Utilization)
+        .filter(Utilization.resource_id.in_(resource_ids))
+        .group_by(Utilization.resource_id)
+        .all()
+    )
+    return {resource_id: count or 0 for resource_id, count in rows}
+
+
 def increment_issue_resolution_summary(utilization_id):
     issue_resolution_summary = (
         session.query(IssueResolutionSummary)
@@ -110,3 +168,215 @@ def increment_issue_resolution_summary(utilization_id):
             issue_resolution_summary.issue_resolution + 1
         )
         issue_resolution_summary.updated = datetime.now()
+
+    resource_id = (
+        session.query(Utilization.resource_id)
+        .filter(Utilization.id == utilization_id)
+        .scalar()
+    )
+    refresh_package_utilizations([resource_id])
+
+
+# Select the approved utilizations of the resources summed up per package
+def get_package_utilizations_aggregate():
+    return (
+        select(
+            [
+                Resource.package_id,
+                func.coalesce(func.sum(UtilizationSummary.utilization), 0).label(
+                    'utilization'
+                ),
+            ]
+        )
+        .select_from(outerjoin(Resource, UtilizationSummary))
+        .group_by(Resource.package_id)
+    )
+
+
+# Select the issue resolutions of the utilizations summed up per package
+def get_package_issue_resolutions_aggregate():
+    return (
+        select(
+            [
+                Resource.package_id,
+                func.coalesce(
+                    func.sum(IssueResolutionSummary.issue_resolution), 0
+                ).label('issue_resolution'),
+            ]
+        )
+        .select_from(outerjoin(Resource, Utilization).outerjoin(IssueResolutionSummary))
+        .group_by(Resource.package_id)
+    )
+
+
+# Recalculate the utilizations and issue resolutions of the packages of the
+# target resources
+def refresh_package_utilizations(resource_ids):
+    package_summary_service.refresh_package_summaries(
+        get_package_utilizations_aggregate(), resource_ids
+    )
+    package_summary_service.refresh_package_summaries(
+        get_package_issue_resolutions_aggregate(), resource_ids
+    )
+
+
+# Recalculate the utilization summaries, the approved comments of the utilizations
+# and the issue resolution summaries in a few statements, creating the missing ones
+# resource_ids: the resources to recalculate, or None for all resources
+def rebuild_utilization_summaries(resource_ids=None):
+    now = datetime.now()
+    criteria = []
+    utilization_criteria = []
+    if resource_ids is not None:
+        criteria.append(Utilization.resource_id.in_(resource_ids))
+        utilization_ids = select([Utilization.id]).where(criteria[0])
+        utilization_criteria.append(IssueResolution.utilization_id.in_(utilization_ids))
+
+    summary_service.create_missing_summaries(
+        UtilizationSummary, 'resource_id', Utilization.resource_id, *criteria
+    )
+    counted = aliased(UtilizationSummary)
+    totals = (
+        session.query(
+            counted.id.label('id'),
+            func.count(Utilization.id).label('utilization'),
+        )
+        .outerjoin(
+            Utilization,
+            and_(Utilization.resource_id == counted.resource_id, Utilization.approval),
+        )
+        .group_by(counted.id)
+    )
+    if resource_ids is not None:
+        totals = totals.filter(counted.resource_id.in_(resource_ids))
+    totals = totals.subquery()
+    table = UtilizationSummary.__table__
+    session.execute(
+        table.update()
+        .where(table.c.id == totals.c.id)
+        .values(utilization=totals.c.utilization, updated=now)
+    )
+
+    counted = aliased(Utilization)
+    totals = (
+        session.query(
+            counted.id.label('id'),
+            func.count(UtilizationComment.id).label('comment'),
+        )
+        .outerjoin(
+            UtilizationComment,
+            and_(
+                UtilizationComment.utilization_id == counted.id,
+                UtilizationComment.approval,
+            ),
+        )
+        .group_by(counted.id)
+    )
+    if resource_ids is not None:
+        totals = totals.filter(counted.resource_id.in_(resource_ids))
+    totals = totals.subquery()
+    table = Utilization.__table__
+    session.execute(
+        table.update().where(table.c.id == totals.c.id).values(comment=totals.c.comment)
+    )
+
+    summary_service.create_missing_summaries(
+        IssueResolutionSummary,
+        'utilization_id',
+        IssueResolution.utilization_id,
+        *utilization_criteria,
+    )
+    counted = aliased(IssueResolutionSummary)
+    totals = (
+        session.query(
+            counted.id.label('id'),
+            func.count(IssueResolution.id).label('issue_resolution'),
+        )
+        .outerjoin(
+            IssueResolution, IssueResolution.utilization_id == counted.utilization_id
+        )
+        .group_by(counted.id)
+    )
+    if resource_ids is not None:
+        totals = totals.filter(counted.utilization_id.in_(utilization_ids))
+    totals = totals.subquery()
+    table = IssueResolutionSummary.__table__
+    session.execute(
+        table.update()
+        .where(table.c.id == totals.c.id)
+        .values(issue_resolution=totals.c.issue_resolution, updated=now)
+    )
+
+    if resource_ids is None:
+        package_summary_service.upsert_package_summaries(
+            session, get_package_utilizations_aggregate()
+        )
+        package_summary_service.upsert_package_summaries(
+            session, get_package_issue_resolutions_aggregate()
+        )
+    else:
+        refresh_package_utilizations(resource_ids)
+
+
+# Get the values of the utilization summaries, the comments of the utilizations
+# and the issue resolution summaries that differ from the feedback
+def get_utilization_summary_drifts(resource_ids):
+    drifts = summary_service.get_drifts(
+        UtilizationSummary.__tablename__,
+        'utilization',
+        dict(
+            session.query(
+                UtilizationSummary.resource_id, UtilizationSummary.utilization
+            )
+            .filter(UtilizationSummary.resource_id.in_(resource_ids))
+            .all()
+        ),
+        dict(
+            session.query(Utilization.resource_id, func.count(Utilization.id))
+            .filter(Utilization.resource_id.in_(resource_ids), Utilization.approval)
+            .group_by(Utilization.resource_id)
+            .all()
+        ),
+    )
+
+    utilizations = session.query(Utilization.id).filter(
+        Utilization.resource_id.in_(resource_ids)
+    )
+    drifts += summary_service.get_drifts(
+        Utilization.__tablename__,
+        'comment',
+        dict(utilizations.add_columns(Utilization.comment).all()),
+        dict(
+            utilizations.join(
+                UtilizationComment,
+                and_(
+                    UtilizationComment.utilization_id == Utilization.id,
+                    UtilizationComment.approval,
+                ),
+            )
+            .add_columns(func.count(UtilizationComment.id))
+            .group_by(Utilization.id)
+            .all()
+        ),
+    )
+    drifts += summary_service.get_drifts(
+        IssueResolutionSummary.__tablename__,
+        'issue_resolution',
+        dict(
+            utilizations.join(
+                IssueResolutionSummary,
+                IssueResolutionSummary.utilization_id == Utilization.id,
+            )
+            .add_columns(IssueResolutionSummary.issue_resolution)
+            .all()
+        ),
+        dict(
+            utilizations.join(
+                IssueResolution, IssueResolution.utilization_id == Utilization.id
+            )
+            .add_columns(func.count(IssueResolution.id))
+            .group_by(Utilization.id)
+            .all()
+        ),
+    )
+    return drifts
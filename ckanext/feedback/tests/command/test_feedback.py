@@ -1,22 +1,34 @@
+import datetime
 from unittest.mock import patch
 
+import fakeredis
 import pytest
 from ckan import model
+from ckan.tests import factories
 from click.testing import CliRunner
 
+from ckanext.feedback.command import migration
 from ckanext.feedback.command.feedback import feedback
-from ckanext.feedback.models.download import DownloadSummary
+from ckanext.feedback.models.download import (
+    DownloadDaily,
+    DownloadMonthly,
+    DownloadSummary,
+)
 from ckanext.feedback.models.issue import IssueResolution, IssueResolutionSummary
+from ckanext.feedback.models.migration import SchemaVersion
+from ckanext.feedback.models.package import PackageFeedbackSummary
 from ckanext.feedback.models.resource_comment import (
     ResourceComment,
     ResourceCommentReply,
     ResourceCommentSummary,
 )
+from ckanext.feedback.models.session import session
 from ckanext.feedback.models.utilization import (
     Utilization,
     UtilizationComment,
     UtilizationSummary,
 )
+from ckanext.feedback.services.download.queue import RedisQueue
 
 engine = model.repo.session.get_bind()
 
@@ -47,6 +59,10 @@ class TestFeedbackCommand:
                 ResourceCommentReply.__table__,
                 ResourceCommentSummary.__table__,
                 DownloadSummary.__table__,
+                DownloadDaily.__table__,
+                DownloadMonthly.__table__,
+                PackageFeedbackSummary.__table__,
+                SchemaVersion.__table__,
             ],
             checkfirst=True,
         )
@@ -100,6 +116,8 @@ class TestFeedbackCommand:
             feedback, ['init', '--modules', 'download', '--dbname', engine.url.database]
         )
         assert 'Initialize download: SUCCESS' in result.output
+        assert engine.has_table(DownloadDaily.__table__)
+        assert engine.has_table(DownloadMonthly.__table__)
         assert not engine.has_table(Utilization.__table__)
         assert not engine.has_table(UtilizationComment.__table__)
         assert not engine.has_table(UtilizationSummary.__table__)
@@ -178,3 +196,244 @@ class TestFeedbackCommand:
         assert not engine.has_table(ResourceCommentReply.__table__)
         assert not engine.has_table(ResourceCommentSummary.__table__)
         assert not engine.has_table(DownloadSummary.__table__)
+
+    def test_feedback_stamps_schema_version(self):
+        with patch.object(migration, 'create_search_indexes', return_value=True):
+            self.runner.invoke(feedback, ['init', '--dbname', engine.url.database])
+        versions = [row.version for row in session.query(SchemaVersion)]
+        assert versions == [m.version for m in migration.migrations]
+
+    def test_feedback_stamps_initialized_modules_only(self):
+        self.runner.invoke(
+            feedback, ['init', '--modules', 'resource', '--dbname', engine.url.database]
+        )
+        versions = [row.version for row in session.query(SchemaVersion)]
+        assert versions == [6, 7]
+
+    def test_upgrade_after_init_of_some_modules(self):
+        self.runner.invoke(
+            feedback, ['init', '--modules', 'resource', '--dbname', engine.url.database]
+        )
+
+        result = self.runner.invoke(
+            feedback, ['upgrade', '--dbname', engine.url.database]
+        )
+
+        assert 'Applied migration 1: ' in result.output
+        assert engine.has_table(ResourceComment.__table__)
+        assert not engine.has_table(Utilization.__table__)
+        assert not engine.has_table(DownloadSummary.__table__)
+
+    def test_feedback_leaves_skipped_search_indexes_pending(self):
+        with patch.object(migration, 'create_search_indexes', return_value=False):
+            self.runner.invoke(feedback, ['init', '--dbname', engine.url.database])
+        versions = [row.version for row in session.query(SchemaVersion)]
+        assert versions == [1, 2, 3, 4, 6, 7]
+
+    def test_upgrade(self):
+        # A database initialized for the download module by version 1.1.0
+        DownloadSummary.__table__.create(engine)
+        result = self.runner.invoke(
+            feedback, ['upgrade', '--dbname', engine.url.database]
+        )
+
+        head_version = migration.get_head_version()
+        assert 'Applied migration 1: ' in result.output
+        assert f'Upgrade to version {head_version}: SUCCESS' in result.output
+        assert engine.has_table(DownloadDaily.__table__)
+        assert engine.has_table(PackageFeedbackSummary.__table__)
+        assert not engine.has_table(Utilization.__table__)
+
+        result = self.runner.invoke(
+            feedback, ['upgrade', '--dbname', engine.url.database]
+        )
+
+        assert 'Applied migration' not in result.output
+        assert f'Upgrade to version {head_version}: SUCCESS' in result.output
+
+    def test_upgrade_error(self):
+        with patch(
+            'ckanext.feedback.command.feedback.migration.upgrade',
+            side_effect=Exception('Error message'),
+        ):
+            result = self.runner.invoke(
+                feedback, ['upgrade', '--dbname', engine.url.database]
+            )
+
+        assert result.exit_code != 0
+
+    def test_rollup_downloads(self):
+        self.runner.invoke(
+            feedback, ['init', '--modules', 'download', '--dbname', engine.url.database]
+        )
+        resource = factories.Resource()
+        today = datetime.date.today()
+        old_date = today.replace(day=1) - datetime.timedelta(days=400)
+        session.add(
+            DownloadDaily(resource_id=resource['id'], date=old_date, download=2)
+        )
+        session.add(DownloadDaily(resource_id=resource['id'], date=today, download=1))
+        session.commit()
+
+        result = self.runner.invoke(feedback, ['rollup-downloads', '--keep-days', '30'])
+
+        assert 'Rollup downloads: SUCCESS (1 daily rows compacted)' in result.output
+        daily = session.query(DownloadDaily).all()
+        assert [(row.date, row.download) for row in daily] == [(today, 1)]
+        monthly = session.query(DownloadMonthly).all()
+        assert [(row.month, row.download) for row in monthly] == [
+            (old_date.replace(day=1), 2)
+        ]
+
+    def test_worker(self):
+        self.runner.invoke(
+            feedback, ['init', '--modules', 'download', '--dbname', engine.url.database]
+        )
+        resource = factories.Resource()
+        client = fakeredis.FakeStrictRedis()
+        download_queue = RedisQueue(client, worker_id='worker1')
+        download_queue.put([resource['id']] * 4)
+        # An event popped by this worker before it stopped without applying it
+        download_queue.pop(1)
+        # An event popped by another worker, which is left as it is
+        other_queue = RedisQueue(client, worker_id='worker2')
+        other_queue.pop(1)
+
+        with patch(
+            'ckanext.feedback.command.feedback.download_queue_service'
+            '.get_shared_download_queue',
+            return_value=download_queue,
+        ) as mock_get_shared_download_queue:
+            result = self.runner.invoke(
+                feedback, ['worker', '--once', '-b', '2', '--worker-id', 'worker1']
+            )
+
+        mock_get_shared_download_queue.assert_called_once_with('worker1')
+        assert client.llen(other_queue.processing_key) == 1
+
+        assert 'Recovered 1 downloads of a stopped worker' in result.output
+        assert 'Worker: SUCCESS (3 downloads applied)' in result.output
+        assert (
+            session.query(DownloadSummary.download)
+            .filter(DownloadSummary.resource_id == resource['id'])
+            .scalar()
+        ) == 3
+
+    def test_export(self, tmp_path):
+        self.runner.invoke(
+            feedback, ['init', '--modules', 'resource', '--dbname', engine.url.database]
+        )
+        resource = factories.Resource()
+        session.add(
+            ResourceComment(
+                id='comment',
+                resource_id=resource['id'],
+                content='test',
+                created=datetime.datetime(2000, 1, 1),
+                approval=True,
+            )
+        )
+        session.commit()
+        output = tmp_path / 'resource_comment.ndjson'
+
+        result = self.runner.invoke(
+            feedback,
+            [
+                'export',
+                'resource_comment',
+                '--format',
+                'ndjson',
+                '--output',
+                str(output),
+                '--created-from',
+                '2000-01-01',
+                '--status',
+                'approved',
+            ],
+        )
+
+        assert 'Export resource_comment: SUCCESS' in result.output
+        assert '"id": "comment"' in output.read_text()
+
+    def test_import(self, tmp_path):
+        self.runner.invoke(
+            feedback, ['init', '--modules', 'resource', '--dbname', engine.url.database]
+        )
+        resource = factories.Resource()
+        path = tmp_path / 'resource_comment.csv'
+        path.write_text(
+            'id,resource_id,content,rating,approval\n'
+            f'comment,{resource["id"]},test,4,True\n'
+            'unknown,unknown,test,4,True\n'
+        )
+
+        result = self.runner.invoke(
+            feedback, ['import', 'resource_comment', '-i', str(path), '--skip-invalid']
+        )
+
+        assert (
+            'Import resource_comment: SUCCESS'
+            ' (1 rows imported, 0 already existed, 1 skipped)' in result.output
+        )
+        assert session.query(ResourceComment).count() == 1
+        assert session.query(ResourceCommentSummary).one().rating == 4
+
+    def test_import_unknown_resource(self, tmp_path):
+        self.runner.invoke(
+            feedback, ['init', '--modules', 'resource', '--dbname', engine.url.database]
+        )
+        path = tmp_path / 'resource_comment.csv'
+        path.write_text('id,resource_id,content\ncomment,unknown,test\n')
+
+        result = self.runner.invoke(
+            feedback, ['import', 'resource_comment', '-i', str(path)]
+        )
+
+        assert result.exit_code != 0
+        assert session.query(ResourceComment).count() == 0
+
+    def test_summaries(self, tmp_path):
+        self.runner.invoke(
+            feedback, ['init', '--modules', 'resource', '--dbname', engine.url.database]
+        )
+        resource = factories.Resource()
+        session.add(ResourceComment(resource_id=resource['id'], content='test'))
+        session.add(ResourceCommentSummary(resource_id=resource['id'], comment=1))
+        session.commit()
+        checkpoint = str(tmp_path / 'checkpoint.json')
+
+        result = self.runner.invoke(
+            feedback, ['summaries', 'verify', '-m', 'resource', '-c', checkpoint]
+        )
+        assert result.exit_code == 1
+        assert f'resource_comment_summary {resource["id"]} comment: 1 != 0' in (
+            result.output
+        )
+
+        result = self.runner.invoke(
+            feedback, ['summaries', 'rebuild', '-m', 'resource']
+        )
+        assert 'Rebuild summaries: SUCCESS (1 drifted values corrected)' in (
+            result.output
+        )
+
+        result = self.runner.invoke(feedback, ['summaries', 'verify', '-m', 'resource'])
+        assert 'Verify summaries: SUCCESS (no drifted values)' in result.output
+
+    def test_export_unknown_table(self):
+        result = self.runner.invoke(feedback, ['export', 'user'])
+        assert result.exit_code != 0
+
+    def test_rollup_downloads_error(self):
+        with patch(
+            'ckanext.feedback.command.feedback.download_summary_service'
+            '.rollup_daily_downloads',
+            side_effect=Exception('Error message'),
+        ):
+            result = self.runner.invoke(feedback, ['rollup-downloads'])
+
+        assert result.exit_code != 0
+
+    def test_worker_without_shared_queue(self):
+        result = self.runner.invoke(feedback, ['worker', '--once'])
+        assert result.exit_code != 0
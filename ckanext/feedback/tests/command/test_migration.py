@@ -0,0 +1,212 @@
+from unittest.mock import MagicMock, patch
+
+import pytest
+from ckan import model
+from ckan.tests import factories
+from sqlalchemy import inspect
+from sqlalchemy.exc import DBAPIError
+
+from ckanext.feedback.command import migration
+from ckanext.feedback.command.feedback import (
+    create_download_tables,
+    create_resource_tables,
+    create_utilization_tables,
+    drop_download_tables,
+    drop_resource_tables,
+)
+from ckanext.feedback.models.download import DownloadDaily, DownloadSummary
+from ckanext.feedback.models.migration import SchemaVersion
+from ckanext.feedback.models.package import PackageFeedbackSummary
+from ckanext.feedback.models.resource_comment import (
+    ResourceComment,
+    ResourceCommentSummary,
+)
+from ckanext.feedback.models.session import session
+from ckanext.feedback.models.utilization import UtilizationSummary
+
+engine = model.repo.session.get_bind()
+
+
+def get_index_names(table_name):
+    return {index['name'] for index in inspect(engine).get_indexes(table_name)}
+
+
+@pytest.mark.usefixtures('clean_db', 'with_plugins', 'with_request_context')
+class TestMigration:
+    @classmethod
+    def setup_class(cls):
+        model.repo.init_db()
+        create_utilization_tables(engine)
+        create_resource_tables(engine)
+        create_download_tables(engine)
+
+    def teardown_method(self, method):
+        SchemaVersion.__table__.drop(engine, checkfirst=True)
+        drop_download_tables(engine)
+        create_download_tables(engine)
+        drop_resource_tables(engine)
+        create_resource_tables(engine)
+
+    def test_upgrade(self):
+        applied = migration.upgrade(engine)
+
+        assert [m.version for m in applied] == [m.version for m in migration.migrations]
+        assert migration.get_applied_versions(engine) == {
+            m.version for m in migration.migrations
+        }
+        assert migration.upgrade(engine) == []
+
+    def test_upgrade_applies_pending_migrations_only(self):
+        upgrade = MagicMock()
+        pending = migration.Migration(
+            migration.get_head_version() + 1, 'pending', upgrade
+        )
+        migration.stamp_initialized(
+            engine, ['utilization', 'resource', 'download', 'search', 'package']
+        )
+
+        with patch.object(migration, 'migrations', migration.migrations + [pending]):
+            assert migration.upgrade(engine) == [pending]
+
+        upgrade.assert_called_once_with(engine)
+
+    def test_upgrade_leaves_skipped_migration_pending(self):
+        with patch.object(migration, 'create_search_indexes', return_value=False):
+            applied = migration.upgrade(engine)
+
+        assert 5 not in [m.version for m in applied]
+        assert 5 not in migration.get_applied_versions(engine)
+
+    def test_stamp_initialized(self):
+        migration.stamp_initialized(engine, ['resource'])
+        assert migration.get_applied_versions(engine) == {6}
+
+        migration.stamp_initialized(
+            engine, ['utilization', 'resource', 'download', 'package']
+        )
+        assert migration.get_applied_versions(engine) == {1, 2, 3, 4, 6, 7}
+
+    def test_get_initialized_modules(self):
+        assert migration.get_initialized_modules(engine) == [
+            'utilization',
+            'resource',
+            'download',
+        ]
+        drop_download_tables(engine)
+        assert migration.get_initialized_modules(engine) == ['utilization', 'resource']
+
+    def test_create_initial_tables_of_initialized_modules(self):
+        drop_resource_tables(engine)
+        drop_download_tables(engine)
+        UtilizationSummary.__table__.drop(engine)
+
+        migration.create_initial_tables(engine)
+        migration.create_download_time_series_tables(engine)
+
+        assert engine.has_table(UtilizationSummary.__tablename__)
+        assert not engine.has_table(ResourceComment.__tablename__)
+        assert not engine.has_table(DownloadSummary.__tablename__)
+        assert not engine.has_table(DownloadDaily.__tablename__)
+
+    def test_add_download_summary_unique_index(self):
+        engine.execute('DROP INDEX idx_download_summary_resource_id')
+        resource = factories.Resource()
+        for id, download in [('id1', 2), ('id2', 3)]:
+            session.add(
+                DownloadSummary(id=id, resource_id=resource['id'], download=download)
+            )
+        session.commit()
+
+        migration.add_download_summary_unique_index(engine)
+
+        rows = session.query(DownloadSummary).all()
+        assert [(row.id, row.download) for row in rows] == [('id1', 5)]
+        assert 'idx_download_summary_resource_id' in get_index_names('download_summary')
+
+    def test_create_index_concurrently(self):
+        engine.execute('DROP INDEX idx_download_summary_resource_id')
+        index = next(iter(DownloadSummary.__table__.indexes))
+
+        migration.create_index_concurrently(engine, index)
+        migration.create_index_concurrently(engine, index)
+
+        assert 'idx_download_summary_resource_id' in get_index_names('download_summary')
+
+    def test_create_search_indexes(self):
+        try:
+            engine.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        except DBAPIError:
+            pytest.skip('pg_trgm is not available')
+
+        assert migration.create_search_indexes(engine)
+        assert 'idx_utilization_title_trgm' in get_index_names('utilization')
+        assert 'idx_feedback_package_name_trgm' in get_index_names('package')
+
+    def test_create_search_indexes_without_pg_trgm(self):
+        mock_engine = MagicMock()
+        mock_engine.begin.side_effect = DBAPIError('statement', {}, Exception())
+
+        with patch.object(
+            migration, 'execute_create_index_concurrently'
+        ) as mock_create_index:
+            assert not migration.create_search_indexes(mock_engine)
+
+        mock_create_index.assert_not_called()
+
+    def test_add_resource_comment_summary_rating_totals(self):
+        resource = factories.Resource()
+        session.add(
+            ResourceComment(
+                resource_id=resource['id'], rating=4, content='test', approval=True
+            )
+        )
+        session.add(ResourceComment(resource_id=resource['id'], rating=2))
+        session.add(ResourceCommentSummary(resource_id=resource['id'], comment=1))
+        session.commit()
+        engine.execute('ALTER TABLE resource_comment_summary DROP COLUMN rating_sum')
+        engine.execute('ALTER TABLE resource_comment_summary DROP COLUMN rating_count')
+
+        migration.add_resource_comment_summary_rating_totals(engine)
+        session.expire_all()
+
+        summary = session.query(ResourceCommentSummary).one()
+        assert summary.rating_sum == 4
+        assert summary.rating_count == 1
+        assert not migration.add_column(
+            engine,
+            ResourceCommentSummary.__table__,
+            ResourceCommentSummary.__table__.c.rating_sum,
+        )
+
+    def test_create_package_feedback_summary(self):
+        resource = factories.Resource()
+        other_resource = factories.Resource(package_id=resource['package_id'])
+        session.add(
+            DownloadSummary(id='download', resource_id=resource['id'], download=2)
+        )
+        session.add(
+            DownloadSummary(id='other', resource_id=other_resource['id'], download=3)
+        )
+        session.add(
+            ResourceCommentSummary(
+                resource_id=resource['id'],
+                comment=1,
+                rating=4,
+                rating_sum=8,
+                rating_count=2,
+            )
+        )
+        session.add(UtilizationSummary(resource_id=resource['id'], utilization=1))
+        session.commit()
+        PackageFeedbackSummary.__table__.drop(engine)
+
+        migration.create_package_feedback_summary(engine)
+
+        summary = session.query(PackageFeedbackSummary).one()
+        assert summary.package_id == resource['package_id']
+        assert summary.download == 5
+        assert summary.comment == 1
+        assert summary.rating == 4
+        assert summary.rating_count == 2
+        assert summary.utilization == 1
+        assert summary.issue_resolution == 0
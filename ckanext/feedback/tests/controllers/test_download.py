@@ -57,3 +57,47 @@ class TestDownloadController:
             )
             assert get_downloads(resource['id']) is None
             assert download
+
+    @patch('ckanext.feedback.controllers.download.get_download_buffer')
+    @patch('ckanext.feedback.controllers.download.download')
+    def test_extended_download_with_buffer(self, download, mock_get_download_buffer):
+        resource = factories.Resource()
+        with self.app.test_request_context(headers={'Sec-Fetch-Dest': 'document'}):
+            DownloadController.extended_download(
+                'package_type', resource['package_id'], resource['id'], None
+            )
+            mock_get_download_buffer.return_value.add.assert_called_once_with(
+                resource['id']
+            )
+            assert get_downloads(resource['id']) is None
+            assert download
+
+    @patch('ckanext.feedback.controllers.download.get_download_buffer')
+    @patch('ckanext.feedback.controllers.download.publish_download')
+    @patch('ckanext.feedback.controllers.download.download')
+    def test_extended_download_with_queue(
+        self, download, mock_publish_download, mock_get_download_buffer
+    ):
+        resource = factories.Resource()
+        mock_publish_download.return_value = True
+        with self.app.test_request_context(headers={'Sec-Fetch-Dest': 'document'}):
+            DownloadController.extended_download(
+                'package_type', resource['package_id'], resource['id'], None
+            )
+            mock_publish_download.assert_called_once_with(resource['id'])
+            mock_get_download_buffer.assert_not_called()
+            assert get_downloads(resource['id']) is None
+            assert download
+
+    @patch('ckanext.feedback.controllers.download.is_first_download')
+    @patch('ckanext.feedback.controllers.download.download')
+    def test_extended_download_with_duplicate(self, download, mock_is_first_download):
+        resource = factories.Resource()
+        mock_is_first_download.return_value = False
+        with self.app.test_request_context(headers={'Sec-Fetch-Dest': 'document'}):
+            DownloadController.extended_download(
+                'package_type', resource['package_id'], resource['id'], None
+            )
+            mock_is_first_download.assert_called_once_with(resource['id'])
+            assert get_downloads(resource['id']) is None
+            assert download
@@ -1,3 +1,4 @@
+from datetime import date, datetime
 from unittest.mock import patch
 
 import pytest
@@ -6,6 +7,7 @@ from ckan import model
 from ckan.model import User
 from ckan.tests import factories
 from flask import Flask, g
+from werkzeug.datastructures import MultiDict
 
 from ckanext.feedback.command.feedback import (
     create_download_tables,
@@ -13,6 +15,9 @@ from ckanext.feedback.command.feedback import (
     create_utilization_tables,
 )
 from ckanext.feedback.controllers.management import ManagementController
+from ckanext.feedback.models.resource_comment import ResourceCommentCategory
+from ckanext.feedback.models.utilization import UtilizationCommentCategory
+from ckanext.feedback.services.management.comments import BulkResult, CommentsPage
 
 engine = model.repo.session.get_bind()
 
@@ -32,45 +37,149 @@ class TestManagementController:
     @patch('ckanext.feedback.controllers.management.toolkit.render')
     @patch('ckanext.feedback.controllers.management.request')
     @patch('ckanext.feedback.controllers.management.utilization_detail_service')
-    @patch('ckanext.feedback.controllers.management.resource_comment_service')
+    @patch('ckanext.feedback.controllers.management.comments_service')
     def test_comments(
         self,
-        mock_comment_service,
+        mock_comments_service,
         mock_detail_service,
         mock_request,
         mock_render,
     ):
         categories = ['category']
-        utilization_comments = ['utilization_comment']
-        resource_comments = ['resource_comment']
+        utilization_comments_page = CommentsPage(['utilization_comment'], None, None)
+        resource_comments_page = CommentsPage(['resource_comment'], None, None)
         user_dict = factories.User()
         user = User.get(user_dict['id'])
         user_env = {'REMOTE_USER': six.ensure_str(user.name)}
 
-        mock_comment_service.get_resource_comments.return_value = resource_comments
         mock_detail_service.get_utilization_comment_categories.return_value = categories
-        mock_detail_service.get_utilization_comments.return_value = utilization_comments
-        mock_request.args.get.return_value = 'utilization-comments'
+        mock_comments_service.decode_cursor.return_value = None
+        mock_comments_service.get_utilization_comments_page.return_value = (
+            utilization_comments_page
+        )
+        mock_comments_service.get_resource_comments_page.return_value = (
+            resource_comments_page
+        )
+        mock_comments_service.count_utilization_comments.return_value = 1
+        mock_comments_service.count_resource_comments.return_value = 2
+        mock_request.args = MultiDict()
 
         with self.app.test_request_context(path='/', environ_base=user_env):
             g.userobj = user
             ManagementController.comments()
 
-        mock_detail_service.get_utilization_comment_categories.assert_called_once()
-        mock_detail_service.get_utilization_comments.assert_called_once()
-        mock_comment_service.get_resource_comments.assert_called_once()
-        mock_request.args.get.assert_called_once_with('tab', 'utilization-comments')
+        filters = {
+            'approval': None,
+            'resource_id': None,
+            'created_from': None,
+            'created_to': None,
+            'categories': None,
+        }
+        mock_comments_service.get_utilization_comments_page.assert_called_once_with(
+            50, after=None, before=None, **filters
+        )
+        mock_comments_service.get_resource_comments_page.assert_called_once_with(
+            50, **filters
+        )
+        mock_comments_service.count_utilization_comments.assert_called_once_with(
+            **filters
+        )
+        mock_comments_service.count_resource_comments.assert_called_once_with(**filters)
 
         mock_render.assert_called_once_with(
             'management/comments.html',
             {
                 'categories': categories,
-                'utilization_comments': utilization_comments,
-                'resource_comments': resource_comments,
+                'utilization_comments': ['utilization_comment'],
+                'utilization_comments_page': utilization_comments_page,
+                'utilization_comments_count': 1,
+                'resource_comments': ['resource_comment'],
+                'resource_comments_page': resource_comments_page,
+                'resource_comments_count': 2,
+                'filter_args': {
+                    'status': [],
+                    'category': [],
+                    'resource_id': '',
+                    'created_from': '',
+                    'created_to': '',
+                },
                 'tab': 'utilization-comments',
             },
         )
 
+    @patch('ckanext.feedback.controllers.management.toolkit.render')
+    @patch('ckanext.feedback.controllers.management.request')
+    @patch('ckanext.feedback.controllers.management.comments_service')
+    def test_comments_with_filters(
+        self,
+        mock_comments_service,
+        mock_request,
+        mock_render,
+    ):
+        user_dict = factories.User()
+        user = User.get(user_dict['id'])
+        user_env = {'REMOTE_USER': six.ensure_str(user.name)}
+        cursor = (datetime(2000, 1, 2), 'comment_id')
+
+        mock_comments_service.decode_cursor.side_effect = lambda value: (
+            cursor if value else None
+        )
+        mock_request.args = MultiDict(
+            [
+                ('tab', 'resource-comments'),
+                ('status', 'waiting'),
+                ('category', 'REQUEST'),
+                ('category', 'UNKNOWN'),
+                ('resource_id', 'resource_id'),
+                ('created_from', '2000-01-01'),
+                ('created_to', 'invalid'),
+                ('after', '2000-01-02T00:00:00,comment_id'),
+            ]
+        )
+
+        with self.app.test_request_context(path='/', environ_base=user_env):
+            g.userobj = user
+            ManagementController.comments()
+
+        filters = {
+            'approval': False,
+            'resource_id': 'resource_id',
+            'created_from': date(2000, 1, 1),
+            'created_to': None,
+        }
+        mock_comments_service.get_utilization_comments_page.assert_called_once_with(
+            50, categories=[UtilizationCommentCategory.REQUEST], **filters
+        )
+        mock_comments_service.get_resource_comments_page.assert_called_once_with(
+            50,
+            after=cursor,
+            before=None,
+            categories=[ResourceCommentCategory.REQUEST],
+            **filters,
+        )
+        assert mock_render.call_args[0][1]['tab'] == 'resource-comments'
+
+    def test_get_comment_filters(self):
+        filter_args = {
+            'status': ['waiting', 'approved'],
+            'category': [],
+            'package_id': '',
+            'resource_id': '',
+            'created_from': '',
+            'created_to': '2000-01-31',
+        }
+        assert ManagementController._get_comment_filters(filter_args) == {
+            'approval': None,
+            'package_id': None,
+            'resource_id': None,
+            'created_from': None,
+            'created_to': date(2000, 1, 31),
+        }
+
+        filter_args['status'] = ['approved']
+        filters = ManagementController._get_comment_filters(filter_args)
+        assert filters['approval'] is True
+
     @patch('ckanext.feedback.controllers.management._')
     @patch('ckanext.feedback.controllers.management.redirect')
     @patch('ckanext.feedback.controllers.management.url_for')
@@ -172,12 +281,8 @@ class TestManagementController:
         _,
     ):
         comments = ['comment']
-        resource_comment_summaries = ['resource_comment_summary']
 
         mock_request.form.getlist.return_value = comments
-        mock_comments_service.get_resource_comment_summaries.return_value = (
-            resource_comment_summaries
-        )
         mock_c.userobj.id = 'user_id'
         mock_url_for.return_value = 'url'
         mock_redirect.return_value = 'redirect_response'
@@ -190,15 +295,9 @@ class TestManagementController:
             response = ManagementController.approve_bulk_resource_comments()
 
         mock_request.form.getlist.assert_called_once_with('resource-comments-checkbox')
-        mock_comments_service.get_resource_comment_summaries.assert_called_once_with(
-            comments
-        )
         mock_comments_service.approve_resource_comments.assert_called_once_with(
             comments, 'user_id'
         )
-        mock_comments_service.refresh_resources_comments.assert_called_once_with(
-            resource_comment_summaries
-        )
         mock_session_commit.assert_called_once()
         mock_flash_success.assert_called_once_with(
             f'{len(comments)} ' + _('bulk approval completed.'),
@@ -337,15 +436,8 @@ class TestManagementController:
         _,
     ):
         comments = ['comment1', 'comment2']
-        resource_comment_summaries = [
-            'resource_comment_summary1',
-            'resource_comment_summary2',
-        ]
 
         mock_request.form.getlist.return_value = comments
-        mock_comments_service.get_resource_comment_summaries.return_value = (
-            resource_comment_summaries
-        )
         mock_url_for.return_value = 'url'
         mock_redirect.return_value = 'redirect_response'
         user_dict = factories.User()
@@ -357,13 +449,7 @@ class TestManagementController:
             response = ManagementController.delete_bulk_resource_comments()
 
         mock_request.form.getlist.assert_called_once_with('resource-comments-checkbox')
-        mock_comments_service.get_resource_comment_summaries.assert_called_once_with(
-            comments
-        )
         mock_comments_service.delete_resource_comments.assert_called_once_with(comments)
-        mock_comments_service.refresh_resources_comments.assert_called_once_with(
-            resource_comment_summaries
-        )
         mock_session_commit.assert_called_once()
         mock_flash_success.assert_called_once_with(
             f'{len(comments)} ' + _('bulk delete completed.'),
@@ -402,3 +488,231 @@ class TestManagementController:
         mock_redirect.assert_called_once_with('url')
 
         assert response == 'redirect_response'
+
+    @patch('ckanext.feedback.controllers.management._')
+    @patch('ckanext.feedback.controllers.management.redirect')
+    @patch('ckanext.feedback.controllers.management.url_for')
+    @patch('ckanext.feedback.controllers.management.helpers.flash_success')
+    @patch('ckanext.feedback.controllers.management.session.commit')
+    @patch('ckanext.feedback.controllers.management.comments_service')
+    @patch('ckanext.feedback.controllers.management.request')
+    @patch('ckanext.feedback.controllers.management.c')
+    def test_approve_matching_utilization_comments(
+        self,
+        mock_c,
+        mock_request,
+        mock_comments_service,
+        mock_session_commit,
+        mock_flash_success,
+        mock_url_for,
+        mock_redirect,
+        _,
+    ):
+        mock_request.form = MultiDict(
+            [
+                ('status', 'waiting'),
+                ('category', 'REQUEST'),
+                ('package_id', 'package_id'),
+            ]
+        )
+        mock_comments_service.approve_matching_utilization_comments.return_value = iter(
+            [BulkResult(2, {'utilization_id'}), BulkResult(1, {'utilization_id'})]
+        )
+        mock_c.userobj.id = 'user_id'
+        mock_url_for.return_value = 'url'
+        mock_redirect.return_value = 'redirect_response'
+        user_dict = factories.User()
+        user = User.get(user_dict['id'])
+        user_env = {'REMOTE_USER': six.ensure_str(user.name)}
+
+        with self.app.test_request_context(path='/', environ_base=user_env):
+            g.userobj = user
+            response = ManagementController.approve_matching_utilization_comments()
+
+        mock_comments_service.approve_matching_utilization_comments.assert_called_once_with(  # noqa: E501
+            'user_id',
+            1000,
+            approval=False,
+            package_id='package_id',
+            resource_id=None,
+            created_from=None,
+            created_to=None,
+            categories=[UtilizationCommentCategory.REQUEST],
+        )
+        assert mock_session_commit.call_count == 2
+        mock_flash_success.assert_called_once_with(
+            f'3 {_("comments approved.")} 1 {_("utilizations refreshed.")}',
+            allow_html=True,
+        )
+        mock_url_for.assert_called_once_with(
+            'management.comments', tab='utilization-comments'
+        )
+        assert response == 'redirect_response'
+
+    @patch('ckanext.feedback.controllers.management._')
+    @patch('ckanext.feedback.controllers.management.redirect')
+    @patch('ckanext.feedback.controllers.management.url_for')
+    @patch('ckanext.feedback.controllers.management.helpers.flash_success')
+    @patch('ckanext.feedback.controllers.management.session.commit')
+    @patch('ckanext.feedback.controllers.management.comments_service')
+    @patch('ckanext.feedback.controllers.management.request')
+    @patch('ckanext.feedback.controllers.management.config')
+    def test_delete_matching_resource_comments(
+        self,
+        mock_config,
+        mock_request,
+        mock_comments_service,
+        mock_session_commit,
+        mock_flash_success,
+        mock_url_for,
+        mock_redirect,
+        _,
+    ):
+        mock_config.get.return_value = '10'
+        mock_request.form = MultiDict([('resource_id', 'resource_id')])
+        mock_comments_service.delete_matching_resource_comments.return_value = iter(
+            [BulkResult(10, {'resource_id'}), BulkResult(4, {'resource_id'})]
+        )
+        mock_url_for.return_value = 'url'
+        mock_redirect.return_value = 'redirect_response'
+        user_dict = factories.User()
+        user = User.get(user_dict['id'])
+        user_env = {'REMOTE_USER': six.ensure_str(user.name)}
+
+        with self.app.test_request_context(path='/', environ_base=user_env):
+            g.userobj = user
+            response = ManagementController.delete_matching_resource_comments()
+
+        mock_comments_service.delete_matching_resource_comments.assert_called_once_with(
+            10,
+            approval=None,
+            package_id=None,
+            resource_id='resource_id',
+            created_from=None,
+            created_to=None,
+            categories=None,
+        )
+        assert mock_session_commit.call_count == 2
+        mock_flash_success.assert_called_once_with(
+            f'14 {_("comments deleted.")} 1 {_("resource summaries refreshed.")}',
+            allow_html=True,
+        )
+        mock_url_for.assert_called_once_with(
+            'management.comments', tab='resource-comments'
+        )
+        assert response == 'redirect_response'
+
+    @patch('ckanext.feedback.controllers.management._')
+    @patch('ckanext.feedback.controllers.management.redirect')
+    @patch('ckanext.feedback.controllers.management.url_for')
+    @patch('ckanext.feedback.controllers.management.helpers.flash_error')
+    @patch('ckanext.feedback.controllers.management.session.commit')
+    @patch('ckanext.feedback.controllers.management.comments_service')
+    @patch('ckanext.feedback.controllers.management.request')
+    def test_delete_matching_utilization_comments_without_filters(
+        self,
+        mock_request,
+        mock_comments_service,
+        mock_session_commit,
+        mock_flash_error,
+        mock_url_for,
+        mock_redirect,
+        _,
+    ):
+        mock_request.form = MultiDict()
+        mock_comments_service.delete_matching_utilization_comments.side_effect = (
+            ValueError('No filter is set to select the comments to delete')
+        )
+        mock_url_for.return_value = 'url'
+        mock_redirect.return_value = 'redirect_response'
+        user_dict = factories.User()
+        user = User.get(user_dict['id'])
+        user_env = {'REMOTE_USER': six.ensure_str(user.name)}
+
+        with self.app.test_request_context(path='/', environ_base=user_env):
+            g.userobj = user
+            response = ManagementController.delete_matching_utilization_comments()
+
+        mock_session_commit.assert_not_called()
+        mock_flash_error.assert_called_once()
+        mock_url_for.assert_called_once_with(
+            'management.comments', tab='utilization-comments'
+        )
+        assert response == 'redirect_response'
+
+    @patch('ckanext.feedback.controllers.management.export_service')
+    @patch('ckanext.feedback.controllers.management.request')
+    def test_export(self, mock_request, mock_export_service):
+        mock_request.args = MultiDict(
+            [('format', 'ndjson'), ('status', 'approved'), ('created_to', '2000-01-31')]
+        )
+        mock_export_service.export_models = {'resource_comment': None}
+        mock_export_service.export_formats = ['csv', 'ndjson']
+        mock_export_service.export_rows.return_value = iter(['{"id": "1"}\n'])
+        user_dict = factories.Sysadmin()
+        user = User.get(user_dict['id'])
+        user_env = {'REMOTE_USER': six.ensure_str(user.name)}
+
+        with self.app.test_request_context(path='/', environ_base=user_env):
+            g.userobj = user
+            response = ManagementController.export('resource_comment')
+            assert response.get_data() == b'{"id": "1"}\n'
+
+        mock_export_service.export_rows.assert_called_once_with(
+            'resource_comment',
+            'ndjson',
+            created_from=None,
+            created_to=date(2000, 1, 31),
+            approval=True,
+        )
+        assert response.mimetype == 'application/x-ndjson'
+        assert response.headers['Content-Disposition'] == (
+            'attachment; filename="resource_comment.ndjson"'
+        )
+
+    @patch('ckanext.feedback.controllers.management.toolkit.abort')
+    @patch('ckanext.feedback.controllers.management.request')
+    def test_export_unknown_table(self, mock_request, mock_abort):
+        mock_request.args = MultiDict()
+        mock_abort.side_effect = Exception('abort')
+        user_dict = factories.Sysadmin()
+        user = User.get(user_dict['id'])
+        user_env = {'REMOTE_USER': six.ensure_str(user.name)}
+
+        with self.app.test_request_context(path='/', environ_base=user_env):
+            g.userobj = user
+            with pytest.raises(Exception):
+                ManagementController.export('user')
+
+        mock_abort.assert_called_once_with(404)
+
+    @patch('ckanext.feedback.controllers.management.instrumentation_service')
+    def test_metrics(self, mock_instrumentation_service):
+        mock_instrumentation_service.is_enabled.return_value = True
+        mock_instrumentation_service.get_metrics_text.return_value = 'metrics\n'
+        user_dict = factories.Sysadmin()
+        user = User.get(user_dict['id'])
+        user_env = {'REMOTE_USER': six.ensure_str(user.name)}
+
+        with self.app.test_request_context(path='/', environ_base=user_env):
+            g.userobj = user
+            response = ManagementController.metrics()
+
+        assert response.get_data() == b'metrics\n'
+        assert response.mimetype == 'text/plain'
+
+    @patch('ckanext.feedback.controllers.management.toolkit.abort')
+    @patch('ckanext.feedback.controllers.management.instrumentation_service')
+    def test_metrics_disabled(self, mock_instrumentation_service, mock_abort):
+        mock_instrumentation_service.is_enabled.return_value = False
+        mock_abort.side_effect = Exception('abort')
+        user_dict = factories.Sysadmin()
+        user = User.get(user_dict['id'])
+        user_env = {'REMOTE_USER': six.ensure_str(user.name)}
+
+        with self.app.test_request_context(path='/', environ_base=user_env):
+            g.userobj = user
+            with pytest.raises(Exception):
+                ManagementController.metrics()
+
+        mock_abort.assert_called_once_with(404)
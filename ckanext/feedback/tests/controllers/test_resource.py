@@ -195,6 +195,7 @@ class TestResourceController:
         g.userobj = user
 
         mock_request.form.get.side_effect = [resource_comment_id]
+        mock_comment_service.approve_resource_comment.return_value = 'comment'
 
         mock_url_for.return_value = 'resource comment url'
         ResourceController.approve_comment(resource_id)
@@ -202,8 +203,8 @@ class TestResourceController:
         mock_comment_service.approve_resource_comment.assert_called_once_with(
             resource_comment_id, user.id
         )
-        mock_summary_service.refresh_resource_summary.assert_called_once_with(
-            resource_id
+        mock_summary_service.add_comment_to_resource_summary.assert_called_once_with(
+            'comment'
         )
         mock_session_commit.assert_called_once()
         mock_url_for.assert_called_once_with(
@@ -212,6 +213,30 @@ class TestResourceController:
 
         mock_redirect.assert_called_once_with('resource comment url')
 
+    @patch('ckanext.feedback.controllers.resource.request')
+    @patch('ckanext.feedback.controllers.resource.summary_service')
+    @patch('ckanext.feedback.controllers.resource.comment_service')
+    @patch('ckanext.feedback.controllers.resource.session.commit')
+    @patch('ckanext.feedback.controllers.resource.redirect')
+    def test_approve_comment_already_approved(
+        self,
+        mock_redirect,
+        mock_session_commit,
+        mock_comment_service,
+        mock_summary_service,
+        mock_request,
+    ):
+        user_dict = factories.Sysadmin()
+        g.userobj = User.get(user_dict['id'])
+
+        mock_request.form.get.side_effect = ['resource comment id']
+        mock_comment_service.approve_resource_comment.return_value = None
+
+        ResourceController.approve_comment('resource id')
+
+        mock_summary_service.add_comment_to_resource_summary.assert_not_called()
+        mock_session_commit.assert_called_once()
+
     @patch('ckanext.feedback.controllers.resource.toolkit.abort')
     @patch('ckanext.feedback.controllers.resource.summary_service')
     @patch('ckanext.feedback.controllers.resource.comment_service')
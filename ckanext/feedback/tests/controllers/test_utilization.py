@@ -7,6 +7,7 @@ from ckan.logic import get_action
 from ckan.model import Resource, Session, User
 from ckan.tests import factories
 from flask import Flask, g
+from werkzeug.datastructures import MultiDict
 
 from ckanext.feedback.command.feedback import (
     create_download_tables,
@@ -31,9 +32,9 @@ class TestUtilizationController:
         self.app = Flask(__name__)
 
     @patch('ckanext.feedback.controllers.utilization.toolkit.render')
-    @patch('ckanext.feedback.controllers.utilization.search_service.get_utilizations')
+    @patch('ckanext.feedback.controllers.utilization.search_service')
     @patch('ckanext.feedback.controllers.utilization.request')
-    def test_search(self, mock_request, mock_get_utilizations, mock_render):
+    def test_search(self, mock_request, mock_search_service, mock_render):
         dataset = factories.Dataset()
         user_dict = factories.Sysadmin()
         user = User.get(user_dict['id'])
@@ -43,56 +44,100 @@ class TestUtilizationController:
         keyword = 'keyword'
         disable_keyword = 'disable keyword'
 
-        mock_request.args.get.side_effect = lambda x, default: {
-            'id': resource['id'],
-            'keyword': keyword,
-            'disable_keyword': disable_keyword,
-        }.get(x, default)
+        mock_request.args = MultiDict(
+            {
+                'id': resource['id'],
+                'keyword': keyword,
+                'disable_keyword': disable_keyword,
+                'page': '3',
+            }
+        )
+        mock_search_service.get_utilizations.return_value = ['utilization']
+        mock_search_service.get_utilizations_count.return_value = 41
 
         with self.app.test_request_context(path='/', environ_base=user_env):
             g.userobj = user
             UtilizationController.search()
 
-        mock_get_utilizations.assert_called_once_with(resource['id'], keyword, None)
-        mock_render.assert_called_once_with(
-            'utilization/search.html',
-            {
-                'keyword': keyword,
-                'disable_keyword': disable_keyword,
-                'utilizations': mock_get_utilizations.return_value,
-            },
+        mock_search_service.get_utilizations.assert_called_once_with(
+            resource['id'], keyword, None, limit=20, offset=40
         )
+        mock_search_service.get_utilizations_count.assert_called_once_with(
+            resource['id'], keyword, None
+        )
+        args = mock_render.call_args[0]
+        assert args[0] == 'utilization/search.html'
+        assert args[1]['id'] == resource['id']
+        assert args[1]['keyword'] == keyword
+        assert args[1]['disable_keyword'] == disable_keyword
+        assert args[1]['statuses'] == []
+        assert args[1]['utilizations'] == ['utilization']
+        assert args[1]['page'].item_count == 41
+        assert args[1]['page'].page == 3
 
     @patch('ckanext.feedback.controllers.utilization.toolkit.render')
-    @patch('ckanext.feedback.controllers.utilization.search_service.get_utilizations')
+    @patch('ckanext.feedback.controllers.utilization.search_service')
     @patch('ckanext.feedback.controllers.utilization.request')
-    def test_search_without_user(
-        self, mock_request, mock_get_utilizations, mock_render
-    ):
+    def test_search_with_status(self, mock_request, mock_search_service, mock_render):
+        user_dict = factories.Sysadmin()
+        user = User.get(user_dict['id'])
+        user_env = {'REMOTE_USER': user.name}
+
+        mock_request.args = MultiDict([('status', 'waiting')])
+        mock_search_service.get_utilizations.return_value = []
+        mock_search_service.get_utilizations_count.return_value = 0
+
+        with self.app.test_request_context(path='/', environ_base=user_env):
+            g.userobj = user
+            UtilizationController.search()
+
+        mock_search_service.get_utilizations.assert_called_once_with(
+            '', '', False, limit=20, offset=0
+        )
+
+    @patch('ckanext.feedback.controllers.utilization.toolkit.render')
+    @patch('ckanext.feedback.controllers.utilization.search_service')
+    @patch('ckanext.feedback.controllers.utilization.request')
+    def test_search_without_user(self, mock_request, mock_search_service, mock_render):
         dataset = factories.Dataset()
         resource = factories.Resource(package_id=dataset['id'])
 
         keyword = 'keyword'
         disable_keyword = 'disable keyword'
 
-        mock_request.args.get.side_effect = lambda x, default: {
-            'id': resource['id'],
-            'keyword': keyword,
-            'disable_keyword': disable_keyword,
-        }.get(x, default)
+        mock_request.args = MultiDict(
+            {
+                'id': resource['id'],
+                'keyword': keyword,
+                'disable_keyword': disable_keyword,
+                'status': 'waiting',
+            }
+        )
+        mock_search_service.get_utilizations.return_value = []
+        mock_search_service.get_utilizations_count.return_value = 0
 
         with self.app.test_request_context(path='/'):
             g.userobj = None
             UtilizationController.search()
 
-        mock_get_utilizations.assert_called_once_with(resource['id'], keyword, True)
-        mock_render.assert_called_once_with(
-            'utilization/search.html',
-            {
-                'keyword': keyword,
-                'disable_keyword': disable_keyword,
-                'utilizations': mock_get_utilizations.return_value,
-            },
+        mock_search_service.get_utilizations.assert_called_once_with(
+            resource['id'], keyword, True, limit=20, offset=0
+        )
+        mock_search_service.get_utilizations_count.assert_called_once_with(
+            resource['id'], keyword, True
+        )
+
+    def test_pager_url(self):
+        with self.app.test_request_context(path='/'):
+            with patch(
+                'ckanext.feedback.controllers.utilization.url_for'
+            ) as mock_url_for:
+                UtilizationController._pager_url(
+                    {'id': '', 'keyword': 'keyword', 'status': ['waiting']}, page=2
+                )
+
+        mock_url_for.assert_called_once_with(
+            'utilization.search', page=2, keyword='keyword', status=['waiting']
         )
 
     @patch('ckanext.feedback.controllers.utilization.toolkit.render')
@@ -0,0 +1,170 @@
+import uuid
+from unittest.mock import patch
+
+import pytest
+from ckan import model
+from ckan.plugins import toolkit
+from ckan.tests import factories, helpers
+
+from ckanext.feedback.command.feedback import (
+    create_download_tables,
+    create_resource_tables,
+    create_utilization_tables,
+)
+from ckanext.feedback.models.resource_comment import ResourceCommentSummary
+from ckanext.feedback.models.session import session
+from ckanext.feedback.services.download.summary import increment_resources_downloads
+from ckanext.feedback.services.resource.summary import refresh_package_comments
+
+engine = model.repo.session.get_bind()
+
+
+@pytest.mark.usefixtures('clean_db', 'with_plugins', 'with_request_context')
+class TestAction:
+    @classmethod
+    def setup_class(cls):
+        model.repo.init_db()
+        create_utilization_tables(engine)
+        create_resource_tables(engine)
+        create_download_tables(engine)
+
+    def setup_method(self, method):
+        self.resource = factories.Resource()
+        increment_resources_downloads({self.resource['id']: 3})
+        session.add(
+            ResourceCommentSummary(
+                id=str(uuid.uuid4()),
+                resource_id=self.resource['id'],
+                comment=1,
+                rating=4,
+                rating_sum=4,
+                rating_count=1,
+            )
+        )
+        refresh_package_comments([self.resource['id']])
+        session.commit()
+
+    def test_feedback_stats_show_package(self):
+        package = model.Package.get(self.resource['package_id'])
+
+        result = helpers.call_action(
+            'feedback_stats_show', context={'user': ''}, package_id=package.name
+        )
+
+        assert result == {
+            'package_id': package.id,
+            'downloads': 3,
+            'utilizations': 0,
+            'comments': 1,
+            'rating': 4.0,
+            'issue_resolutions': 0,
+        }
+
+    def test_feedback_stats_show_resource(self):
+        result = helpers.call_action(
+            'feedback_stats_show', resource_id=self.resource['id']
+        )
+
+        assert result['resource_id'] == self.resource['id']
+        assert result['downloads'] == 3
+        assert result['rating'] == 4.0
+
+    def test_feedback_stats_show_not_found(self):
+        with pytest.raises(toolkit.ObjectNotFound):
+            helpers.call_action('feedback_stats_show', package_id='unknown')
+
+    def test_feedback_stats_show_without_id(self):
+        with pytest.raises(toolkit.ValidationError):
+            helpers.call_action('feedback_stats_show')
+
+    def test_feedback_stats_list(self):
+        result = helpers.call_action(
+            'feedback_stats_list',
+            package_ids=f'{self.resource["package_id"]},unknown',
+            resource_ids=[self.resource['id']],
+        )
+
+        assert result['packages'][self.resource['package_id']]['downloads'] == 3
+        assert result['packages']['unknown']['downloads'] == 0
+        assert result['resources'][self.resource['id']]['comments'] == 1
+
+    def test_feedback_stats_list_with_package_name(self):
+        package = model.Package.get(self.resource['package_id'])
+
+        result = helpers.call_action('feedback_stats_list', package_ids=[package.name])
+
+        assert list(result['packages']) == [package.id]
+        assert result['packages'][package.id]['downloads'] == 3
+
+    def test_feedback_stats_list_deleted_resource(self):
+        helpers.call_action('resource_delete', id=self.resource['id'])
+
+        result = helpers.call_action(
+            'feedback_stats_list', resource_ids=[self.resource['id']]
+        )
+
+        assert result['resources'][self.resource['id']]['downloads'] == 0
+
+    def test_feedback_stats_show_deleted_resource(self):
+        helpers.call_action('resource_delete', id=self.resource['id'])
+
+        with pytest.raises(toolkit.ObjectNotFound):
+            helpers.call_action('feedback_stats_show', resource_id=self.resource['id'])
+
+    def test_feedback_stats_private_dataset(self):
+        organization = factories.Organization()
+        dataset = factories.Dataset(owner_org=organization['id'], private=True)
+        resource = factories.Resource(package_id=dataset['id'])
+        user = factories.User()
+        context = {'user': user['name'], 'ignore_auth': False}
+
+        with pytest.raises(toolkit.NotAuthorized):
+            helpers.call_action(
+                'feedback_stats_show', context=dict(context), package_id=dataset['name']
+            )
+        with pytest.raises(toolkit.NotAuthorized):
+            helpers.call_action(
+                'feedback_stats_show', context=dict(context), resource_id=resource['id']
+            )
+        with pytest.raises(toolkit.NotAuthorized):
+            helpers.call_action(
+                'feedback_stats_list',
+                context=dict(context),
+                package_ids=[self.resource['package_id'], dataset['id']],
+            )
+        with pytest.raises(toolkit.NotAuthorized):
+            helpers.call_action(
+                'feedback_stats_list',
+                context=dict(context),
+                resource_ids=[resource['id']],
+            )
+
+    def test_feedback_stats_private_dataset_member(self):
+        user = factories.User()
+        organization = factories.Organization(
+            users=[{'name': user['name'], 'capacity': 'member'}]
+        )
+        dataset = factories.Dataset(owner_org=organization['id'], private=True)
+
+        result = helpers.call_action(
+            'feedback_stats_list',
+            context={'user': user['name'], 'ignore_auth': False},
+            package_ids=[dataset['id']],
+        )
+
+        assert result['packages'][dataset['id']]['downloads'] == 0
+
+    @patch('ckanext.feedback.logic.action.get_max_ids')
+    def test_feedback_stats_list_too_many_ids(self, mock_get_max_ids):
+        mock_get_max_ids.return_value = 1
+
+        with pytest.raises(toolkit.ValidationError):
+            helpers.call_action(
+                'feedback_stats_list',
+                package_ids=[self.resource['package_id']],
+                resource_ids=[self.resource['id']],
+            )
+
+    def test_feedback_stats_list_invalid_ids(self):
+        with pytest.raises(toolkit.ValidationError):
+            helpers.call_action('feedback_stats_list', package_ids={'id': 'value'})
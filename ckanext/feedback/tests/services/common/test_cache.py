@@ -0,0 +1,182 @@
+import json
+from decimal import Decimal
+from unittest.mock import MagicMock, patch
+
+import fakeredis
+import pytest
+from redis.exceptions import ConnectionError
+
+from ckanext.feedback.services.common import cache
+from ckanext.feedback.services.common.cache import (
+    MISSING,
+    LRUCache,
+    RedisCache,
+    cached,
+    get_cache,
+    validate_config,
+)
+
+
+class TestLRUCache:
+    def test_get_and_set(self):
+        lru_cache = LRUCache(max_entries=2, ttl=60)
+        assert lru_cache.get('key') is MISSING
+
+        lru_cache.set('key', 0)
+        assert lru_cache.get('key') == 0
+
+        lru_cache.delete(['key', 'unknown_key'])
+        assert lru_cache.get('key') is MISSING
+
+    def test_evict_least_recently_used(self):
+        lru_cache = LRUCache(max_entries=2, ttl=60)
+        lru_cache.set('first', 1)
+        lru_cache.set('second', 2)
+        lru_cache.get('first')
+        lru_cache.set('third', 3)
+
+        assert lru_cache.get('first') == 1
+        assert lru_cache.get('second') is MISSING
+        assert lru_cache.get('third') == 3
+
+    @patch('ckanext.feedback.services.common.cache.time.monotonic')
+    def test_expire(self, mock_monotonic):
+        mock_monotonic.return_value = 0
+        lru_cache = LRUCache(max_entries=2, ttl=10)
+        lru_cache.set('key', 1)
+
+        mock_monotonic.return_value = 9
+        assert lru_cache.get('key') == 1
+        mock_monotonic.return_value = 10
+        assert lru_cache.get('key') is MISSING
+
+
+class TestRedisCache:
+    def test_get_and_set(self):
+        client = fakeredis.FakeStrictRedis()
+        redis_cache = RedisCache(client, ttl=60)
+        assert redis_cache.get('key') is MISSING
+
+        redis_cache.set('key', 3.5)
+        assert redis_cache.get('key') == 3.5
+        assert 0 < client.ttl('ckanext-feedback:key') <= 60
+
+        redis_cache.delete(['key'])
+        assert redis_cache.get('key') is MISSING
+
+    def test_get_and_set_decimal(self):
+        client = fakeredis.FakeStrictRedis()
+        redis_cache = RedisCache(client, ttl=60)
+
+        redis_cache.set('key', {'rating': Decimal('3.25'), 'count': 4})
+        assert redis_cache.get('key') == {'rating': Decimal('3.25'), 'count': 4}
+        assert isinstance(redis_cache.get('key')['rating'], Decimal)
+
+        # The values are stored as JSON, never as pickles
+        assert json.loads(client.get('ckanext-feedback:key')) == {
+            'rating': {'__decimal__': '3.25'},
+            'count': 4,
+        }
+
+    def test_set_unserializable_value(self):
+        redis_cache = RedisCache(fakeredis.FakeStrictRedis(), ttl=60)
+        with pytest.raises(TypeError):
+            redis_cache.set('key', object())
+
+    def test_redis_error(self):
+        client = MagicMock()
+        client.get.side_effect = ConnectionError()
+        client.set.side_effect = ConnectionError()
+        redis_cache = RedisCache(client, ttl=60)
+
+        redis_cache.set('key', 1)
+        assert redis_cache.get('key') is MISSING
+
+
+class TestCache:
+    def setup_method(self, method):
+        self.lru_cache = LRUCache(max_entries=10, ttl=60)
+
+    def test_cached(self):
+        func = MagicMock(return_value=1, __name__='get_package_value')
+        cached_func = cached('package')(func)
+
+        with patch.object(cache, 'get_cache', return_value=self.lru_cache):
+            assert cached_func('package_id') == 1
+            assert cached_func('package_id') == 1
+            assert func.call_count == 1
+
+            cache.delete_entries({('package', 'package_id')})
+            assert cached_func('package_id') == 1
+            assert func.call_count == 2
+
+    def test_cached_without_cache(self):
+        func = MagicMock(return_value=1, __name__='get_package_value')
+        cached_func = cached('package')(func)
+
+        cached_func('package_id')
+        cached_func('package_id')
+        assert func.call_count == 2
+
+    def test_invalidate_after_commit(self):
+        func = MagicMock(return_value=1, __name__='get_resource_value')
+        cached_func = cached('resource')(func)
+        session = MagicMock()
+        session.info = {}
+
+        with patch.object(
+            cache, 'get_cache', return_value=self.lru_cache
+        ), patch.object(cache, 'session', session):
+            cached_func('resource_id')
+            cache.invalidate('resource', ['resource_id'])
+
+            # The value is kept until the transaction is committed
+            assert cached_func('resource_id') == 1
+            assert func.call_count == 1
+
+            cache._after_commit(session)
+            cached_func('resource_id')
+            assert func.call_count == 2
+
+    @patch('ckanext.feedback.services.common.cache.connect_to_redis')
+    @patch('ckanext.feedback.services.common.cache.config')
+    def test_get_cache(self, mock_config, mock_connect_to_redis):
+        mock_config.get.side_effect = lambda key, default: {
+            'ckan.feedback.cache.backend': 'redis',
+            'ckan.feedback.cache.ttl': '30',
+        }.get(key, default)
+        mock_connect_to_redis.return_value = fakeredis.FakeStrictRedis()
+
+        with patch.object(cache, '_cache', None):
+            redis_cache = get_cache()
+            assert isinstance(redis_cache, RedisCache)
+            assert redis_cache.ttl == 30
+            assert get_cache() is redis_cache
+
+    @patch('ckanext.feedback.services.common.cache.config')
+    def test_get_cache_with_unknown_backend(self, mock_config):
+        mock_config.get.side_effect = lambda key, default: {
+            'ckan.feedback.cache.backend': 'unknown',
+        }.get(key, default)
+
+        with patch.object(cache, '_cache', None), pytest.raises(ValueError):
+            get_cache()
+
+    @patch('ckanext.feedback.services.common.cache.config')
+    def test_validate_config(self, mock_config):
+        mock_config.get.side_effect = lambda key, default: {
+            'ckan.feedback.cache.backend': 'redis',
+        }.get(key, default)
+        validate_config()
+
+    @patch('ckanext.feedback.services.common.cache.config')
+    def test_validate_config_with_unknown_backend(self, mock_config):
+        mock_config.get.side_effect = lambda key, default: {
+            'ckan.feedback.cache.backend': 'unknown',
+        }.get(key, default)
+
+        with pytest.raises(ValueError):
+            validate_config()
+
+    def test_get_cache_disabled(self):
+        assert get_cache() is None
@@ -0,0 +1,94 @@
+import pytest
+from ckan import model
+from ckan.tests import factories
+from flask import Flask
+from sqlalchemy.exc import DBAPIError
+
+from ckanext.feedback.command.feedback import (
+    create_download_tables,
+    create_resource_tables,
+    create_utilization_tables,
+)
+from ckanext.feedback.models.session import session
+from ckanext.feedback.services.common import instrumentation
+from ckanext.feedback.services.resource import summary as resource_summary_service
+
+engine = model.repo.session.get_bind()
+
+
+@pytest.mark.usefixtures('clean_db', 'with_plugins', 'with_request_context')
+class TestInstrumentation:
+    @classmethod
+    def setup_class(cls):
+        model.repo.init_db()
+        create_utilization_tables(engine)
+        create_resource_tables(engine)
+        create_download_tables(engine)
+
+    def setup_method(self, method):
+        self.app = Flask(__name__)
+        self.app.add_url_rule(
+            '/',
+            'index',
+            lambda: str(resource_summary_service.get_resource_comments('resource')),
+        )
+        instrumentation.enable(self.app)
+
+    def teardown_method(self, method):
+        instrumentation.disable()
+
+    def test_get_service_function(self):
+        assert instrumentation.get_service_function() is None
+
+    def test_get_request_stats(self):
+        resource = factories.Resource()
+
+        with self.app.test_request_context():
+            resource_summary_service.get_resource_comments(resource['id'])
+            resource_summary_service.get_resource_rating(resource['id'])
+            resource_summary_service.get_resource_rating(resource['id'])
+            stats = instrumentation.get_request_stats()
+
+        assert set(stats) == {
+            'resource.summary.get_resource_comments',
+            'resource.summary.get_resource_rating',
+        }
+        assert stats['resource.summary.get_resource_rating']['queries'] == 2
+        assert stats['resource.summary.get_resource_rating']['seconds'] > 0
+
+    def test_failed_query(self):
+        with self.app.test_request_context():
+            with pytest.raises(DBAPIError):
+                session.execute('SELECT * FROM unknown_table')
+            session.rollback()
+            resource_summary_service.get_resource_comments('resource')
+            stats = instrumentation.get_request_stats()
+
+        # The failed query is not counted and does not shift the next ones
+        assert set(stats) == {'resource.summary.get_resource_comments'}
+        assert stats['resource.summary.get_resource_comments']['queries'] == 1
+
+    def test_add_server_timing(self):
+        response = self.app.test_client().get('/')
+
+        assert response.headers['Server-Timing'].startswith(
+            'feedback-db;desc="1 feedback queries";dur='
+        )
+
+    def test_get_metrics_text(self):
+        self.app.test_client().get('/')
+
+        text = instrumentation.get_metrics_text()
+
+        assert '# TYPE ckanext_feedback_queries_total counter' in text
+        assert (
+            'ckanext_feedback_query_seconds_total'
+            '{function="resource.summary.get_resource_comments"}' in text
+        )
+
+    def test_disable(self):
+        instrumentation.disable()
+
+        with self.app.test_request_context():
+            resource_summary_service.get_resource_comments('resource')
+            assert instrumentation.get_request_stats() == {}
@@ -0,0 +1,53 @@
+from unittest.mock import MagicMock
+
+from flask import Flask
+
+from ckanext.feedback.services.common.memo import get_memo_stats, request_memoize
+
+
+class TestMemo:
+    def setup_method(self, method):
+        self.app = Flask(__name__)
+
+    def test_request_memoize(self):
+        func = MagicMock(return_value=1)
+        memoized = request_memoize(func)
+
+        with self.app.test_request_context():
+            assert memoized('resource_id') == 1
+            assert memoized('resource_id') == 1
+            assert memoized('other_resource_id') == 1
+            assert func.call_count == 2
+            assert get_memo_stats() == {'hits': 1, 'misses': 2}
+
+        with self.app.test_request_context():
+            assert memoized('resource_id') == 1
+            assert func.call_count == 3
+            assert get_memo_stats() == {'hits': 0, 'misses': 1}
+
+    def test_request_memoize_with_list_argument(self):
+        func = MagicMock(return_value={})
+        memoized = request_memoize(func)
+
+        with self.app.test_request_context():
+            memoized(['package_id'])
+            memoized(['package_id'])
+            assert func.call_count == 1
+
+    def test_request_memoize_with_unhashable_argument(self):
+        func = MagicMock(return_value=1)
+        memoized = request_memoize(func)
+
+        with self.app.test_request_context():
+            memoized({'id': 'resource_id'})
+            memoized({'id': 'resource_id'})
+            assert func.call_count == 2
+
+    def test_request_memoize_without_app_context(self):
+        func = MagicMock(return_value=1)
+        memoized = request_memoize(func)
+
+        memoized('resource_id')
+        memoized('resource_id')
+        assert func.call_count == 2
+        assert get_memo_stats() == {'hits': 0, 'misses': 0}
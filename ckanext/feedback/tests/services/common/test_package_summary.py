@@ -0,0 +1,81 @@
+import pytest
+from ckan import model
+from ckan.tests import factories
+
+from ckanext.feedback.command.feedback import (
+    create_download_tables,
+    create_resource_tables,
+    create_utilization_tables,
+)
+from ckanext.feedback.models.download import DownloadSummary
+from ckanext.feedback.models.resource_comment import ResourceCommentSummary
+from ckanext.feedback.models.session import session
+from ckanext.feedback.services.common.package_summary import (
+    get_package_ids,
+    get_package_summaries,
+)
+from ckanext.feedback.services.download.summary import refresh_package_downloads
+from ckanext.feedback.services.resource.summary import refresh_package_comments
+
+engine = model.repo.session.get_bind()
+
+
+@pytest.mark.usefixtures('clean_db', 'with_plugins', 'with_request_context')
+class TestPackageSummary:
+    @classmethod
+    def setup_class(cls):
+        model.repo.init_db()
+        create_utilization_tables(engine)
+        create_resource_tables(engine)
+        create_download_tables(engine)
+
+    def test_get_package_ids(self):
+        resource = factories.Resource()
+        other_resource = factories.Resource(package_id=resource['package_id'])
+
+        assert get_package_ids([resource['id'], other_resource['id']]) == [
+            resource['package_id']
+        ]
+        assert get_package_ids([]) == []
+
+    def test_refresh_package_summaries(self):
+        resource = factories.Resource()
+        other_resource = factories.Resource()
+        session.add(
+            DownloadSummary(id='download', resource_id=resource['id'], download=3)
+        )
+        session.add(
+            ResourceCommentSummary(
+                resource_id=resource['id'], comment=2, rating_sum=9, rating_count=3
+            )
+        )
+        session.commit()
+
+        refresh_package_downloads([resource['id']])
+        refresh_package_comments([resource['id']])
+        session.commit()
+
+        summaries = get_package_summaries(
+            [resource['package_id'], other_resource['package_id']]
+        )
+        assert list(summaries) == [resource['package_id']]
+        summary = summaries[resource['package_id']]
+        assert summary.download == 3
+        assert summary.comment == 2
+        assert summary.rating == 3
+        assert summary.utilization == 0
+
+        # Refreshing the downloads leaves the columns of the other modules as is
+        session.query(DownloadSummary).delete()
+        refresh_package_downloads([resource['id']])
+        session.commit()
+        session.expire_all()
+
+        summary = get_package_summaries([resource['package_id']])[
+            resource['package_id']
+        ]
+        assert summary.download == 0
+        assert summary.comment == 2
+
+    def test_get_package_summaries_without_packages(self):
+        assert get_package_summaries([]) == {}
@@ -0,0 +1,137 @@
+import uuid
+from unittest.mock import patch
+
+import pytest
+from ckan import model
+from ckan.tests import factories
+
+from ckanext.feedback.command.feedback import (
+    create_download_tables,
+    create_resource_tables,
+    create_utilization_tables,
+)
+from ckanext.feedback.models.download import DownloadSummary
+from ckanext.feedback.models.resource_comment import ResourceCommentSummary
+from ckanext.feedback.models.session import session
+from ckanext.feedback.models.utilization import UtilizationSummary
+from ckanext.feedback.services.common.stats import (
+    get_packages_feedback_stats,
+    get_resources_feedback_stats,
+)
+from ckanext.feedback.services.download.summary import (
+    increment_resources_downloads,
+    refresh_package_downloads,
+)
+from ckanext.feedback.services.resource.summary import refresh_package_comments
+from ckanext.feedback.services.utilization.summary import refresh_package_utilizations
+
+engine = model.repo.session.get_bind()
+
+
+@pytest.mark.usefixtures('clean_db', 'with_plugins', 'with_request_context')
+class TestStats:
+    @classmethod
+    def setup_class(cls):
+        model.repo.init_db()
+        create_utilization_tables(engine)
+        create_resource_tables(engine)
+        create_download_tables(engine)
+
+    def test_get_packages_feedback_stats(self):
+        resource = factories.Resource()
+        other_resource = factories.Resource()
+        session.add(
+            DownloadSummary(
+                id=str(uuid.uuid4()),
+                resource_id=resource['id'],
+                download=5,
+            )
+        )
+        session.add(
+            ResourceCommentSummary(
+                id=str(uuid.uuid4()),
+                resource_id=resource['id'],
+                comment=2,
+                rating=3,
+                rating_sum=6,
+                rating_count=2,
+            )
+        )
+        session.add(
+            UtilizationSummary(
+                id=str(uuid.uuid4()),
+                resource_id=resource['id'],
+                utilization=1,
+            )
+        )
+        session.flush()
+        refresh_package_downloads([resource['id']])
+        refresh_package_comments([resource['id']])
+        refresh_package_utilizations([resource['id']])
+        session.commit()
+
+        stats = get_packages_feedback_stats(
+            [resource['package_id'], other_resource['package_id']]
+        )
+
+        assert stats == {
+            resource['package_id']: {
+                'downloads': 5,
+                'utilizations': 1,
+                'comments': 2,
+                'rating': 3,
+                'issue_resolutions': 0,
+            },
+            other_resource['package_id']: {
+                'downloads': 0,
+                'utilizations': 0,
+                'comments': 0,
+                'rating': 0,
+                'issue_resolutions': 0,
+            },
+        }
+
+    def test_get_resources_feedback_stats(self):
+        resource = factories.Resource()
+        increment_resources_downloads({resource['id']: 2})
+        session.add(
+            UtilizationSummary(
+                id=str(uuid.uuid4()),
+                resource_id=resource['id'],
+                utilization=3,
+            )
+        )
+        session.commit()
+
+        stats = get_resources_feedback_stats([resource['id'], 'unknown'])
+
+        assert stats == {
+            resource['id']: {
+                'downloads': 2,
+                'utilizations': 3,
+                'comments': 0,
+                'rating': 0,
+                'issue_resolutions': 0,
+            },
+            'unknown': {
+                'downloads': 0,
+                'utilizations': 0,
+                'comments': 0,
+                'rating': 0,
+                'issue_resolutions': 0,
+            },
+        }
+        assert get_resources_feedback_stats([]) == {}
+
+    def test_get_packages_feedback_stats_without_packages(self):
+        assert get_packages_feedback_stats([]) == {}
+
+    @patch('ckanext.feedback.services.common.stats.toolkit')
+    def test_get_packages_feedback_stats_with_disabled_modules(self, mock_toolkit):
+        resource = factories.Resource()
+        increment_resources_downloads({resource['id']: 2})
+        mock_toolkit.asbool.return_value = False
+
+        stats = get_packages_feedback_stats([resource['package_id']])
+
+        assert stats[resource['package_id']]['downloads'] == 0
@@ -0,0 +1,62 @@
+import pytest
+from ckan import model
+from ckan.tests import factories
+
+from ckanext.feedback.command.feedback import (
+    create_download_tables,
+    create_resource_tables,
+    create_utilization_tables,
+)
+from ckanext.feedback.models.resource_comment import (
+    ResourceComment,
+    ResourceCommentSummary,
+)
+from ckanext.feedback.models.session import session
+from ckanext.feedback.services.common.summary import (
+    Drift,
+    create_missing_summaries,
+    get_drifts,
+)
+
+engine = model.repo.session.get_bind()
+
+
+@pytest.mark.usefixtures('clean_db', 'with_plugins', 'with_request_context')
+class TestSummary:
+    @classmethod
+    def setup_class(cls):
+        model.repo.init_db()
+        create_utilization_tables(engine)
+        create_resource_tables(engine)
+        create_download_tables(engine)
+
+    def test_create_missing_summaries(self):
+        resource = factories.Resource()
+        other_resource = factories.Resource()
+        for resource_id in [resource['id'], resource['id'], other_resource['id']]:
+            session.add(ResourceComment(resource_id=resource_id, content='test'))
+        session.add(ResourceCommentSummary(resource_id=other_resource['id']))
+        session.commit()
+
+        count = create_missing_summaries(
+            ResourceCommentSummary, 'resource_id', ResourceComment.resource_id
+        )
+        session.commit()
+
+        assert count == 1
+        summary = (
+            session.query(ResourceCommentSummary)
+            .filter(ResourceCommentSummary.resource_id == resource['id'])
+            .one()
+        )
+        assert summary.comment == 0
+        assert summary.created
+
+    def test_get_drifts(self):
+        actual = {'a': 1, 'b': 2, 'c': 0.5}
+        expected = {'b': 3, 'c': 0.5, 'd': None}
+
+        assert get_drifts('table', 'column', actual, expected) == [
+            Drift('table', 'a', 'column', 1, 0),
+            Drift('table', 'b', 'column', 2, 3),
+        ]
@@ -0,0 +1,175 @@
+from unittest.mock import patch
+
+import pytest
+from ckan import model
+from ckan.tests import factories
+
+from ckanext.feedback.command.feedback import (
+    create_download_tables,
+    create_resource_tables,
+    create_utilization_tables,
+)
+from ckanext.feedback.models.download import DownloadSummary
+from ckanext.feedback.models.session import session
+from ckanext.feedback.services.download import buffer
+from ckanext.feedback.services.download.buffer import (
+    DownloadBuffer,
+    get_download_buffer,
+)
+
+engine = model.repo.session.get_bind()
+
+
+def get_downloads(resource_id):
+    return (
+        session.query(DownloadSummary.download)
+        .filter(DownloadSummary.resource_id == resource_id)
+        .scalar()
+    )
+
+
+@pytest.mark.usefixtures('clean_db', 'with_plugins', 'with_request_context')
+class TestDownloadBuffer:
+    @classmethod
+    def setup_class(cls):
+        model.repo.init_db()
+        create_utilization_tables(engine)
+        create_resource_tables(engine)
+        create_download_tables(engine)
+
+    def test_flush_on_max_pending(self):
+        resource = factories.Resource()
+        download_buffer = DownloadBuffer(max_pending=3, flush_interval=3600)
+
+        download_buffer.add(resource['id'])
+        download_buffer.add(resource['id'])
+        assert get_downloads(resource['id']) is None
+
+        download_buffer.add(resource['id'])
+        assert get_downloads(resource['id']) == 3
+
+    @patch('ckanext.feedback.services.download.buffer.time.monotonic')
+    def test_flush_on_interval(self, mock_monotonic):
+        resource = factories.Resource()
+        mock_monotonic.return_value = 0
+        download_buffer = DownloadBuffer(max_pending=100, flush_interval=10)
+
+        download_buffer.add(resource['id'])
+        assert get_downloads(resource['id']) is None
+
+        mock_monotonic.return_value = 10
+        download_buffer.add(resource['id'])
+        assert get_downloads(resource['id']) == 2
+
+    def test_flush_skips_unknown_resources(self):
+        resource = factories.Resource()
+        download_buffer = DownloadBuffer(max_pending=100, flush_interval=3600)
+
+        download_buffer.add(resource['id'])
+        download_buffer.add('unknown_resource_id')
+        download_buffer.flush()
+
+        assert get_downloads(resource['id']) == 1
+        assert get_downloads('unknown_resource_id') is None
+
+    def test_flush_error_keeps_counts(self):
+        resource = factories.Resource()
+        download_buffer = DownloadBuffer(max_pending=100, flush_interval=3600)
+        download_buffer.add(resource['id'])
+
+        with patch(
+            'ckanext.feedback.services.download.buffer.summary_service'
+            '.increment_existing_resources_downloads',
+            side_effect=Exception('Error message'),
+        ):
+            download_buffer.flush()
+        assert get_downloads(resource['id']) is None
+
+        download_buffer.add(resource['id'])
+        download_buffer.flush()
+        assert get_downloads(resource['id']) == 2
+
+    @patch('ckanext.feedback.services.download.buffer.time.monotonic')
+    @patch('ckanext.feedback.services.download.buffer.summary_service')
+    def test_flush_error_keeps_max_pending(self, mock_summary_service, mock_monotonic):
+        increment = mock_summary_service.increment_existing_resources_downloads
+        increment.side_effect = Exception('Error message')
+        mock_monotonic.return_value = 0
+        download_buffer = DownloadBuffer(max_pending=2, flush_interval=10)
+
+        download_buffer.add('a')
+        download_buffer.add('b')
+        assert increment.call_count == 1
+
+        # No flush is tried until the retry interval has passed, and the counts
+        # over max_pending are dropped
+        download_buffer.add('c')
+        download_buffer.add('d')
+        assert increment.call_count == 1
+
+        increment.side_effect = None
+        mock_monotonic.return_value = 10
+        download_buffer.add('e')
+        increment.assert_called_with({'a': 1, 'b': 1, 'e': 1})
+
+    @patch('ckanext.feedback.services.download.buffer.time.monotonic')
+    @patch('ckanext.feedback.services.download.buffer.summary_service')
+    def test_flush_error_backs_off(self, mock_summary_service, mock_monotonic):
+        increment = mock_summary_service.increment_existing_resources_downloads
+        increment.side_effect = Exception('Error message')
+        mock_monotonic.return_value = 0
+        download_buffer = DownloadBuffer(max_pending=100, flush_interval=10)
+        download_buffer.add('a')
+
+        download_buffer.flush()
+        mock_monotonic.return_value = 10
+        download_buffer.flush_if_due()
+        assert increment.call_count == 2
+
+        # The retry interval doubles after each failure
+        mock_monotonic.return_value = 29
+        download_buffer.flush_if_due()
+        assert increment.call_count == 2
+        mock_monotonic.return_value = 30
+        download_buffer.flush_if_due()
+        assert increment.call_count == 3
+
+    @patch('ckanext.feedback.services.download.buffer.time.monotonic')
+    def test_flush_if_due(self, mock_monotonic):
+        resource = factories.Resource()
+        mock_monotonic.return_value = 0
+        download_buffer = DownloadBuffer(max_pending=100, flush_interval=10)
+        download_buffer.add(resource['id'])
+
+        download_buffer.flush_if_due()
+        assert get_downloads(resource['id']) is None
+
+        mock_monotonic.return_value = 10
+        download_buffer.flush_if_due()
+        assert get_downloads(resource['id']) == 1
+
+    @patch('ckanext.feedback.services.download.buffer.summary_service')
+    def test_flush_without_counts(self, mock_summary_service):
+        download_buffer = DownloadBuffer(max_pending=100, flush_interval=3600)
+        download_buffer.flush()
+        mock_summary_service.increment_existing_resources_downloads.assert_not_called()
+
+    @patch('ckanext.feedback.services.download.buffer.atexit')
+    @patch('ckanext.feedback.services.download.buffer.threading.Thread')
+    @patch('ckanext.feedback.services.download.buffer.config')
+    def test_get_download_buffer(self, mock_config, mock_thread, mock_atexit):
+        mock_config.get.side_effect = lambda key, default: {
+            'ckan.feedback.downloads.buffer.enable': 'True',
+            'ckan.feedback.downloads.buffer.max_pending': '5',
+        }.get(key, default)
+
+        with patch.object(buffer, '_download_buffer', None):
+            download_buffer = get_download_buffer()
+            assert download_buffer.max_pending == 5
+            assert download_buffer.flush_interval == 10
+            assert get_download_buffer() is download_buffer
+            mock_thread.return_value.start.assert_called_once()
+            mock_atexit.register.assert_called_once_with(download_buffer.flush)
+
+    def test_get_download_buffer_disabled(self):
+        assert get_download_buffer() is None
@@ -0,0 +1,153 @@
+from unittest.mock import patch
+
+import pytest
+from flask import Flask
+
+from ckanext.feedback.services.download import dedup
+from ckanext.feedback.services.download.dedup import (
+    DownloadDeduplicator,
+    RotatingBloomFilter,
+    get_client_fingerprint,
+    get_download_deduplicator,
+    is_first_download,
+    validate_config,
+)
+
+
+class TestRotatingBloomFilter:
+    def test_add(self):
+        bloom_filter = RotatingBloomFilter(capacity=100, error_rate=0.01)
+        assert bloom_filter.add('a')
+        assert bloom_filter.add('b')
+        assert not bloom_filter.add('a')
+
+    def test_size(self):
+        bloom_filter = RotatingBloomFilter(capacity=1000, error_rate=0.01)
+        # Each generation is sized for half of the error rate
+        assert bloom_filter.size == 11028
+        assert bloom_filter.hashes == 8
+
+    def test_error_rate(self):
+        bloom_filter = RotatingBloomFilter(capacity=1000, error_rate=0.01)
+        for i in range(1000):
+            bloom_filter.add(f'added {i}')
+        false_positives = sum(not bloom_filter.add(f'new {i}') for i in range(1000))
+        assert false_positives < 30
+
+    def test_rotate(self):
+        bloom_filter = RotatingBloomFilter(capacity=2, error_rate=0.01)
+        bloom_filter.add('a')
+        bloom_filter.add('b')
+
+        # The keys of the previous generation are still remembered
+        assert bloom_filter.add('c')
+        assert not bloom_filter.add('a')
+        assert bloom_filter.add('d')
+
+        # The keys of the generation before it are forgotten
+        assert bloom_filter.add('e')
+        assert bloom_filter.add('a')
+
+    def test_clear(self):
+        bloom_filter = RotatingBloomFilter(capacity=100, error_rate=0.01)
+        bloom_filter.add('a')
+        bloom_filter.clear()
+        assert bloom_filter.add('a')
+
+    @pytest.mark.parametrize(
+        'capacity, error_rate', [(0, 0.01), (100, 0), (100, 1), (100, 1.5)]
+    )
+    def test_invalid_parameters(self, capacity, error_rate):
+        with pytest.raises(ValueError):
+            RotatingBloomFilter(capacity, error_rate)
+
+
+class TestDownloadDeduplicator:
+    def test_is_first(self):
+        deduplicator = DownloadDeduplicator(window=60, capacity=100, error_rate=0.01)
+        assert deduplicator.is_first('client', 'resource', now=0)
+        assert not deduplicator.is_first('client', 'resource', now=59)
+        assert deduplicator.is_first('client', 'other_resource', now=59)
+        assert deduplicator.is_first('other_client', 'resource', now=59)
+
+    def test_invalid_window(self):
+        with pytest.raises(ValueError):
+            DownloadDeduplicator(window=0, capacity=100, error_rate=0.01)
+
+    def test_is_first_in_next_window(self):
+        deduplicator = DownloadDeduplicator(window=60, capacity=100, error_rate=0.01)
+        assert deduplicator.is_first('client', 'resource', now=59)
+        assert deduplicator.is_first('client', 'resource', now=60)
+        assert not deduplicator.is_first('client', 'resource', now=119)
+
+
+class TestDedup:
+    def setup_method(self, method):
+        self.app = Flask(__name__)
+
+    @patch('ckanext.feedback.services.download.dedup.config')
+    def test_get_download_deduplicator(self, mock_config):
+        mock_config.get.side_effect = lambda key, default: {
+            'ckan.feedback.downloads.dedup.enable': 'True',
+            'ckan.feedback.downloads.dedup.window': '600',
+            'ckan.feedback.downloads.dedup.error_rate': '0.01',
+        }.get(key, default)
+
+        with patch.object(dedup, '_download_deduplicator', None):
+            deduplicator = get_download_deduplicator()
+            assert deduplicator.window == 600
+            assert deduplicator._filter.capacity == 100000
+            assert deduplicator._filter.hashes == 8
+            assert get_download_deduplicator() is deduplicator
+
+    @pytest.mark.parametrize(
+        'settings',
+        [
+            {'ckan.feedback.downloads.dedup.window': '0'},
+            {'ckan.feedback.downloads.dedup.window': 'hour'},
+            {'ckan.feedback.downloads.dedup.capacity': '0'},
+            {'ckan.feedback.downloads.dedup.error_rate': '1.5'},
+        ],
+    )
+    @patch('ckanext.feedback.services.download.dedup.config')
+    def test_validate_config_invalid(self, mock_config, settings):
+        settings = dict(settings, **{'ckan.feedback.downloads.dedup.enable': 'True'})
+        mock_config.get.side_effect = lambda key, default: settings.get(key, default)
+
+        with pytest.raises(ValueError):
+            validate_config()
+
+    @patch('ckanext.feedback.services.download.dedup.config')
+    def test_validate_config(self, mock_config):
+        mock_config.get.side_effect = lambda key, default: {
+            'ckan.feedback.downloads.dedup.enable': 'True',
+        }.get(key, default)
+        validate_config()
+
+    def test_validate_config_disabled(self):
+        validate_config()
+
+    def test_get_download_deduplicator_disabled(self):
+        assert get_download_deduplicator() is None
+
+    def test_get_client_fingerprint(self):
+        with self.app.test_request_context(
+            headers={'User-Agent': 'agent'}, environ_base={'REMOTE_ADDR': '192.0.2.1'}
+        ):
+            assert get_client_fingerprint() == '192.0.2.1\nagent'
+
+    @patch('ckanext.feedback.services.download.dedup.get_download_deduplicator')
+    def test_is_first_download(self, mock_get_download_deduplicator):
+        mock_get_download_deduplicator.return_value = DownloadDeduplicator(
+            window=3600, capacity=100, error_rate=0.01
+        )
+        with self.app.test_request_context(environ_base={'REMOTE_ADDR': '192.0.2.1'}):
+            assert is_first_download('resource_id')
+            assert not is_first_download('resource_id')
+        with self.app.test_request_context(environ_base={'REMOTE_ADDR': '192.0.2.2'}):
+            assert is_first_download('resource_id')
+
+    def test_is_first_download_disabled(self):
+        with self.app.test_request_context():
+            assert is_first_download('resource_id')
+            assert is_first_download('resource_id')
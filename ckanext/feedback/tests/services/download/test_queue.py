@@ -0,0 +1,320 @@
+import sqlite3
+from unittest.mock import MagicMock, patch
+
+import fakeredis
+import pytest
+from ckan import model
+from ckan.tests import factories
+from redis.exceptions import RedisError
+
+from ckanext.feedback.command.feedback import (
+    create_download_tables,
+    create_resource_tables,
+    create_utilization_tables,
+)
+from ckanext.feedback.models.download import DownloadSummary
+from ckanext.feedback.models.session import session
+from ckanext.feedback.services.download import queue
+from ckanext.feedback.services.download.queue import (
+    MemoryQueue,
+    RedisQueue,
+    SQLiteQueue,
+    drain,
+    drain_batch,
+    get_download_queue,
+    get_shared_download_queue,
+    publish_download,
+    validate_config,
+)
+
+engine = model.repo.session.get_bind()
+
+
+def get_downloads(resource_id):
+    return (
+        session.query(DownloadSummary.download)
+        .filter(DownloadSummary.resource_id == resource_id)
+        .scalar()
+    )
+
+
+class TestDownloadQueues:
+    def test_memory_queue(self):
+        download_queue = MemoryQueue()
+        download_queue.put(['a', 'b', 'c'])
+        assert download_queue.pop(2) == ['a', 'b']
+        assert download_queue.pop(2) == ['c']
+        assert download_queue.pop(2) == []
+
+    def test_sqlite_queue(self, tmp_path):
+        path = str(tmp_path / 'downloads.sqlite')
+        SQLiteQueue(path).put(['a', 'b', 'c'])
+
+        # Another process opens the same spool
+        download_queue = SQLiteQueue(path, worker_id='worker1')
+        assert download_queue.pop(2) == ['a', 'b']
+        download_queue.put(['d'])
+        assert download_queue.pop(5) == ['c', 'd']
+        assert download_queue.pop(5) == []
+
+        # The popped events are kept until they are acknowledged
+        assert SQLiteQueue(path, worker_id='worker2').recover() == 0
+        assert SQLiteQueue(path, worker_id='worker1').recover() == 4
+        assert download_queue.pop(5) == ['a', 'b', 'c', 'd']
+        download_queue.ack(['a', 'b', 'c', 'd'])
+        assert download_queue.recover() == 0
+
+    def test_sqlite_queue_workers(self, tmp_path):
+        path = str(tmp_path / 'downloads.sqlite')
+        download_queue = SQLiteQueue(path, worker_id='worker1')
+        other_queue = SQLiteQueue(path, worker_id='worker2')
+        download_queue.put(['a', 'b', 'c'])
+
+        assert download_queue.pop(2) == ['a', 'b']
+        assert other_queue.pop(2) == ['c']
+
+        # A restarted worker recovers only its own events
+        assert SQLiteQueue(path, worker_id='worker2').recover() == 1
+        download_queue.ack(['a', 'b'])
+        assert other_queue.pop(5) == ['c']
+        assert download_queue.pop(5) == []
+
+    def test_sqlite_queue_without_worker_id_column(self, tmp_path):
+        path = str(tmp_path / 'downloads.sqlite')
+        connection = sqlite3.connect(path)
+        connection.execute(
+            'CREATE TABLE download_event'
+            ' (id INTEGER PRIMARY KEY AUTOINCREMENT, resource_id TEXT NOT NULL)'
+        )
+        connection.execute("INSERT INTO download_event (resource_id) VALUES ('a')")
+        connection.commit()
+        connection.close()
+
+        assert SQLiteQueue(path).pop(5) == ['a']
+
+    def test_redis_queue(self):
+        client = fakeredis.FakeStrictRedis()
+        download_queue = RedisQueue(client, worker_id='worker1')
+        download_queue.put(['a', 'b', 'c'])
+        assert download_queue.pop(2) == ['a', 'b']
+        assert download_queue.pop(2) == ['c']
+        assert download_queue.pop(2) == []
+
+        # The popped events are kept until they are acknowledged
+        processing_key = 'ckanext-feedback:download-events:processing:worker1'
+        assert client.llen(processing_key) == 3
+        download_queue.ack(['a', 'b', 'c'])
+        assert client.llen(processing_key) == 0
+
+    def test_redis_queue_recover(self):
+        client = fakeredis.FakeStrictRedis()
+        download_queue = RedisQueue(client, worker_id='worker1')
+        other_queue = RedisQueue(client, worker_id='worker2')
+        download_queue.put(['a', 'b', 'c', 'd'])
+        download_queue.pop(2)
+        other_queue.pop(1)
+
+        # The worker restarts after it crashed, while the other one is running
+        download_queue = RedisQueue(client, worker_id='worker1')
+        assert download_queue.recover() == 2
+        assert sorted(download_queue.pop(5)) == ['a', 'b', 'd']
+        assert download_queue.recover() == 3
+        assert client.llen(other_queue.processing_key) == 1
+
+        # Acknowledging does not touch the events of the other worker
+        other_queue.ack(['c'])
+        download_queue.ack(['c'])
+        assert client.llen(other_queue.processing_key) == 0
+        assert client.llen(download_queue.processing_key) == 0
+
+
+@pytest.mark.usefixtures('clean_db', 'with_plugins', 'with_request_context')
+class TestDrain:
+    @classmethod
+    def setup_class(cls):
+        model.repo.init_db()
+        create_utilization_tables(engine)
+        create_resource_tables(engine)
+        create_download_tables(engine)
+
+    def test_drain_batch(self):
+        resource = factories.Resource()
+        other_resource = factories.Resource()
+        download_queue = MemoryQueue()
+        download_queue.put(
+            [resource['id'], other_resource['id'], resource['id'], resource['id']]
+        )
+
+        assert drain_batch(download_queue, 3) == 3
+        assert get_downloads(resource['id']) == 2
+        assert get_downloads(other_resource['id']) == 1
+        assert download_queue.pop(10) == [resource['id']]
+
+    def test_drain_batch_skips_unknown_resources(self):
+        resource = factories.Resource()
+        download_queue = MemoryQueue()
+        download_queue.put([resource['id'], 'unknown_resource_id'])
+
+        assert drain_batch(download_queue, 10) == 2
+        assert get_downloads(resource['id']) == 1
+        assert get_downloads('unknown_resource_id') is None
+
+    @patch('ckanext.feedback.services.download.queue.summary_service')
+    def test_drain_batch_error(self, mock_summary_service):
+        mock_summary_service.increment_existing_resources_downloads.side_effect = (
+            Exception('Error message')
+        )
+        download_queue = MemoryQueue()
+        download_queue.put(['a', 'b'])
+
+        with pytest.raises(Exception):
+            drain_batch(download_queue, 10)
+        assert download_queue.pop(10) == ['a', 'b']
+
+    def test_drain_batch_acknowledges_redis_events(self):
+        resource = factories.Resource()
+        client = fakeredis.FakeStrictRedis()
+        download_queue = RedisQueue(client)
+        download_queue.put([resource['id']] * 2)
+
+        assert drain_batch(download_queue, 10) == 2
+        assert get_downloads(resource['id']) == 2
+        assert client.llen(download_queue.processing_key) == 0
+        assert download_queue.recover() == 0
+
+    def test_drain_batch_acknowledges_sqlite_events(self, tmp_path):
+        resource = factories.Resource()
+        download_queue = SQLiteQueue(str(tmp_path / 'downloads.sqlite'))
+        download_queue.put([resource['id']] * 2)
+
+        assert drain_batch(download_queue, 10) == 2
+        assert get_downloads(resource['id']) == 2
+        assert download_queue.recover() == 0
+        assert download_queue.pop(10) == []
+
+    def test_drain(self):
+        resource = factories.Resource()
+        download_queue = MemoryQueue()
+        download_queue.put([resource['id']] * 5)
+
+        assert drain(download_queue, 2) == 5
+        assert get_downloads(resource['id']) == 5
+
+
+class TestGetDownloadQueue:
+    @patch('ckanext.feedback.services.download.queue.atexit')
+    @patch('ckanext.feedback.services.download.queue.threading.Thread')
+    @patch('ckanext.feedback.services.download.queue.config')
+    def test_get_download_queue_memory(self, mock_config, mock_thread, mock_atexit):
+        mock_config.get.side_effect = lambda key, default: {
+            'ckan.feedback.downloads.queue.backend': 'memory',
+        }.get(key, default)
+
+        with patch.object(queue, '_download_queue', None):
+            download_queue = get_download_queue()
+            assert isinstance(download_queue, MemoryQueue)
+            assert get_download_queue() is download_queue
+            mock_thread.return_value.start.assert_called_once()
+            mock_atexit.register.assert_called_once_with(drain, download_queue, 1000)
+
+    @patch('ckanext.feedback.services.download.queue.config')
+    def test_get_download_queue_sqlite(self, mock_config, tmp_path):
+        path = str(tmp_path / 'downloads.sqlite')
+        mock_config.get.side_effect = lambda key, default: {
+            'ckan.feedback.downloads.queue.backend': 'sqlite',
+            'ckan.feedback.downloads.queue.sqlite_path': path,
+        }.get(key, default)
+
+        download_queue = get_shared_download_queue('worker1')
+        assert isinstance(download_queue, SQLiteQueue)
+        assert download_queue.path == path
+        assert download_queue.worker_id == 'worker1'
+
+    @patch('ckanext.feedback.services.download.queue.config')
+    def test_get_download_queue_sqlite_without_path(self, mock_config):
+        mock_config.get.side_effect = lambda key, default: {
+            'ckan.feedback.downloads.queue.backend': 'sqlite',
+        }.get(key, default)
+
+        with patch.object(queue, '_download_queue', None):
+            with pytest.raises(ValueError):
+                get_download_queue()
+
+    @patch('ckanext.feedback.services.download.queue.connect_to_redis')
+    @patch('ckanext.feedback.services.download.queue.config')
+    def test_get_download_queue_redis(self, mock_config, mock_connect_to_redis):
+        mock_config.get.side_effect = lambda key, default: {
+            'ckan.feedback.downloads.queue.backend': 'redis',
+        }.get(key, default)
+        mock_connect_to_redis.return_value = fakeredis.FakeStrictRedis()
+
+        with patch.object(queue, '_download_queue', None):
+            assert isinstance(get_download_queue(), RedisQueue)
+
+        download_queue = get_shared_download_queue('worker1')
+        assert download_queue.processing_key == (
+            'ckanext-feedback:download-events:processing:worker1'
+        )
+
+    @patch('ckanext.feedback.services.download.queue.config')
+    def test_get_download_queue_with_unknown_backend(self, mock_config):
+        mock_config.get.side_effect = lambda key, default: {
+            'ckan.feedback.downloads.queue.backend': 'kafka',
+        }.get(key, default)
+
+        with patch.object(queue, '_download_queue', None):
+            with pytest.raises(ValueError):
+                get_download_queue()
+
+    @patch('ckanext.feedback.services.download.queue.config')
+    def test_validate_config(self, mock_config, tmp_path):
+        mock_config.get.side_effect = lambda key, default: {
+            'ckan.feedback.downloads.queue.backend': 'sqlite',
+            'ckan.feedback.downloads.queue.sqlite_path': str(tmp_path / 'q.sqlite'),
+        }.get(key, default)
+        validate_config()
+
+    @pytest.mark.parametrize(
+        'settings',
+        [
+            {'ckan.feedback.downloads.queue.backend': 'kafka'},
+            {'ckan.feedback.downloads.queue.backend': 'sqlite'},
+        ],
+    )
+    @patch('ckanext.feedback.services.download.queue.config')
+    def test_validate_config_invalid(self, mock_config, settings):
+        mock_config.get.side_effect = lambda key, default: settings.get(key, default)
+
+        with pytest.raises(ValueError):
+            validate_config()
+
+    def test_get_download_queue_disabled(self):
+        assert get_download_queue() is None
+        with pytest.raises(ValueError):
+            get_shared_download_queue()
+
+
+class TestPublishDownload:
+    @patch('ckanext.feedback.services.download.queue.get_download_queue')
+    def test_publish_download(self, mock_get_download_queue):
+        download_queue = MemoryQueue()
+        mock_get_download_queue.return_value = download_queue
+
+        assert publish_download('resource_id')
+        assert download_queue.pop(10) == ['resource_id']
+
+    @patch('ckanext.feedback.services.download.queue.get_download_queue')
+    def test_publish_download_error(self, mock_get_download_queue):
+        mock_get_download_queue.return_value = MagicMock()
+        mock_get_download_queue.return_value.put.side_effect = RedisError()
+
+        assert not publish_download('resource_id')
+
+    @patch('ckanext.feedback.services.download.queue.get_download_queue')
+    def test_publish_download_queue_error(self, mock_get_download_queue):
+        mock_get_download_queue.side_effect = ValueError()
+
+        assert not publish_download('resource_id')
+
+    def test_publish_download_disabled(self):
+        assert not publish_download('resource_id')
@@ -1,3 +1,5 @@
+import datetime
+
 import pytest
 from ckan import model
 from ckan.tests import factories
@@ -8,12 +10,23 @@ from ckanext.feedback.command.feedback import (
     create_utilization_tables,
     get_engine,
 )
-from ckanext.feedback.models.download import DownloadSummary
+from ckanext.feedback.models.download import (
+    DownloadDaily,
+    DownloadMonthly,
+    DownloadSummary,
+)
 from ckanext.feedback.models.session import session
 from ckanext.feedback.services.download.summary import (
     get_package_downloads,
+    get_package_recent_downloads,
+    get_packages_downloads,
     get_resource_downloads,
+    get_resource_recent_downloads,
+    increment_existing_resources_downloads,
     increment_resource_downloads,
+    increment_resources_downloads,
+    refresh_package_downloads,
+    rollup_daily_downloads,
 )
 
 
@@ -43,6 +56,20 @@ class TestDownloadServices:
         assert get_downloads(resource['id']) == 1
         increment_resource_downloads(resource['id'])
         assert get_downloads(resource['id']) == 2
+        # The package summary is updated in the same transaction
+        assert get_package_downloads(resource['package_id']) == 2
+
+    def test_increment_resource_downloads_keeps_single_row(self):
+        resource = factories.Resource()
+        for _ in range(3):
+            increment_resource_downloads(resource['id'])
+        rows = (
+            session.query(DownloadSummary)
+            .filter(DownloadSummary.resource_id == resource['id'])
+            .all()
+        )
+        assert len(rows) == 1
+        assert rows[0].download == 3
 
     def test_get_package_download(self):
         resource = factories.Resource()
@@ -55,9 +82,27 @@ class TestDownloadServices:
             updated='2023-03-31 01:23:45.123456',
         )
         session.add(download_summary)
+        refresh_package_downloads([resource['id']])
         session.commit()
         assert get_package_downloads(resource['package_id']) == 1
 
+    def test_get_packages_downloads(self):
+        resource = factories.Resource()
+        other_resource = factories.Resource()
+        package_ids = [resource['package_id'], other_resource['package_id']]
+        assert get_packages_downloads(package_ids) == {}
+        download_summary = DownloadSummary(
+            id=str('test_id'),
+            resource_id=resource['id'],
+            download=3,
+            created='2023-03-31 01:23:45.123456',
+            updated='2023-03-31 01:23:45.123456',
+        )
+        session.add(download_summary)
+        refresh_package_downloads([resource['id']])
+        session.commit()
+        assert get_packages_downloads(package_ids) == {resource['package_id']: 3}
+
     def test_get_resource_download(self):
         resource = factories.Resource()
         assert get_resource_downloads(resource['id']) == 0
@@ -71,3 +116,100 @@ class TestDownloadServices:
         session.add(download_summary)
         session.commit()
         assert get_resource_downloads(resource['id']) == 1
+
+    def test_increment_resources_downloads(self):
+        resource = factories.Resource()
+        other_resource = factories.Resource()
+        increment_resources_downloads({resource['id']: 2, other_resource['id']: 1})
+        increment_resources_downloads({resource['id']: 3})
+        assert get_downloads(resource['id']) == 5
+        assert get_downloads(other_resource['id']) == 1
+        assert get_package_downloads(resource['package_id']) == 5
+        assert get_package_downloads(other_resource['package_id']) == 1
+
+        daily = session.query(DownloadDaily).filter(
+            DownloadDaily.resource_id == resource['id']
+        )
+        assert [(row.date, row.download) for row in daily] == [
+            (datetime.date.today(), 5)
+        ]
+
+    def test_increment_resources_downloads_without_counts(self):
+        increment_resources_downloads({})
+        assert session.query(DownloadSummary).count() == 0
+
+    def test_increment_existing_resources_downloads(self):
+        resource = factories.Resource()
+        increment_existing_resources_downloads(
+            {resource['id']: 2, 'unknown_resource_id': 1}
+        )
+        assert get_downloads(resource['id']) == 2
+        assert get_downloads('unknown_resource_id') is None
+
+    def test_get_recent_downloads(self):
+        resource = factories.Resource()
+        today = datetime.date.today()
+        session.add(DownloadDaily(resource_id=resource['id'], date=today, download=1))
+        session.add(
+            DownloadDaily(
+                resource_id=resource['id'],
+                date=today - datetime.timedelta(days=10),
+                download=2,
+            )
+        )
+        session.add(
+            DownloadMonthly(
+                resource_id=resource['id'],
+                month=(today - datetime.timedelta(days=400)).replace(day=1),
+                download=4,
+            )
+        )
+        session.commit()
+
+        assert get_resource_recent_downloads(resource['id'], 1) == 1
+        assert get_resource_recent_downloads(resource['id']) == 3
+        assert get_resource_recent_downloads(resource['id'], 500) == 7
+        assert get_package_recent_downloads(resource['package_id'], 1) == 1
+        assert get_package_recent_downloads(resource['package_id']) == 3
+        assert get_package_recent_downloads(resource['package_id'], 500) == 7
+
+    def test_get_recent_downloads_with_compacted_first_month(self):
+        resource = factories.Resource()
+        since = datetime.date.today() - datetime.timedelta(days=99)
+        session.add(
+            DownloadMonthly(
+                resource_id=resource['id'], month=since.replace(day=1), download=4
+            )
+        )
+        session.commit()
+
+        assert get_resource_recent_downloads(resource['id'], 100) == 4
+        assert get_package_recent_downloads(resource['package_id'], 100) == 4
+
+    def test_rollup_daily_downloads(self):
+        resource = factories.Resource()
+        for day, count in [(1, 1), (15, 2), (31, 3)]:
+            session.add(
+                DownloadDaily(
+                    resource_id=resource['id'],
+                    date=datetime.date(2023, 1, day),
+                    download=count,
+                )
+            )
+        session.add(
+            DownloadDaily(
+                resource_id=resource['id'], date=datetime.date(2023, 2, 1), download=4
+            )
+        )
+        session.commit()
+
+        assert rollup_daily_downloads(datetime.date(2023, 2, 10)) == 3
+
+        daily = session.query(DownloadDaily).all()
+        assert [(row.date, row.download) for row in daily] == [
+            (datetime.date(2023, 2, 1), 4)
+        ]
+        monthly = session.query(DownloadMonthly).all()
+        assert [(row.month, row.download) for row in monthly] == [
+            (datetime.date(2023, 1, 1), 6)
+        ]
@@ -176,12 +176,7 @@ class TestComments:
             == another_utilization_id
         )
 
-    @pytest.mark.freeze_time(datetime(2000, 1, 2, 3, 4))
-    @patch('ckanext.feedback.services.management.comments.get_utilization_comments')
-    @patch('ckanext.feedback.services.management.comments.session.bulk_update_mappings')
-    def test_refresh_utilizations_comments(
-        self, mock_mappings, mock_get_utilization_comments
-    ):
+    def test_refresh_utilizations_comments(self):
         dataset = factories.Dataset()
         resource = factories.Resource(package_id=dataset['id'])
 
@@ -194,130 +189,98 @@ class TestComments:
         register_utilization(
             another_utilization_id, resource['id'], title, description, True
         )
-
+        for approval in [True, True, False]:
+            register_utilization_comment(
+                str(uuid.uuid4()),
+                utilization_id,
+                UtilizationCommentCategory.QUESTION,
+                'test content',
+                datetime.now(),
+                approval,
+                None,
+                None,
+            )
         session.commit()
+        session.query(Utilization).update({'comment': 5, 'updated': None})
 
-        mock_get_utilization_comments.return_value = 0
         comments.refresh_utilizations_comments(
-            [
-                get_registered_utilization(resource['id'])[0],
-                get_registered_utilization(resource['id'])[1],
-            ]
-        )
-
-        expected_args = (
-            Utilization,
-            [
-                {
-                    'id': utilization_id,
-                    'comment': 0,
-                    'updated': datetime.now(),
-                },
-                {
-                    'id': another_utilization_id,
-                    'comment': 0,
-                    'updated': datetime.now(),
-                },
-            ],
+            session.query(Utilization).order_by(Utilization.id).all()
         )
-
-        assert mock_get_utilization_comments.call_count == 2
-        assert mock_mappings.call_args[0] == expected_args
-
-    def test_get_resource_comment_summaries(self):
-        dataset = factories.Dataset()
-        resource = factories.Resource(package_id=dataset['id'])
-        another_resource = factories.Resource(package_id=dataset['id'])
-
-        category = ResourceCommentCategory.QUESTION
-
-        comment.create_resource_comment(resource['id'], category, 'test content 1', 1)
-        comment.create_resource_comment(
-            another_resource['id'], category, 'test content 2', 5
-        )
-        summary.create_resource_summary(resource['id'])
-        summary.create_resource_summary(another_resource['id'])
-
-        resource_comment = comment.get_resource_comments(resource['id'], None)
-        another_resource_comment = comment.get_resource_comments(
-            another_resource['id'], None
-        )
-
-        comment.approve_resource_comment(resource_comment[0].id, None)
-        comment.approve_resource_comment(another_resource_comment[0].id, None)
-
-        summary.refresh_resource_summary(resource['id'])
-        summary.refresh_resource_summary(another_resource['id'])
-
         session.commit()
+        session.expire_all()
 
-        comment_id_list = [resource_comment[0].id, another_resource_comment[0].id]
-
-        resource_comment_summaries = comments.get_resource_comment_summaries(
-            comment_id_list
-        )
-
-        assert len(resource_comment_summaries) == 2
-        assert resource_comment_summaries[0].comment == 1
-        assert resource_comment_summaries[1].comment == 1
+        assert session.query(Utilization).get(utilization_id).comment == 2
+        assert session.query(Utilization).get(another_utilization_id).comment == 0
+        assert session.query(Utilization).get(utilization_id).updated is not None
 
-    @pytest.mark.freeze_time(datetime(2000, 1, 2, 3, 4))
-    @patch('ckanext.feedback.services.management.comments.session.bulk_update_mappings')
-    def test_refresh_resource_comments(self, mock_mappings):
-        dataset = factories.Dataset()
-        resource = factories.Resource(package_id=dataset['id'])
-        another_resource = factories.Resource(package_id=dataset['id'])
+        # No statement is issued without utilizations
+        comments.refresh_utilizations_comments([])
 
+    def test_resource_comments_update_summaries(self):
+        resource = factories.Resource()
+        another_resource = factories.Resource()
         category = ResourceCommentCategory.QUESTION
-
-        comment.create_resource_comment(resource['id'], category, 'test content 1', 1)
-        comment.create_resource_comment(
-            another_resource['id'], category, 'test content 2', 5
-        )
+        comment.create_resource_comment(resource['id'], category, 'content', 4)
+        comment.create_resource_comment(resource['id'], None, None, 2)
+        comment.create_resource_comment(resource['id'], category, 'content', None)
+        comment.create_resource_comment(another_resource['id'], category, 'content', 3)
         summary.create_resource_summary(resource['id'])
-        summary.create_resource_summary(another_resource['id'])
-
-        resource_comment = comment.get_resource_comments(resource['id'], None)
-        another_resource_comment = comment.get_resource_comments(
-            another_resource['id'], None
-        )
-
-        comment.approve_resource_comment(resource_comment[0].id, None)
-        comment.approve_resource_comment(another_resource_comment[0].id, None)
-
-        summary.refresh_resource_summary(resource['id'])
-        summary.refresh_resource_summary(another_resource['id'])
+        session.commit()
+        comment_id_list = [c.id for c in session.query(ResourceComment).all()]
 
+        comments.approve_resource_comments(comment_id_list, None)
+        # The comments already approved are not counted again
+        assert comments.approve_resource_comments(comment_id_list, None) == []
         session.commit()
+        session.expire_all()
 
         resource_comment_summary = get_resource_comment_summary(resource['id'])
+        assert resource_comment_summary.comment == 2
+        assert resource_comment_summary.rating_sum == 6
+        assert resource_comment_summary.rating_count == 2
+        assert resource_comment_summary.rating == 3
+        assert summary.get_package_comments(resource['package_id']) == 2
+        assert summary.get_package_rating(resource['package_id']) == 3
+
+        # The missing summary is created
         another_resource_comment_summary = get_resource_comment_summary(
             another_resource['id']
         )
+        assert another_resource_comment_summary.comment == 1
+        assert another_resource_comment_summary.rating == 3
+        assert summary.get_package_comments(another_resource['package_id']) == 1
 
-        resource_comment_summaries = [
-            resource_comment_summary,
-            another_resource_comment_summary,
+        deleted_id_list = [
+            c.id
+            for c in session.query(ResourceComment).filter(ResourceComment.rating == 4)
         ]
+        comments.delete_resource_comments(deleted_id_list)
+        # The comments already deleted are not subtracted again
+        assert comments.delete_resource_comments(deleted_id_list) == []
+        session.commit()
+        session.expire_all()
 
-        comments.refresh_resources_comments(resource_comment_summaries)
-
-        expected_mapping = [
-            {
-                'id': resource_comment_summary.id,
-                'comment': 1,
-                'rating': 1,
-                'updated': datetime.now(),
-            },
-            {
-                'id': another_resource_comment_summary.id,
-                'comment': 1,
-                'rating': 5,
-                'updated': datetime.now(),
-            },
-        ]
+        resource_comment_summary = get_resource_comment_summary(resource['id'])
+        assert resource_comment_summary.comment == 1
+        assert resource_comment_summary.rating_sum == 2
+        assert resource_comment_summary.rating_count == 1
+        assert resource_comment_summary.rating == 2
+        assert summary.get_package_comments(resource['package_id']) == 1
+        assert summary.get_package_rating(resource['package_id']) == 2
+
+        # The comments waiting for approval are not subtracted
+        comment.create_resource_comment(resource['id'], category, 'content', 5)
+        session.commit()
+        waiting_id = (
+            session.query(ResourceComment.id)
+            .filter(ResourceComment.rating == 5)
+            .scalar()
+        )
+        comments.delete_resource_comments([waiting_id])
+        session.commit()
+        session.expire_all()
 
-        assert mock_mappings.call_args[0] == (ResourceCommentSummary, expected_mapping)
+        assert get_resource_comment_summary(resource['id']).comment == 1
 
     @pytest.mark.freeze_time(datetime(2000, 1, 2, 3, 4))
     @patch('ckanext.feedback.services.management.comments.session.bulk_update_mappings')
@@ -388,10 +351,10 @@ class TestComments:
         assert len(utilization_comment) == 0
 
     @pytest.mark.freeze_time(datetime(2000, 1, 2, 3, 4))
-    @patch('ckanext.feedback.services.management.comments.session.bulk_update_mappings')
-    def test_approve_resource_comments(self, mock_mappings):
+    def test_approve_resource_comments(self):
         dataset = factories.Dataset()
         resource = factories.Resource(package_id=dataset['id'])
+        user = factories.User()
 
         category = ResourceCommentCategory.QUESTION
 
@@ -402,21 +365,17 @@ class TestComments:
 
         comment_id_list = [resource_comment[0].id]
 
-        comments.approve_resource_comments(comment_id_list, None)
-
-        expected_args = (
-            ResourceComment,
-            [
-                {
-                    'id': resource_comment[0].id,
-                    'approval': True,
-                    'approved': datetime.now(),
-                    'approval_user_id': None,
-                }
-            ],
-        )
+        approved = comments.approve_resource_comments(comment_id_list, user['id'])
+        session.commit()
+        session.expire_all()
 
-        assert mock_mappings.call_args[0] == expected_args
+        assert [(row.resource_id, row.rating) for row in approved] == [
+            (resource['id'], 1)
+        ]
+        resource_comment = session.query(ResourceComment).get(comment_id_list[0])
+        assert resource_comment.approval is True
+        assert resource_comment.approved == datetime.now()
+        assert resource_comment.approval_user_id == user['id']
 
     @pytest.mark.freeze_time(datetime(2000, 1, 2, 3, 4))
     def test_delete_resource_comments(self):
@@ -437,3 +396,265 @@ class TestComments:
 
         resource_comment = comment.get_resource_comments(resource['id'], None)
         assert len(resource_comment) == 0
+
+    def test_decode_cursor(self):
+        resource_comment = ResourceComment(
+            id='comment_id', created=datetime(2000, 1, 2)
+        )
+        cursor = comments.encode_cursor(resource_comment)
+
+        assert comments.decode_cursor(cursor) == (datetime(2000, 1, 2), 'comment_id')
+        assert comments.decode_cursor(None) is None
+        assert comments.decode_cursor('invalid') is None
+        assert comments.decode_cursor('invalid,comment_id') is None
+
+    def test_get_utilization_comments_page(self):
+        dataset = factories.Dataset()
+        resource = factories.Resource(package_id=dataset['id'])
+        another_resource = factories.Resource(package_id=dataset['id'])
+        utilization_id = str(uuid.uuid4())
+        another_utilization_id = str(uuid.uuid4())
+        register_utilization(utilization_id, resource['id'], 'title', 'desc', True)
+        register_utilization(
+            another_utilization_id, another_resource['id'], 'title', 'desc', True
+        )
+        for day, approval in [(1, True), (2, False), (3, True)]:
+            register_utilization_comment(
+                f'comment{day}',
+                utilization_id,
+                UtilizationCommentCategory.QUESTION,
+                'test content',
+                datetime(2000, 1, day),
+                approval,
+                None,
+                None,
+            )
+        register_utilization_comment(
+            'comment4',
+            another_utilization_id,
+            UtilizationCommentCategory.REQUEST,
+            'test content',
+            datetime(2000, 1, 4),
+            True,
+            None,
+            None,
+        )
+        session.commit()
+
+        page = comments.get_utilization_comments_page(2)
+        assert [c.id for c in page.comments] == ['comment4', 'comment3']
+        assert page.prev_cursor is None
+
+        after = comments.decode_cursor(page.next_cursor)
+        page = comments.get_utilization_comments_page(2, after=after)
+        assert [c.id for c in page.comments] == ['comment2', 'comment1']
+        assert page.next_cursor is None
+
+        before = comments.decode_cursor(page.prev_cursor)
+        page = comments.get_utilization_comments_page(2, before=before)
+        assert [c.id for c in page.comments] == ['comment4', 'comment3']
+        assert page.prev_cursor is None
+        assert page.next_cursor is not None
+
+        page = comments.get_utilization_comments_page(
+            10,
+            approval=True,
+            categories=[UtilizationCommentCategory.QUESTION],
+            resource_id=resource['id'],
+            created_to=datetime(2000, 1, 2).date(),
+        )
+        assert [c.id for c in page.comments] == ['comment1']
+        assert comments.count_utilization_comments(resource_id=resource['id']) == 3
+        assert (
+            comments.count_utilization_comments(created_from=datetime(2000, 1, 3)) == 2
+        )
+
+    def test_get_resource_comments_page(self):
+        dataset = factories.Dataset()
+        resource = factories.Resource(package_id=dataset['id'])
+        another_resource = factories.Resource(package_id=dataset['id'])
+        for day, resource_id in [
+            (1, resource['id']),
+            (2, resource['id']),
+            (3, another_resource['id']),
+        ]:
+            session.add(
+                ResourceComment(
+                    id=f'comment{day}',
+                    resource_id=resource_id,
+                    category=ResourceCommentCategory.QUESTION,
+                    content='test content',
+                    created=datetime(2000, 1, day),
+                    approval=day == 1,
+                )
+            )
+        session.commit()
+
+        page = comments.get_resource_comments_page(10, resource_id=resource['id'])
+        assert [c.id for c in page.comments] == ['comment2', 'comment1']
+        assert page.next_cursor is None
+        assert page.prev_cursor is None
+
+        page = comments.get_resource_comments_page(10, approval=False)
+        assert [c.id for c in page.comments] == ['comment3', 'comment2']
+        assert comments.count_resource_comments(approval=False) == 2
+        assert (
+            comments.count_resource_comments(
+                categories=[ResourceCommentCategory.REQUEST]
+            )
+            == 0
+        )
+
+    def test_get_resource_comments_page_with_rating_only_comment(self):
+        resource = factories.Resource()
+        for day, category in [(1, ResourceCommentCategory.QUESTION), (2, None)]:
+            session.add(
+                ResourceComment(
+                    id=f'comment{day}',
+                    resource_id=resource['id'],
+                    category=category,
+                    content='test content' if category else None,
+                    rating=4,
+                    created=datetime(2000, 1, day),
+                    approval=False,
+                )
+            )
+        session.commit()
+
+        page = comments.get_resource_comments_page(
+            10, categories=[ResourceCommentCategory.REQUEST]
+        )
+        assert [c.id for c in page.comments] == ['comment2']
+        assert (
+            comments.count_resource_comments(categories=list(ResourceCommentCategory))
+            == 2
+        )
+
+    def test_approve_matching_utilization_comments(self):
+        dataset = factories.Dataset()
+        resource = factories.Resource(package_id=dataset['id'])
+        another_resource = factories.Resource()
+        user = factories.User()
+        utilization_id = str(uuid.uuid4())
+        another_utilization_id = str(uuid.uuid4())
+        register_utilization(utilization_id, resource['id'], 'title', 'desc', True)
+        register_utilization(
+            another_utilization_id, another_resource['id'], 'title', 'desc', True
+        )
+        for index, utilization_id_of_comment in enumerate(
+            [utilization_id, utilization_id, utilization_id, another_utilization_id]
+        ):
+            register_utilization_comment(
+                f'comment{index}',
+                utilization_id_of_comment,
+                UtilizationCommentCategory.QUESTION,
+                'content',
+                datetime(2000, 1, index + 1),
+                False,
+                None,
+                None,
+            )
+        session.commit()
+
+        results = list(
+            comments.approve_matching_utilization_comments(
+                user['id'], 2, package_id=dataset['id']
+            )
+        )
+        session.commit()
+
+        assert [result.comments for result in results] == [2, 1]
+        assert results[0].summary_ids == {utilization_id}
+        approved = {
+            row.id: row.approval_user_id
+            for row in session.query(UtilizationComment).filter(
+                UtilizationComment.approval.is_(True)
+            )
+        }
+        assert approved == {
+            'comment0': user['id'],
+            'comment1': user['id'],
+            'comment2': user['id'],
+        }
+        assert session.query(Utilization).get(utilization_id).comment == 3
+        assert session.query(Utilization).get(another_utilization_id).comment == 0
+
+        # Nothing is approved when only the approved comments are selected
+        assert not list(
+            comments.approve_matching_utilization_comments(user['id'], 2, approval=True)
+        )
+
+    def test_delete_matching_resource_comments(self):
+        resource = factories.Resource()
+        another_resource = factories.Resource()
+        category = ResourceCommentCategory.QUESTION
+        comment.create_resource_comment(resource['id'], category, 'content', 4)
+        comment.create_resource_comment(resource['id'], category, 'content', 2)
+        comment.create_resource_comment(another_resource['id'], category, 'content', 3)
+        session.commit()
+
+        results = list(
+            comments.approve_matching_resource_comments(
+                None, 10, resource_id=resource['id']
+            )
+        )
+        session.commit()
+        session.expire_all()
+
+        assert [result.comments for result in results] == [2]
+        assert results[0].summary_ids == {resource['id']}
+        resource_comment_summary = get_resource_comment_summary(resource['id'])
+        assert resource_comment_summary.comment == 2
+        assert resource_comment_summary.rating == 3
+
+        results = list(
+            comments.delete_matching_resource_comments(
+                1, categories=[category], resource_id=resource['id']
+            )
+        )
+        session.commit()
+        session.expire_all()
+
+        assert [result.comments for result in results] == [1, 1]
+        assert comments.count_resource_comments(resource_id=resource['id']) == 0
+        assert comments.count_resource_comments(resource_id=another_resource['id']) == 1
+        resource_comment_summary = get_resource_comment_summary(resource['id'])
+        assert resource_comment_summary.comment == 0
+        assert resource_comment_summary.rating_count == 0
+
+    def test_delete_matching_comments_without_filters(self):
+        resource = factories.Resource()
+        category = ResourceCommentCategory.QUESTION
+        comment.create_resource_comment(resource['id'], category, 'content', 4)
+        session.commit()
+
+        with pytest.raises(ValueError):
+            comments.delete_matching_resource_comments(10)
+        with pytest.raises(ValueError):
+            comments.delete_matching_resource_comments(
+                10, categories=list(ResourceCommentCategory)
+            )
+        with pytest.raises(ValueError):
+            comments.delete_matching_utilization_comments(
+                10, approval=None, package_id=None
+            )
+        assert comments.count_resource_comments() == 1
+
+        results = list(comments.delete_matching_resource_comments(10, delete_all=True))
+        session.commit()
+
+        assert [result.comments for result in results] == [1]
+        assert comments.count_resource_comments() == 0
+
+    def test_is_filtered(self):
+        assert not comments.is_filtered(ResourceCommentCategory)
+        assert not comments.is_filtered(
+            ResourceCommentCategory,
+            categories=list(ResourceCommentCategory),
+            resource_id=None,
+        )
+        assert comments.is_filtered(ResourceCommentCategory, approval=False)
+        assert comments.is_filtered(
+            ResourceCommentCategory, categories=[ResourceCommentCategory.QUESTION]
+        )
+        assert comments.is_filtered(ResourceCommentCategory, resource_id='resource_id')
@@ -0,0 +1,88 @@
+import json
+from datetime import date, datetime
+from unittest.mock import patch
+
+import pytest
+from ckan import model
+from ckan.tests import factories
+
+from ckanext.feedback.command.feedback import (
+    create_download_tables,
+    create_resource_tables,
+    create_utilization_tables,
+)
+from ckanext.feedback.models.resource_comment import (
+    ResourceComment,
+    ResourceCommentCategory,
+)
+from ckanext.feedback.models.session import session
+from ckanext.feedback.services.management import export
+
+engine = model.repo.session.get_bind()
+
+
+@pytest.mark.usefixtures('clean_db', 'with_plugins', 'with_request_context')
+class TestExport:
+    @classmethod
+    def setup_class(cls):
+        model.repo.init_db()
+        create_utilization_tables(engine)
+        create_resource_tables(engine)
+        create_download_tables(engine)
+
+    def setup_method(self, method):
+        self.resource = factories.Resource()
+        for day in [1, 2, 3]:
+            session.add(
+                ResourceComment(
+                    id=f'comment{day}',
+                    resource_id=self.resource['id'],
+                    category=ResourceCommentCategory.REQUEST,
+                    content=f'content {day}',
+                    rating=day,
+                    created=datetime(2000, 1, day, 12),
+                    approval=day != 2,
+                )
+            )
+        session.commit()
+
+    def test_get_export_rows(self):
+        rows = export.get_export_rows('resource_comment')
+        assert [row.id for row in rows] == ['comment1', 'comment2', 'comment3']
+
+        rows = export.get_export_rows(
+            'resource_comment',
+            created_from=date(2000, 1, 2),
+            created_to=date(2000, 1, 3),
+            approval=True,
+        )
+        assert [row.id for row in rows] == ['comment3']
+
+        # Tables without the approval state ignore the filter
+        assert list(export.get_export_rows('issue_resolution', approval=True)) == []
+
+    def test_export_rows_as_csv(self):
+        chunks = export.export_rows('resource_comment', 'csv', approval=False)
+        lines = ''.join(chunks).splitlines()
+
+        assert lines[0] == ','.join(export.get_export_columns('resource_comment'))
+        assert len(lines) == 2
+        assert lines[1].startswith(f'comment2,{self.resource["id"]},REQUEST,')
+        assert '2000-01-02T12:00:00' in lines[1]
+
+    def test_export_rows_as_ndjson(self):
+        chunks = export.export_rows('resource_comment', 'ndjson')
+        rows = [json.loads(line) for line in ''.join(chunks).splitlines()]
+
+        assert [row['id'] for row in rows] == ['comment1', 'comment2', 'comment3']
+        assert rows[0]['category'] == 'REQUEST'
+        assert rows[0]['rating'] == 1
+        assert rows[0]['approval'] is True
+
+    @patch('ckanext.feedback.services.management.export.CHUNK_SIZE', 1)
+    def test_export_rows_in_chunks(self):
+        chunks = list(export.export_rows('resource_comment', 'ndjson'))
+
+        # One chunk per row and the empty rest
+        assert len(chunks) == 4
+        assert chunks[-1] == ''
@@ -0,0 +1,191 @@
+import io
+import json
+from datetime import date
+
+import pytest
+from ckan import model
+from ckan.tests import factories
+from sqlalchemy import func
+
+from ckanext.feedback.command.feedback import (
+    create_download_tables,
+    create_resource_tables,
+    create_utilization_tables,
+)
+from ckanext.feedback.models.download import (
+    DownloadDaily,
+    DownloadMonthly,
+    DownloadSummary,
+)
+from ckanext.feedback.models.package import PackageFeedbackSummary
+from ckanext.feedback.models.resource_comment import (
+    ResourceComment,
+    ResourceCommentCategory,
+    ResourceCommentSummary,
+)
+from ckanext.feedback.models.session import session
+from ckanext.feedback.services.management import importer
+
+engine = model.repo.session.get_bind()
+
+
+def read(text, import_format='csv'):
+    return importer.read_records(io.StringIO(text), import_format)
+
+
+@pytest.mark.usefixtures('clean_db', 'with_plugins', 'with_request_context')
+class TestImporter:
+    @classmethod
+    def setup_class(cls):
+        model.repo.init_db()
+        create_utilization_tables(engine)
+        create_resource_tables(engine)
+        create_download_tables(engine)
+
+    def test_read_records(self):
+        assert list(read('resource_id,rating\nresource,\n')) == [
+            (2, {'resource_id': 'resource', 'rating': None})
+        ]
+        assert list(read('{"resource_id": "resource"}\n\n', 'ndjson')) == [
+            (1, {'resource_id': 'resource'})
+        ]
+        with pytest.raises(ValueError):
+            list(read('{"resource_id"\n', 'ndjson'))
+
+    def test_get_row(self):
+        row = importer.get_row(
+            'resource_comment', 2, {'id': 'comment', 'resource_id': 'resource'}
+        )
+        columns = importer.import_tables['resource_comment'].columns
+
+        values = dict(zip(columns, row))
+        assert values['id'] == 'comment'
+        assert values['resource_id'] == 'resource'
+        assert values['created']
+        assert values['approval'] is False
+
+        with pytest.raises(ValueError):
+            importer.get_row('resource_comment', 2, {'resource': 'resource'})
+
+    def test_get_row_without_required_columns(self):
+        with pytest.raises(ValueError, match='Line 2: id must be set'):
+            importer.get_row('resource_comment', 2, {'resource_id': 'resource'})
+        with pytest.raises(ValueError, match='Line 3: date must be set'):
+            importer.get_row('download', 3, {'resource_id': 'resource', 'download': 1})
+
+    def test_import_resource_comments(self):
+        resource = factories.Resource()
+        session.add(
+            ResourceComment(id='existing', resource_id=resource['id'], content='test')
+        )
+        session.commit()
+        records = read(
+            'id,resource_id,category,content,rating,approval\n'
+            f'existing,{resource["id"]},REQUEST,"a, b",3,True\n'
+            f'new,{resource["id"]},QUESTION,"a ""quoted"" text",5,True\n'
+            f'rating,{resource["id"]},,,1,False\n'
+            'unknown,unknown_resource,REQUEST,test,1,True\n'
+        )
+
+        result = importer.import_records(
+            'resource_comment', records, batch_size=2, skip_invalid=True
+        )
+        session.commit()
+
+        assert result == importer.ImportResult(read=4, skipped=1, imported=2)
+        comment = session.query(ResourceComment).get('new')
+        assert comment.category == ResourceCommentCategory.QUESTION
+        assert comment.content == 'a "quoted" text'
+        assert session.query(ResourceComment).count() == 3
+
+        summary = session.query(ResourceCommentSummary).one()
+        assert summary.comment == 1
+        assert summary.rating == 5
+        package_summary = session.query(PackageFeedbackSummary).get(
+            resource['package_id']
+        )
+        assert package_summary.comment == 1
+
+    def test_import_unknown_resource(self):
+        records = read('resource_id,content\nunknown_resource,test\n')
+
+        with pytest.raises(ValueError, match='Line 2'):
+            importer.import_records('resource_comment', records)
+        session.rollback()
+
+        assert session.query(ResourceComment).count() == 0
+
+    def test_import_resource_comments_again(self):
+        resource = factories.Resource()
+        text = f'id,resource_id,rating,approval\ncomment,{resource["id"]},4,True\n'
+
+        importer.import_records('resource_comment', read(text))
+        session.commit()
+        result = importer.import_records('resource_comment', read(text))
+        session.commit()
+
+        assert result == importer.ImportResult(read=1, skipped=0, imported=0)
+        assert session.query(ResourceComment).count() == 1
+        assert session.query(ResourceCommentSummary).one().rating == 4
+
+    def test_import_downloads(self):
+        resource = factories.Resource()
+        session.add(
+            DownloadSummary(id='summary', resource_id=resource['id'], download=10)
+        )
+        session.add(
+            DownloadDaily(resource_id=resource['id'], date=date(2020, 1, 1), download=1)
+        )
+        session.commit()
+        text = '\n'.join(
+            json.dumps(record)
+            for record in [
+                {'resource_id': resource['id'], 'date': '2020-01-01', 'download': 3},
+                {'resource_id': resource['id'], 'date': '2020-01-01', 'download': 2},
+                {'resource_id': resource['id'], 'date': '2020-01-02', 'download': 4},
+            ]
+        )
+
+        result = importer.import_records('download', read(text, 'ndjson'))
+        session.commit()
+
+        # The daily count of 2020-01-01 is replaced, 4 downloads are added to it
+        assert result == importer.ImportResult(read=3, skipped=0, imported=3)
+        assert session.query(DownloadSummary).one().download == 18
+        assert (
+            session.query(DownloadDaily)
+            .get((resource['id'], date(2020, 1, 1)))
+            .download
+            == 5
+        )
+        package_summary = session.query(PackageFeedbackSummary).get(
+            resource['package_id']
+        )
+        assert package_summary.download == 18
+
+        # Importing the same counts again changes nothing
+        importer.import_records('download', read(text, 'ndjson'))
+        session.commit()
+
+        assert session.query(DownloadSummary).one().download == 18
+        assert session.query(func.sum(DownloadDaily.download)).scalar() == 9
+        package_summary = session.query(PackageFeedbackSummary).get(
+            resource['package_id']
+        )
+        assert package_summary.download == 18
+
+    def test_import_compacted_downloads(self):
+        resource = factories.Resource()
+        session.add(
+            DownloadMonthly(
+                resource_id=resource['id'], month=date(2020, 1, 1), download=10
+            )
+        )
+        session.commit()
+        records = read(f'resource_id,date,download\n{resource["id"]},2020-01-15,1\n')
+
+        with pytest.raises(ValueError, match='2020-01'):
+            importer.import_records('download', records)
+        session.rollback()
+
+        assert session.query(DownloadDaily).count() == 0
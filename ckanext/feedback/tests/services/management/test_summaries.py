@@ -0,0 +1,136 @@
+import json
+
+import pytest
+from ckan import model
+from ckan.tests import factories
+
+from ckanext.feedback.command.feedback import (
+    create_download_tables,
+    create_resource_tables,
+    create_utilization_tables,
+)
+from ckanext.feedback.models.resource_comment import (
+    ResourceComment,
+    ResourceCommentSummary,
+)
+from ckanext.feedback.models.session import session
+from ckanext.feedback.models.utilization import Utilization, UtilizationSummary
+from ckanext.feedback.services.common.summary import Drift
+from ckanext.feedback.services.management import summaries
+
+engine = model.repo.session.get_bind()
+
+
+@pytest.mark.usefixtures('clean_db', 'with_plugins', 'with_request_context')
+class TestSummaries:
+    @classmethod
+    def setup_class(cls):
+        model.repo.init_db()
+        create_utilization_tables(engine)
+        create_resource_tables(engine)
+        create_download_tables(engine)
+
+    def setup_method(self, method):
+        self.resource = factories.Resource()
+        session.add(
+            ResourceComment(resource_id=self.resource['id'], rating=4, approval=True)
+        )
+        # Summaries that drifted from the comments and utilizations
+        session.add(
+            ResourceCommentSummary(
+                resource_id=self.resource['id'],
+                comment=0,
+                rating=2,
+                rating_sum=2,
+                rating_count=1,
+            )
+        )
+        session.add(Utilization(id='utilization', resource_id=self.resource['id']))
+        session.add(UtilizationSummary(resource_id=self.resource['id'], utilization=1))
+        session.commit()
+
+    def test_get_partitions(self):
+        resource_ids = sorted(
+            [self.resource['id']] + [factories.Resource()['id'] for _ in range(2)]
+        )
+
+        partitions = summaries.get_partitions(2)
+
+        assert partitions == [
+            [resource_ids[0], resource_ids[2]],
+            [resource_ids[2], None],
+        ]
+        assert summaries.get_partition_resource_ids(*partitions[0]) == resource_ids[:2]
+        assert summaries.get_partition_resource_ids(*partitions[1]) == resource_ids[2:]
+
+    def test_process_partition(self):
+        partition = [self.resource['id'], None]
+        resource_id = self.resource['id']
+        expected = [
+            Drift('resource_comment_summary', resource_id, 'rating_sum', 2, 4),
+            Drift('resource_comment_summary', resource_id, 'rating', 2, 4),
+            Drift('utilization_summary', resource_id, 'utilization', 1, 0),
+        ]
+
+        modules = ['resource', 'utilization']
+        drifts = summaries.process_partition(partition, ['resource'], False)
+        assert drifts == expected[:2]
+        assert summaries.process_partition(partition, modules, True) == expected
+        assert summaries.process_partition(partition, modules, False) == []
+
+        summary = session.query(ResourceCommentSummary).one()
+        assert summary.rating_sum == 4
+        assert summary.rating == 4
+        assert session.query(UtilizationSummary).one().utilization == 0
+
+    def test_check_summaries_with_checkpoint(self, tmp_path):
+        other_resource = factories.Resource()
+        checkpoint_path = str(tmp_path / 'checkpoint.json')
+        partitions = sorted([[self.resource['id']], [other_resource['id']]])
+        partitions[0].append(partitions[1][0])
+        partitions[1].append(None)
+        # The run was interrupted after the partition of the drifted resource
+        done = [
+            index
+            for index, partition in enumerate(partitions)
+            if partition[0] == self.resource['id']
+        ]
+        with open(checkpoint_path, 'w') as f:
+            json.dump(
+                {
+                    'command': 'rebuild',
+                    'modules': ['resource'],
+                    'partitions': partitions,
+                    'done': done,
+                },
+                f,
+            )
+
+        drifts = list(
+            summaries.check_summaries(
+                ['resource'], True, checkpoint_path=checkpoint_path
+            )
+        )
+
+        assert drifts == [[]]
+        assert session.query(ResourceCommentSummary).one().rating_sum == 2
+        assert not (tmp_path / 'checkpoint.json').exists()
+
+    def test_check_summaries_with_other_checkpoint(self, tmp_path):
+        checkpoint_path = str(tmp_path / 'checkpoint.json')
+        summaries.save_checkpoint(
+            checkpoint_path,
+            {
+                'command': 'verify',
+                'modules': ['resource'],
+                'partitions': [],
+                'done': [],
+            },
+        )
+
+        with pytest.raises(ValueError):
+            list(
+                summaries.check_summaries(
+                    ['resource'], True, checkpoint_path=checkpoint_path
+                )
+            )
@@ -2,6 +2,8 @@ import pytest
 from ckan import model
 from ckan.model.user import User
 from ckan.tests import factories
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 
 from ckanext.feedback.command.feedback import (
     create_download_tables,
@@ -51,6 +53,36 @@ class TestComments:
         assert not get_resource_comments('test')
         assert not get_resource_comments(resource['id'], True)
 
+    def test_get_resource_comments_eager_loads_relationships(self):
+        resource = factories.Resource()
+        user = factories.User()
+        category = get_resource_comment_categories().REQUEST
+        for _ in range(3):
+            create_resource_comment(resource['id'], category, 'test', 1)
+        session.commit()
+        for comment in session.query(ResourceComment).all():
+            approve_resource_comment(comment.id, user['id'])
+            create_reply(comment.id, 'reply', user['id'])
+        session.commit()
+
+        statements = []
+
+        def count_statement(*args):
+            statements.append(args)
+
+        event.listen(Engine, 'before_cursor_execute', count_statement)
+        try:
+            comments = get_resource_comments(resource['id'])
+            replies = [comment.reply.content for comment in comments]
+            approval_users = [comment.approval_user.id for comment in comments]
+        finally:
+            event.remove(Engine, 'before_cursor_execute', count_statement)
+
+        assert replies == ['reply'] * 3
+        assert approval_users == [user['id']] * 3
+        # The comments, their replies and their approval users
+        assert len(statements) == 3
+
     def test_create_resource_comment(self):
         pass
 
@@ -67,10 +99,14 @@ class TestComments:
 
         assert not get_resource_comments(resource['id'])[0].approval
 
-        approve_resource_comment(comment_id, user_id)
+        assert approve_resource_comment(comment_id, user_id).id == comment_id
         session.commit()
         assert get_resource_comments(resource['id'])[0].approval
 
+        # An approved comment is not approved again
+        assert approve_resource_comment(comment_id, user_id) is None
+        assert approve_resource_comment('unknown_id', user_id) is None
+
     def test_get_comment_reply(self):
         pass
 
@@ -14,17 +14,23 @@ from ckanext.feedback.models.resource_comment import (
     ResourceCommentSummary,
 )
 from ckanext.feedback.models.session import session
+from ckanext.feedback.services.common.summary import Drift
 from ckanext.feedback.services.resource.comment import (
     approve_resource_comment,
     create_resource_comment,
     get_resource_comment_categories,
 )
 from ckanext.feedback.services.resource.summary import (
+    add_comment_to_resource_summary,
     create_resource_summary,
     get_package_comments,
     get_package_rating,
+    get_packages_comments_and_rating,
     get_resource_comments,
     get_resource_rating,
+    get_resource_summary_drifts,
+    rebuild_resource_summaries,
+    refresh_package_comments,
     refresh_resource_summary,
 )
 
@@ -51,6 +57,7 @@ class TestResourceServices:
             updated='2023-03-31 01:23:45.123456',
         )
         session.add(resource_comment_summary)
+        refresh_package_comments([resource['id']])
         session.commit()
         assert get_package_comments(resource['package_id']) == 1
 
@@ -77,13 +84,36 @@ class TestResourceServices:
             resource_id=resource['id'],
             comment=1,
             rating=1,
+            rating_sum=1,
+            rating_count=1,
             created='2023-03-31 01:23:45.123456',
             updated='2023-03-31 01:23:45.123456',
         )
         session.add(resource_comment_summary)
+        refresh_package_comments([resource['id']])
         session.commit()
         assert get_package_rating(resource['package_id']) == 1
 
+    def test_get_packages_comments_and_rating(self):
+        resource = factories.Resource()
+        assert get_packages_comments_and_rating([resource['package_id']]) == {}
+        resource_comment_summary = ResourceCommentSummary(
+            id=str('test_id'),
+            resource_id=resource['id'],
+            comment=2,
+            rating=4,
+            rating_sum=8,
+            rating_count=2,
+            created='2023-03-31 01:23:45.123456',
+            updated='2023-03-31 01:23:45.123456',
+        )
+        session.add(resource_comment_summary)
+        refresh_package_comments([resource['id']])
+        session.commit()
+        assert get_packages_comments_and_rating([resource['package_id']]) == {
+            resource['package_id']: {'comments': 2, 'rating': 4}
+        }
+
     def test_get_resource_rating(self):
         resource = factories.Resource()
         assert get_resource_rating(resource['id']) == 0
@@ -141,4 +171,114 @@ class TestResourceServices:
         summary = session.query(ResourceCommentSummary).first()
         assert summary.comment == 2
         assert summary.rating == 4.0
+        assert summary.rating_sum == 8
+        assert summary.rating_count == 2
+        assert summary.updated
+
+    def test_add_comment_to_resource_summary(self):
+        resource = factories.Resource()
+        create_resource_summary(resource['id'])
+        category = get_resource_comment_categories().REQUEST
+        create_resource_comment(resource['id'], category, 'test', 3)
+        create_resource_comment(resource['id'], None, None, 4)
+        session.commit()
+
+        for comment in session.query(ResourceComment).all():
+            add_comment_to_resource_summary(approve_resource_comment(comment.id, None))
+        session.commit()
+        session.expire_all()
+
+        summary = session.query(ResourceCommentSummary).first()
+        assert summary.comment == 1
+        assert summary.rating_sum == 7
+        assert summary.rating_count == 2
+        assert summary.rating == 3.5
         assert summary.updated
+        assert get_package_comments(resource['package_id']) == 1
+        assert get_package_rating(resource['package_id']) == 3.5
+
+    def test_apply_resource_summary_delta_without_summary(self):
+        resource = factories.Resource()
+        category = get_resource_comment_categories().REQUEST
+        create_resource_comment(resource['id'], category, 'test', 3)
+        session.commit()
+        comment_id = session.query(ResourceComment).first().id
+
+        add_comment_to_resource_summary(approve_resource_comment(comment_id, None))
+        session.commit()
+
+        # The summary is created with a full recalculation
+        summary = session.query(ResourceCommentSummary).first()
+        assert summary.comment == 1
+        assert summary.rating_sum == 3
+        assert summary.rating_count == 1
+
+    def test_rebuild_resource_summaries(self):
+        resource = factories.Resource()
+        other_resource = factories.Resource()
+        for resource_id, rating, approval in [
+            (resource['id'], 2, True),
+            (resource['id'], 5, True),
+            (resource['id'], 1, False),
+            (other_resource['id'], 4, True),
+        ]:
+            session.add(
+                ResourceComment(
+                    resource_id=resource_id,
+                    content='test',
+                    rating=rating,
+                    approval=approval,
+                )
+            )
+        # A drifted summary is corrected and a missing one is created
+        session.add(
+            ResourceCommentSummary(
+                resource_id=resource['id'], comment=9, rating_sum=9, rating_count=9
+            )
+        )
+        session.commit()
+
+        rebuild_resource_summaries([resource['id']])
+        session.commit()
+        session.expire_all()
+
+        summary = (
+            session.query(ResourceCommentSummary)
+            .filter(ResourceCommentSummary.resource_id == resource['id'])
+            .one()
+        )
+        assert summary.comment == 2
+        assert summary.rating_sum == 7
+        assert summary.rating_count == 2
+        assert summary.rating == 3.5
+        assert get_package_comments(resource['package_id']) == 2
+        assert get_resource_comments(other_resource['id']) == 0
+
+        rebuild_resource_summaries()
+        session.commit()
+
+        assert get_resource_comments(other_resource['id']) == 1
+        assert get_package_rating(other_resource['package_id']) == 4
+
+    def test_get_resource_summary_drifts(self):
+        resource = factories.Resource()
+        session.add(ResourceComment(resource_id=resource['id'], content='test'))
+        session.add(
+            ResourceComment(
+                resource_id=resource['id'], content='test', rating=3, approval=True
+            )
+        )
+        session.add(
+            ResourceCommentSummary(
+                resource_id=resource['id'],
+                comment=2,
+                rating=3,
+                rating_sum=3,
+                rating_count=1,
+            )
+        )
+        session.commit()
+
+        assert get_resource_summary_drifts([resource['id']]) == [
+            Drift('resource_comment_summary', resource['id'], 'comment', 2, 1)
+        ]
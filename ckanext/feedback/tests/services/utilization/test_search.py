@@ -1,5 +1,6 @@
 import uuid
 from datetime import datetime
+from unittest.mock import patch
 
 import ckan.tests.factories as factories
 import pytest
@@ -12,7 +13,13 @@ from ckanext.feedback.command.feedback import (
 )
 from ckanext.feedback.models.session import session
 from ckanext.feedback.models.utilization import Utilization
-from ckanext.feedback.services.utilization.search import get_utilizations
+from ckanext.feedback.services.utilization import search
+from ckanext.feedback.services.utilization.search import (
+    clear_utilizations_count_cache,
+    escape_like,
+    get_utilizations,
+    get_utilizations_count,
+)
 
 
 def register_utilization(id, resource_id, title, description, approval, created):
@@ -107,3 +114,115 @@ class TestUtilizationDetailsService:
 
         # with approval
         assert get_utilizations(approval=True) == [approved_utilization]
+
+    @patch('ckanext.feedback.services.utilization.search.is_trgm_available')
+    def test_get_utilizations_with_keyword(self, mock_is_trgm_available):
+        mock_is_trgm_available.return_value = False
+        dataset = factories.Dataset(name='population-dataset')
+        resource = factories.Resource(package_id=dataset['id'], name='CSV resource')
+        title_id = str(uuid.uuid4())
+        description_id = str(uuid.uuid4())
+        register_utilization(
+            title_id,
+            resource['id'],
+            'Traffic map',
+            'description',
+            True,
+            datetime(2000, 1, 2),
+        )
+        register_utilization(
+            description_id,
+            resource['id'],
+            'title',
+            'Uses 100% of the traffic data',
+            True,
+            datetime(2000, 1, 3),
+        )
+        session.commit()
+
+        def get_ids(**kwargs):
+            return [utilization.id for utilization in get_utilizations(**kwargs)]
+
+        assert get_ids(keyword='TRAFFIC') == [description_id, title_id]
+        assert get_ids(keyword='100%') == [description_id]
+        assert get_ids(keyword='csv') == [description_id, title_id]
+        assert get_ids(keyword='population') == [description_id, title_id]
+        assert get_ids(keyword='0%_') == []
+
+    def test_get_utilizations_ranked_by_similarity(self):
+        if not search.is_trgm_available():
+            pytest.skip('pg_trgm is not installed')
+        resource = factories.Resource()
+        similar_id = str(uuid.uuid4())
+        other_id = str(uuid.uuid4())
+        register_utilization(
+            similar_id, resource['id'], 'traffic', '', True, datetime(2000, 1, 2)
+        )
+        register_utilization(
+            other_id,
+            resource['id'],
+            'analysis of the regional traffic accidents',
+            '',
+            True,
+            datetime(2000, 1, 3),
+        )
+        session.commit()
+
+        utilizations = get_utilizations(keyword='traffic')
+
+        assert [utilization.id for utilization in utilizations] == [
+            similar_id,
+            other_id,
+        ]
+
+    def test_get_utilizations_with_limit_and_offset(self):
+        resource = factories.Resource()
+        ids = [str(uuid.uuid4()) for _ in range(3)]
+        for day, id in enumerate(ids, 1):
+            register_utilization(
+                id, resource['id'], 'title', '', True, datetime(2000, 1, day)
+            )
+        session.commit()
+
+        utilizations = get_utilizations(limit=2)
+        assert [utilization.id for utilization in utilizations] == [ids[2], ids[1]]
+
+        utilizations = get_utilizations(limit=2, offset=2)
+        assert [utilization.id for utilization in utilizations] == [ids[0]]
+
+    def test_get_utilizations_count(self):
+        clear_utilizations_count_cache()
+        resource = factories.Resource()
+        register_utilization(
+            str(uuid.uuid4()), resource['id'], 'title', '', True, datetime.now()
+        )
+        session.commit()
+
+        assert get_utilizations_count(resource['id'], None, True) == 1
+        assert get_utilizations_count(resource['id'], None, False) == 0
+
+        register_utilization(
+            str(uuid.uuid4()), resource['id'], 'title', '', True, datetime.now()
+        )
+        session.commit()
+
+        # The count is served from the cache until it is cleared
+        assert get_utilizations_count(resource['id'], None, True) == 1
+        clear_utilizations_count_cache()
+        assert get_utilizations_count(resource['id'], None, True) == 2
+
+    @patch('ckanext.feedback.services.utilization.search.config')
+    def test_get_utilizations_count_without_cache(self, mock_config):
+        mock_config.get.return_value = '0'
+        clear_utilizations_count_cache()
+        resource = factories.Resource()
+
+        assert get_utilizations_count(resource['id']) == 0
+        register_utilization(
+            str(uuid.uuid4()), resource['id'], 'title', '', True, datetime.now()
+        )
+        session.commit()
+        assert get_utilizations_count(resource['id']) == 1
+
+    def test_escape_like(self):
+        assert escape_like('100%_\\') == '100\\%\\_\\\\'
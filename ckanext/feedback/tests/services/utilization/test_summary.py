@@ -10,16 +10,27 @@ from ckanext.feedback.command.feedback import (
     create_resource_tables,
     create_utilization_tables,
 )
-from ckanext.feedback.models.issue import IssueResolutionSummary
+from ckanext.feedback.models.issue import IssueResolution, IssueResolutionSummary
 from ckanext.feedback.models.session import session
-from ckanext.feedback.models.utilization import Utilization, UtilizationSummary
+from ckanext.feedback.models.utilization import (
+    Utilization,
+    UtilizationComment,
+    UtilizationCommentCategory,
+    UtilizationSummary,
+)
+from ckanext.feedback.services.common.summary import Drift
 from ckanext.feedback.services.utilization.summary import (
     create_utilization_summary,
     get_package_issue_resolutions,
     get_package_utilizations,
+    get_packages_issue_resolutions,
+    get_packages_utilizations,
     get_resource_issue_resolutions,
     get_resource_utilizations,
+    get_utilization_summary_drifts,
     increment_issue_resolution_summary,
+    rebuild_utilization_summaries,
+    refresh_package_utilizations,
     refresh_utilization_summary,
 )
 
@@ -81,9 +92,29 @@ class TestUtilizationDetailsService:
         id = str(uuid.uuid4())
         title = 'test title'
         description = 'test description'
-        register_utilization(id, resource['id'], title, description, False)
+        register_utilization(id, resource['id'], title, description, True)
+        refresh_utilization_summary(resource['id'])
+
+        assert get_package_utilizations(dataset['id']) == 1
 
-        get_package_utilizations(dataset['id']) == 1
+    def test_get_packages_utilizations(self):
+        dataset = factories.Dataset()
+        resource = factories.Resource(package_id=dataset['id'])
+        other_dataset = factories.Dataset()
+
+        assert get_packages_utilizations([dataset['id'], other_dataset['id']]) == {}
+
+        summary = UtilizationSummary(
+            id=str(uuid.uuid4()),
+            resource_id=resource['id'],
+            utilization=2,
+        )
+        session.add(summary)
+        refresh_package_utilizations([resource['id']])
+
+        assert get_packages_utilizations([dataset['id'], other_dataset['id']]) == {
+            dataset['id']: 2
+        }
 
     def test_get_resource_utilizations(self):
         dataset = factories.Dataset()
@@ -157,9 +188,28 @@ class TestUtilizationDetailsService:
         assert get_package_issue_resolutions(dataset['id']) == 0
 
         resister_issue_resolution_summary(str(uuid.uuid4()), utilization_id, time, time)
+        refresh_package_utilizations([resource['id']])
 
         assert get_package_issue_resolutions(dataset['id']) == 1
 
+    def test_get_packages_issue_resolutions(self):
+        dataset = factories.Dataset()
+        resource = factories.Resource(package_id=dataset['id'])
+
+        utilization_id = str(uuid.uuid4())
+        title = 'test title'
+        description = 'test description'
+        time = datetime.now()
+
+        register_utilization(utilization_id, resource['id'], title, description, True)
+
+        assert get_packages_issue_resolutions([dataset['id']]) == {}
+
+        resister_issue_resolution_summary(str(uuid.uuid4()), utilization_id, time, time)
+        refresh_package_utilizations([resource['id']])
+
+        assert get_packages_issue_resolutions([dataset['id']]) == {dataset['id']: 1}
+
     def test_get_resource_issue_resolutions(self):
         dataset = factories.Dataset()
         resource = factories.Resource(package_id=dataset['id'])
@@ -194,3 +244,70 @@ class TestUtilizationDetailsService:
         increment_issue_resolution_summary(id)
 
         assert get_issue_resolution_summary(id).issue_resolution == 2
+        assert get_package_issue_resolutions(dataset['id']) == 2
+
+    def test_rebuild_utilization_summaries(self):
+        dataset = factories.Dataset()
+        resource = factories.Resource(package_id=dataset['id'])
+        other_resource = factories.Resource(package_id=dataset['id'])
+
+        register_utilization('utilization1', resource['id'], 'title', 'test', True)
+        register_utilization('utilization2', resource['id'], 'title', 'test', False)
+        register_utilization(
+            'utilization3', other_resource['id'], 'title', 'test', True
+        )
+        session.flush()
+        for approval in [True, True, False]:
+            session.add(
+                UtilizationComment(
+                    utilization_id='utilization1',
+                    category=UtilizationCommentCategory.REQUEST,
+                    content='test',
+                    approval=approval,
+                )
+            )
+        session.add(IssueResolution(utilization_id='utilization1', description='test'))
+        session.add(IssueResolution(utilization_id='utilization3', description='test'))
+        session.commit()
+
+        rebuild_utilization_summaries([resource['id']])
+        session.commit()
+        session.expire_all()
+
+        assert get_utilization_summary(resource['id'])[0].utilization == 1
+        assert session.query(Utilization).get('utilization1').comment == 2
+        assert get_issue_resolution_summary('utilization1').issue_resolution == 1
+        assert get_issue_resolution_summary('utilization3') is None
+        assert get_package_utilizations(dataset['id']) == 1
+        assert get_package_issue_resolutions(dataset['id']) == 1
+
+        rebuild_utilization_summaries()
+        session.commit()
+
+        assert get_utilization_summary(other_resource['id'])[0].utilization == 1
+        assert get_issue_resolution_summary('utilization3').issue_resolution == 1
+        assert get_package_utilizations(dataset['id']) == 2
+        assert get_package_issue_resolutions(dataset['id']) == 2
+
+    def test_get_utilization_summary_drifts(self):
+        resource = factories.Resource()
+        register_utilization('utilization', resource['id'], 'title', 'test', True)
+        session.flush()
+        session.add(
+            UtilizationComment(
+                utilization_id='utilization',
+                category=UtilizationCommentCategory.REQUEST,
+                content='test',
+                approval=True,
+            )
+        )
+        session.add(IssueResolution(utilization_id='utilization', description='test'))
+        resister_issue_resolution_summary(
+            'summary', 'utilization', datetime.now(), datetime.now()
+        )
+        session.commit()
+
+        assert get_utilization_summary_drifts([resource['id']]) == [
+            Drift('utilization_summary', resource['id'], 'utilization', 0, 1),
+            Drift('utilization', 'utilization', 'comment', 0, 1),
+        ]
@@ -1,7 +1,8 @@
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
 
 import pytest
 from ckan import model
+from flask import Blueprint, Flask
 
 from ckanext.feedback.command import feedback
 from ckanext.feedback.command.feedback import (
@@ -26,6 +27,81 @@ class TestPlugin:
         result = FeedbackPlugin.get_commands(self)
         assert result == [feedback.feedback]
 
+    @patch('ckanext.feedback.plugin.download_dedup_service')
+    @patch('ckanext.feedback.plugin.download_queue_service')
+    @patch('ckanext.feedback.plugin.cache')
+    def test_configure(
+        self, mock_cache, mock_download_queue_service, mock_download_dedup_service
+    ):
+        FeedbackPlugin().configure({})
+        mock_cache.validate_config.assert_called_once_with()
+        mock_download_queue_service.validate_config.assert_called_once_with()
+        mock_download_dedup_service.validate_config.assert_called_once_with()
+
+    def test_make_middleware(self):
+        instance = FeedbackPlugin()
+        app = Flask(__name__)
+
+        assert instance.make_middleware(app, {}) is app
+        assert app.teardown_appcontext_funcs == [instance.remove_session]
+        assert app.after_request_funcs[None] == [instance.make_stats_conditional]
+
+        app = MagicMock()
+        assert instance.make_middleware(app, {}) is app
+        app.teardown_appcontext.assert_not_called()
+
+    @patch('ckanext.feedback.plugin.instrumentation')
+    def test_make_middleware_with_instrumentation(self, mock_instrumentation):
+        instance = FeedbackPlugin()
+        app = Flask(__name__)
+
+        mock_instrumentation.is_enabled.return_value = False
+        instance.make_middleware(app, {})
+        mock_instrumentation.enable.assert_not_called()
+
+        mock_instrumentation.is_enabled.return_value = True
+        instance.make_middleware(app, {})
+        mock_instrumentation.enable.assert_called_once_with(app)
+
+    def test_make_stats_conditional(self):
+        instance = FeedbackPlugin()
+        app = Flask(__name__)
+        api = Blueprint('api', __name__)
+        api.add_url_rule(
+            '/api/action/<logic_function>',
+            'action',
+            lambda logic_function: {'result': logic_function},
+        )
+        app.register_blueprint(api)
+        instance.make_middleware(app, {})
+        client = app.test_client()
+
+        response = client.get('/api/action/feedback_stats_list')
+        etag = response.headers['ETag']
+        assert response.status_code == 200
+
+        response = client.get(
+            '/api/action/feedback_stats_list', headers={'If-None-Match': etag}
+        )
+        assert response.status_code == 304
+        assert response.data == b''
+
+        response = client.get('/api/action/package_show')
+        assert 'ETag' not in response.headers
+
+    def test_get_actions(self):
+        actions = FeedbackPlugin().get_actions()
+        assert list(actions) == ['feedback_stats_show', 'feedback_stats_list']
+
+    def test_get_auth_functions(self):
+        auth_functions = FeedbackPlugin().get_auth_functions()
+        assert list(auth_functions) == ['feedback_stats_show', 'feedback_stats_list']
+
+    @patch('ckanext.feedback.plugin.session')
+    def test_remove_session(self, mock_session):
+        FeedbackPlugin().remove_session()
+        mock_session.remove.assert_called_once_with()
+
     @patch('ckanext.feedback.plugin.toolkit')
     @patch('ckanext.feedback.plugin.download')
     @patch('ckanext.feedback.plugin.resource')
@@ -64,3 +140,15 @@ class TestPlugin:
 
     def test_is_disabled_repeated_post_on_resource(self):
         assert FeedbackPlugin.is_disabled_repeated_post_on_resource(self) is False
+
+    @patch('ckanext.feedback.plugin.download_summary_service')
+    def test_get_helpers(self, mock_download_summary_service):
+        mock_download_summary_service.get_resource_downloads.return_value = 1
+        helpers = FeedbackPlugin().get_helpers()
+
+        assert helpers['get_resource_downloads']('resource_id') == 1
+        assert helpers['get_resource_downloads']('resource_id') == 1
+        mock_download_summary_service.get_resource_downloads.assert_called_once_with(
+            'resource_id'
+        )
+        assert helpers['get_feedback_memo_stats']() == {'hits': 1, 'misses': 1}
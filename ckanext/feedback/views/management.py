@@ -37,6 +37,42 @@ rules = [
         management.ManagementController.delete_bulk_resource_comments,
         {'methods': ['POST']},
     ),
+    (
+        '/approve_matching_utilization_comments',
+        'approve_matching_utilization_comments',
+        management.ManagementController.approve_matching_utilization_comments,
+        {'methods': ['POST']},
+    ),
+    (
+        '/approve_matching_resource_comments',
+        'approve_matching_resource_comments',
+        management.ManagementController.approve_matching_resource_comments,
+        {'methods': ['POST']},
+    ),
+    (
+        '/delete_matching_utilization_comments',
+        'delete_matching_utilization_comments',
+        management.ManagementController.delete_matching_utilization_comments,
+        {'methods': ['POST']},
+    ),
+    (
+        '/delete_matching_resource_comments',
+        'delete_matching_resource_comments',
+        management.ManagementController.delete_matching_resource_comments,
+        {'methods': ['POST']},
+    ),
+    (
+        '/export/<table>',
+        'export',
+        management.ManagementController.export,
+        {'methods': ['GET']},
+    ),
+    (
+        '/metrics',
+        'metrics',
+        management.ManagementController.metrics,
+        {'methods': ['GET']},
+    ),
 ]
 for rule, endpoint, view_func, *others in rules:
     options = next(iter(others), {})